@@ -0,0 +1,140 @@
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+# Бенчмарк выгрузки витрины через rest_api.py: строк в секунду и пик RSS для каждого формата ответа.
+# Синтетическая витрина city_tourism_rating (--rows строк) пишется во временную папку (MARTS_DIR), каждый формат
+# меряется в отдельном процессе, чтобы пик RSS (ru_maxrss) не смешивался между форматами. Приложение вызывается
+# напрямую как ASGI без сети; тело ответа читается порциями и не накапливается.
+# json - постранично по 1000 строк через X-Next-Cursor (больше JSON не отдаёт), остальные форматы - одним потоком.
+
+formats = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'arrow': 'application/vnd.apache.arrow.stream'
+}
+
+def make_mart(rows, seed=42):
+    rng = np.random.default_rng(seed)
+    cities = np.array(['Москва', 'Санкт-Петербург', 'Казань', 'Новосибирск', 'Сочи'], dtype=object)
+    activities = np.array(['пляжный отдых', 'экскурсии', 'домашний отдых'], dtype=object)
+    snapshots = pd.date_range('2024-01-01', periods=max(1, rows // len(cities)), freq='h').strftime('%Y-%m-%d %H:%M')
+    return pd.DataFrame({
+        'city_name': np.resize(cities, rows),
+        'avg_comfort_index': np.round(rng.normal(0, 5, rows), 2),
+        'recommended_activity': activities[rng.integers(0, len(activities), rows)],
+        'tourist_season_match': np.where(rng.random(rows) < 0.3, 'да', 'нет'),
+        'tourism_season': 'Май-Сентябрь',
+        'tour_recommendation': activities[rng.integers(0, len(activities), rows)],
+        'as_of_date': np.repeat(np.asarray(snapshots, dtype=object), len(cities))[:rows]
+    })
+
+# Пик RSS процесса в МБ (ru_maxrss: КБ на Linux, байты на macOS)
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+# Один запрос к ASGI приложению: (статус, заголовки, байт в теле)
+async def request(app, path, query, accept):
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode('utf-8'), 'query_string': query.encode('utf-8'), 'root_path': '',
+        'headers': [(b'accept', accept.encode('ascii')), (b'host', b'benchmark')],
+        'client': ('127.0.0.1', 0), 'server': ('benchmark', 80)
+    }
+    result = {'status': None, 'headers': {}, 'bytes': 0}
+    request_sent = asyncio.Event()
+    response_done = asyncio.Event()
+
+    # Тело запроса пустое; дальше receive ждёт конца ответа и сообщает об отключении клиента
+    async def receive():
+        if not request_sent.is_set():
+            request_sent.set()
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await response_done.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            result['status'] = message['status']
+            result['headers'] = {key.decode('latin-1'): value.decode('latin-1') for key, value in message['headers']}
+        elif message['type'] == 'http.response.body':
+            result['bytes'] += len(message.get('body', b''))
+            if not message.get('more_body', False):
+                response_done.set()
+
+    await app(scope, receive, send)
+    return result
+
+async def export(app, mart_name, response_format):
+    path = f"/marts/{mart_name}"
+    if response_format != 'json':
+        result = await request(app, path, '', formats[response_format])
+        return result['bytes'], int(result['headers']['x-total-count'])
+    total_bytes = 0
+    cursor = None
+    while True:
+        result = await request(app, path, 'limit=1000' + (f'&cursor={cursor}' if cursor else ''), formats['json'])
+        total_bytes += result['bytes']
+        cursor = result['headers'].get('x-next-cursor')
+        if not cursor:
+            return total_bytes, int(result['headers']['x-total-count'])
+
+# Замер одного формата (в отдельном процессе)
+def run_worker(response_format, directory, repeats):
+    os.environ['MARTS_DIR'] = directory
+    os.environ['MART_CACHE_TTL'] = '3600'
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import rest_api
+
+    async def main():
+        # Прогрев: витрина загружается в кеш и индексируется до замера
+        await rest_api.mart_cache.get('city_tourism_rating')
+        baseline = peak_rss_mb()
+        started = time.perf_counter()
+        for _ in range(repeats):
+            total_bytes, rows = await export(rest_api.app, 'city_tourism_rating', response_format)
+        seconds = (time.perf_counter() - started) / repeats
+        return {
+            'format': response_format, 'rows': rows, 'bytes': total_bytes, 'seconds': round(seconds, 4),
+            'rows_per_second': round(rows / seconds), 'peak_rss_mb': round(peak_rss_mb(), 1),
+            'peak_rss_growth_mb': round(peak_rss_mb() - baseline, 1)
+        }
+
+    print(json.dumps(asyncio.run(main())))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк форматов выгрузки витрин rest_api")
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--formats', nargs='+', choices=list(formats), default=list(formats))
+    parser.add_argument('--worker', choices=list(formats), help=argparse.SUPPRESS)
+    parser.add_argument('--dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.dir, args.repeats)
+        sys.exit(0)
+
+    with tempfile.TemporaryDirectory() as directory:
+        make_mart(args.rows).to_csv(os.path.join(directory, 'city_tourism_rating.csv'), index=False)
+        print(f"=== {args.rows} строк, {args.repeats} повтора ===")
+        for response_format in args.formats:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--worker', response_format, '--dir', directory,
+                 '--repeats', str(args.repeats)],
+                check=True, capture_output=True, text=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{result['format']:>7}: {result['seconds']:7.3f} с, {result['rows_per_second']:>10} строк/с, "
+                  f"{result['bytes'] / 1024 / 1024:7.1f} МБ, пик RSS {result['peak_rss_mb']:7.1f} МБ "
+                  f"(+{result['peak_rss_growth_mb']:.1f} МБ за выгрузку)")
@@ -0,0 +1,78 @@
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
+from collections import Counter
+import argparse
+import asyncio
+import hashlib
+import os
+
+# Локальная замена GitHub API для проверки rest_api.py без сети и лимитов GitHub.
+# Отдаёт файлы из локального checkout (MOCK_GITHUB_ROOT, по умолчанию - папка репозитория):
+# - GET /repos/{owner}/{repo}/contents/{path}?ref= - метаданные файла с download_url и ETag (sha блоба, как у git);
+#   запрос с совпадающим If-None-Match получает 304 без тела;
+# - GET /raw/{owner}/{repo}/{ref}/{path} - содержимое файла;
+# - GET /_stats - сколько запросов какого вида пришло (для проверки кеша и single-flight), DELETE /_stats - сброс.
+# MOCK_GITHUB_LATENCY - искусственная задержка ответа в секундах.
+# Запуск: python mock_github_api.py --port 8001, затем
+#   MART_SOURCE=github GITHUB_API_URL=http://127.0.0.1:8001 uvicorn rest_api:app
+# или без сервера: GitHubMartSource(..., api_url="http://mock", transport=httpx.ASGITransport(app=mock_github_api.app))
+
+MOCK_GITHUB_ROOT = os.getenv("MOCK_GITHUB_ROOT", os.path.dirname(os.path.abspath(__file__)))
+MOCK_GITHUB_LATENCY = float(os.getenv("MOCK_GITHUB_LATENCY", "0"))
+
+app = FastAPI(title="Mock GitHub API")
+request_counts = Counter()
+
+def _read_file(path: str) -> bytes:
+    full_path = os.path.realpath(os.path.join(MOCK_GITHUB_ROOT, path))
+    if not full_path.startswith(os.path.realpath(MOCK_GITHUB_ROOT) + os.sep) or not os.path.isfile(full_path):
+        raise HTTPException(status_code=404, detail="Not Found")
+    with open(full_path, 'rb') as f:
+        return f.read()
+
+def _blob_sha(content: bytes) -> str:
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+@app.get("/repos/{owner}/{repo}/contents/{path:path}")
+async def get_contents(owner: str, repo: str, path: str, request: Request, ref: str = "main"):
+    """Метаданные файла (как contents API GitHub) с ETag."""
+    await asyncio.sleep(MOCK_GITHUB_LATENCY)
+    content = _read_file(path)
+    sha = _blob_sha(content)
+    etag = f'"{sha}"'
+    if request.headers.get("if-none-match") == etag:
+        request_counts["not_modified"] += 1
+        return Response(status_code=304, headers={"ETag": etag})
+    request_counts["contents"] += 1
+    download_url = f"{str(request.base_url).rstrip('/')}/raw/{owner}/{repo}/{ref}/{path}"
+    return JSONResponse(
+        {"name": os.path.basename(path), "path": path, "sha": sha, "size": len(content), "download_url": download_url},
+        headers={"ETag": etag}
+    )
+
+@app.get("/raw/{owner}/{repo}/{ref}/{path:path}")
+async def get_raw(owner: str, repo: str, ref: str, path: str):
+    """Содержимое файла (как raw.githubusercontent.com)."""
+    await asyncio.sleep(MOCK_GITHUB_LATENCY)
+    content = _read_file(path)
+    request_counts["raw"] += 1
+    return Response(content=content, media_type="text/plain; charset=utf-8")
+
+@app.get("/_stats")
+async def get_stats():
+    """Счётчики запросов по видам."""
+    return dict(request_counts)
+
+@app.delete("/_stats")
+async def reset_stats():
+    request_counts.clear()
+    return {}
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Локальная замена GitHub API для rest_api.py")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port)
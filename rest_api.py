@@ -1,52 +1,415 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from contextlib import asynccontextmanager
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+import numpy as np
 import pandas as pd
-import requests
+import asyncio
+import base64
+import hashlib
+import httpx
+import time
+import io
+import json
 import os
 
-app = FastAPI(title="GitHub Data Marts API")
+try:
+    import orjson
+except ImportError:  # без orjson JSON сериализуется стандартным модулем
+    orjson = None
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow нужен только для формата Arrow IPC
+    pa = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Общий HTTP-клиент источника закрывается при остановке приложения
+    await mart_cache.source.close()
+
+app = FastAPI(title="GitHub Data Marts API", lifespan=lifespan)
 
 # Настройки GitHub
 GITHUB_OWNER = "julia-JT"  # Ваш GitHub username/organization
 GITHUB_REPO = "Weather_tourism_pipeline"    # Имя репо
 GITHUB_BRANCH = "main"             # Ветка
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")  # Токен для приватных репо (или None для публичных)
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")  # Для проверки - адрес mock_github_api.py
+GITHUB_TIMEOUT = float(os.getenv("GITHUB_TIMEOUT", "30"))
+GITHUB_MAX_CONNECTIONS = int(os.getenv("GITHUB_MAX_CONNECTIONS", "20"))
 
 # Предопределенные витрины (список имен без .csv)
 marts = 'data/aggregated'  # Базовая папка для витрин (можно использовать для путей)
 mart_name_list = ['city_tourism_rating', 'federal_districts_summary', 'travel_recommendations']
 
-def get_csv_from_github(file_path: str) -> pd.DataFrame:
-    """Скачивает и парсит CSV из GitHub."""
-    url = f"https://api.github.com/repos/{GITHUB_OWNER}/{GITHUB_REPO}/contents/{file_path}?ref={GITHUB_BRANCH}"
-    headers = {"Authorization": f"token {GITHUB_TOKEN}"} if GITHUB_TOKEN else {}
-    
-    response = requests.get(url, headers=headers)
-    if response.status_code != 200:
-        raise HTTPException(status_code=404, detail="Файл не найден или нет доступа")
-    
-    # Получить raw URL и скачать
-    raw_url = response.json()["download_url"]
-    raw_response = requests.get(raw_url, headers=headers)
-    raw_response.raise_for_status()
-    
-    # Парсить CSV
-    df = pd.read_csv(pd.io.common.StringIO(raw_response.text))
-    return df
+# Источник витрин: local - папка data/aggregated (или смонтированный checkout, MARTS_DIR), github - GitHub API
+MART_SOURCE = os.getenv("MART_SOURCE", "local")
+MARTS_DIR = os.getenv("MARTS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), marts))
+# Кеш разобранных витрин: предел памяти (LRU) и сколько секунд запись отдаётся без проверки mtime/ETag
+MART_CACHE_MAX_BYTES = int(os.getenv("MART_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+MART_CACHE_TTL = float(os.getenv("MART_CACHE_TTL", "5"))
+# Колонки, по которым строятся индексы значений для фильтров
+index_columns = ['city_name', 'federal_district']
+# Ответ JSON собирается в памяти (limit не больше 1000); NDJSON, CSV и Arrow IPC отдаются потоком порциями по STREAM_CHUNK_ROWS строк
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", "5000"))
+media_types = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "arrow": "application/vnd.apache.arrow.stream"
+}
+
+class LocalMartSource:
+    """Витрины из локальной папки; версия файла - (mtime_ns, размер)."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    async def fetch(self, mart_name: str, validator=None) -> Tuple[Optional[pd.DataFrame], object]:
+        """(DataFrame, версия) или (None, версия), если файл не изменился с версии validator."""
+        path = os.path.join(self.directory, f"{mart_name}.csv")
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Файл не найден или нет доступа")
+        version = (stat.st_mtime_ns, stat.st_size)
+        if version == validator:
+            return None, validator
+        # Разбор CSV - в потоке, чтобы не блокировать цикл событий
+        return await asyncio.to_thread(pd.read_csv, path, encoding='utf-8'), version
+
+    async def close(self):
+        pass
+
+class GitHubMartSource:
+    """Витрины из репозитория через GitHub API; версия файла - ETag ответа contents API.
+
+    Один асинхронный клиент httpx на процесс (пул соединений); повторная проверка - условный GET
+    с If-None-Match, на который GitHub отвечает 304 без тела. transport - для подмены API в проверках.
+    """
+
+    def __init__(self, owner: str, repo: str, branch: str, token: Optional[str] = None,
+                 api_url: str = GITHUB_API_URL, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.owner = owner
+        self.repo = repo
+        self.branch = branch
+        self.api_url = api_url.rstrip("/")
+        self.headers = {"Authorization": f"token {token}"} if token else {}
+        self.transport = transport
+        self.client = None
+
+    def _client(self) -> httpx.AsyncClient:
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                headers=self.headers, timeout=GITHUB_TIMEOUT, transport=self.transport,
+                limits=httpx.Limits(max_connections=GITHUB_MAX_CONNECTIONS, max_keepalive_connections=GITHUB_MAX_CONNECTIONS)
+            )
+        return self.client
+
+    async def fetch(self, mart_name: str, validator=None) -> Tuple[Optional[pd.DataFrame], object]:
+        """(DataFrame, ETag) или (None, ETag), если GitHub ответил 304 Not Modified."""
+        client = self._client()
+        url = f"{self.api_url}/repos/{self.owner}/{self.repo}/contents/{marts}/{mart_name}.csv"
+        headers = {"If-None-Match": validator} if validator else {}
+        response = await client.get(url, params={"ref": self.branch}, headers=headers)
+        if response.status_code == 304:
+            return None, validator
+        if response.status_code != 200:
+            raise HTTPException(status_code=404, detail="Файл не найден или нет доступа")
+
+        # Получить raw URL и скачать
+        raw_response = await client.get(response.json()["download_url"])
+        raw_response.raise_for_status()
+        df = await asyncio.to_thread(pd.read_csv, io.BytesIO(raw_response.content))
+        return df, response.headers.get("ETag")
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+class MartTable:
+    """Витрина и её индексы, построенные один раз при загрузке.
+
+    Индексы: значение колонки фильтра -> позиции строк (index_columns) и позиции строк, упорядоченные
+    по as_of_date (диапазон дат - два бинарных поиска), плюс строки последнего снимка.
+    """
+
+    def __init__(self, df: pd.DataFrame, version=None):
+        self.df = df
+        # Короткий отпечаток версии источника (mtime и размер или ETag) - для привязки cursor к версии витрины
+        self.version = hashlib.sha1(json.dumps(version).encode("utf-8")).hexdigest()[:16]
+        self.size = int(df.memory_usage(deep=True).sum())
+        self.value_index = {column: df.groupby(column, sort=False).indices for column in index_columns if column in df.columns}
+        self.has_dates = 'as_of_date' in df.columns
+        if self.has_dates:
+            dates = pd.to_datetime(df['as_of_date'], errors='coerce').to_numpy()
+            valid = np.flatnonzero(~np.isnat(dates))
+            self.date_order = valid[np.argsort(dates[valid], kind='stable')]
+            self.sorted_dates = dates[self.date_order]
+            self.latest = np.sort(self.date_order[self.sorted_dates == self.sorted_dates[-1]]) if len(valid) else valid
+        self.schema = None
+
+    def arrow_schema(self, columns: List[str]):
+        """Схема Arrow выбранных колонок; типы выводятся один раз по всей витрине."""
+        if self.schema is None:
+            self.schema = pa.Schema.from_pandas(self.df, preserve_index=False)
+        return pa.schema([self.schema.field(column) for column in columns])
+
+    def select(self, filters: dict, as_of_from: Optional[str] = None, as_of_to: Optional[str] = None,
+               latest: bool = False) -> Optional[np.ndarray]:
+        """Позиции строк (по возрастанию), подходящих под все фильтры; None - без фильтров (все строки)."""
+        selections = []
+        for column, values in filters.items():
+            if not values:
+                continue
+            if column not in self.value_index:
+                raise HTTPException(status_code=400, detail=f"Витрина не поддерживает фильтр {column}")
+            index = self.value_index[column]
+            parts = [index[value] for value in values if value in index]
+            selections.append(np.unique(np.concatenate(parts)) if parts else np.array([], dtype=np.int64))
+        if latest or as_of_from or as_of_to:
+            if not self.has_dates:
+                raise HTTPException(status_code=400, detail="В витрине нет колонки as_of_date")
+            if latest:
+                selections.append(self.latest)
+            if as_of_from or as_of_to:
+                start = np.searchsorted(self.sorted_dates, _parse_date(as_of_from), side='left') if as_of_from else 0
+                end = np.searchsorted(self.sorted_dates, _date_upper_bound(as_of_to), side='left') if as_of_to else len(self.sorted_dates)
+                selections.append(np.sort(self.date_order[start:end]))
+        if not selections:
+            return None
+        positions = selections[0]
+        for selection in selections[1:]:
+            positions = np.intersect1d(positions, selection, assume_unique=True)
+        return positions
+
+def _parse_date(value: str) -> np.datetime64:
+    try:
+        return np.datetime64(pd.Timestamp(value), 'ns')
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Некорректная дата: {value}")
+
+def _date_upper_bound(value: str) -> np.datetime64:
+    """Исключающая верхняя граница as_of_to: дата без времени включает весь день."""
+    bound = _parse_date(value)
+    if len(value.strip()) <= 10:
+        return bound + np.timedelta64(1, 'D')
+    return bound + np.timedelta64(1, 'ns')
+
+def encode_cursor(position: int, version: str) -> str:
+    payload = {"after": int(position), "version": version}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str, version: str) -> int:
+    """Позиция из cursor; 410, если витрина с тех пор изменилась (например, после компактации)."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        position = int(payload["after"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Некорректный cursor")
+    if payload.get("version") != version:
+        raise HTTPException(status_code=410, detail="Витрина изменилась, cursor устарел: начните выборку заново")
+    return position
+
+class MartCache:
+    """Разобранные витрины (MartTable) в памяти процесса с LRU-вытеснением по суммарному размеру DataFrame.
+
+    В пределах ttl секунд после проверки витрина отдаётся без обращения к источнику; затем источник
+    сверяет версию (mtime или ETag) и перечитывает файл, только если он изменился. Одновременные
+    промахи по одной витрине ждут одного обращения к источнику (single-flight).
+    """
+
+    def __init__(self, source, max_bytes: int = MART_CACHE_MAX_BYTES, ttl: float = MART_CACHE_TTL):
+        self.source = source
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.in_flight = {}
+
+    async def get(self, mart_name: str) -> MartTable:
+        entry = self.entries.get(mart_name)
+        if entry is not None:
+            self.entries.move_to_end(mart_name)
+            if time.monotonic() - entry["checked_at"] < self.ttl:
+                return entry["table"]
+
+        task = self.in_flight.get(mart_name)
+        if task is None:
+            task = asyncio.ensure_future(self._refresh(mart_name, entry))
+            self.in_flight[mart_name] = task
+            task.add_done_callback(lambda done: self._finish(mart_name, done))
+        # shield: отмена одного запроса клиента не прерывает общее обращение к источнику
+        return await asyncio.shield(task)
+
+    def _finish(self, mart_name: str, task: asyncio.Future):
+        if self.in_flight.get(mart_name) is task:
+            del self.in_flight[mart_name]
+        if not task.cancelled():
+            task.exception()  # ошибку получают ожидающие запросы; здесь - чтобы asyncio не ругался на неё
+
+    async def _refresh(self, mart_name: str, entry: Optional[dict]) -> MartTable:
+        df, version = await self.source.fetch(mart_name, entry["version"] if entry else None)
+        if df is None:
+            entry["checked_at"] = time.monotonic()
+            if mart_name not in self.entries:
+                self._store(mart_name, entry)
+            return entry["table"]
+        table = await asyncio.to_thread(MartTable, df, version)
+        self._store(mart_name, {"table": table, "version": version, "checked_at": time.monotonic(), "size": table.size})
+        return table
+
+    def _store(self, mart_name: str, entry: dict):
+        previous = self.entries.pop(mart_name, None)
+        if previous is not None:
+            self.total_bytes -= previous["size"]
+        self.entries[mart_name] = entry
+        self.total_bytes += entry["size"]
+        # Вытесняются давно не запрошенные витрины; последняя остаётся, даже если больше предела
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.total_bytes -= evicted["size"]
+
+    def clear(self):
+        self.entries.clear()
+        self.total_bytes = 0
+
+def create_mart_source(kind: str = MART_SOURCE):
+    """Источник витрин по имени (MART_SOURCE)."""
+    if kind == "local":
+        return LocalMartSource(MARTS_DIR)
+    if kind == "github":
+        return GitHubMartSource(GITHUB_OWNER, GITHUB_REPO, GITHUB_BRANCH, GITHUB_TOKEN)
+    raise ValueError(f"Неизвестный источник витрин: {kind}. Допустимо: local, github")
+
+mart_cache = MartCache(create_mart_source())
 
 @app.get("/marts")
-def list_marts():
+async def list_marts():
     """Список предопределенных витрин."""
     return {"marts": mart_name_list}
 
+def negotiate_format(accept: Optional[str], requested: Optional[str]) -> str:
+    """Формат ответа: параметр format или первый подходящий тип из Accept (с учётом q), по умолчанию JSON."""
+    if requested:
+        if requested not in media_types:
+            raise HTTPException(status_code=400, detail=f"Неизвестный формат: {requested}. Допустимо: {', '.join(media_types)}")
+        return requested
+    candidates = []
+    for position, item in enumerate((accept or "").split(",")):
+        media_type, _, params = item.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        candidates.append((-quality, position, media_type.strip().lower()))
+    for quality, _, media_type in sorted(candidates):
+        if quality == 0:
+            continue
+        for name, known_type in media_types.items():
+            if media_type == known_type.split(";")[0]:
+                return name
+        if media_type in ("*/*", "application/*"):
+            return "json"
+    return "json"
+
+def _dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)  # NaN сериализуется как null
+    return json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8")
+
+def _records(rows: pd.DataFrame) -> list:
+    if orjson is None:
+        rows = rows.astype(object).where(rows.notna(), None)
+    return rows.to_dict(orient="records")
+
+def stream_rows(table: MartTable, positions: np.ndarray, columns: List[str], response_format: str):
+    """Генератор тела ответа: строки positions порциями по STREAM_CHUNK_ROWS, память - на одну порцию."""
+    df = table.df
+    if response_format == "arrow":
+        # Поток Arrow IPC: схема, record batch на порцию, маркер конца потока
+        schema = table.arrow_schema(columns)
+        yield schema.serialize().to_pybytes()
+    for start in range(0, len(positions), STREAM_CHUNK_ROWS):
+        rows = df.iloc[positions[start:start + STREAM_CHUNK_ROWS]][columns]
+        if response_format == "ndjson":
+            yield b"".join(_dumps(record) + b"\n" for record in _records(rows))
+        elif response_format == "csv":
+            yield rows.to_csv(index=False, header=start == 0).encode("utf-8")
+        else:
+            yield pa.RecordBatch.from_pandas(rows, schema=schema, preserve_index=False).serialize().to_pybytes()
+    if response_format == "csv" and not len(positions):
+        yield df[columns].iloc[:0].to_csv(index=False).encode("utf-8")
+    if response_format == "arrow":
+        yield b"\xff\xff\xff\xff\x00\x00\x00\x00"
+
 @app.get("/marts/{mart_name}")
-def get_mart(mart_name: str, limit: int = Query(10, ge=1, le=1000)):
-    """Получить данные витрины (первые limit строк)."""
+async def get_mart(
+    mart_name: str,
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, description="JSON: по умолчанию 10, не больше 1000; потоковые форматы: по умолчанию все строки"),
+    city_name: Optional[List[str]] = Query(None),
+    federal_district: Optional[List[str]] = Query(None),
+    as_of_from: Optional[str] = Query(None, description="Начало диапазона as_of_date (включительно)"),
+    as_of_to: Optional[str] = Query(None, description="Конец диапазона as_of_date (включительно; дата без времени - весь день)"),
+    latest: bool = Query(False, description="Только последний снимок"),
+    columns: Optional[str] = Query(None, description="Колонки через запятую"),
+    cursor: Optional[str] = Query(None, description="Продолжение выборки из заголовка X-Next-Cursor"),
+    format: Optional[str] = Query(None, description="json, ndjson, csv или arrow (вместо заголовка Accept)")
+):
+    """Получить данные витрины: строки под фильтрами в порядке файла.
+
+    Формат выбирается по Accept или параметру format: JSON (массив записей), NDJSON, CSV, Arrow IPC stream;
+    потоковые форматы подходят для выгрузки всей истории. Если строк больше limit, заголовок X-Next-Cursor
+    содержит cursor следующей страницы, X-Total-Count - число подходящих строк. Cursor привязан к версии
+    витрины: если файл с тех пор изменился (дописан снимок, компактация), запрос с ним получает 410.
+    """
     if mart_name not in mart_name_list:
         raise HTTPException(status_code=404, detail="Витрина не найдена в списке")
-    
+    response_format = negotiate_format(request.headers.get("accept"), format)
+    if response_format == "json":
+        limit = limit or 10
+        if limit > 1000:
+            raise HTTPException(status_code=400, detail="Для JSON limit не больше 1000; для выгрузки используйте ndjson, csv или arrow")
+    elif response_format == "arrow" and pa is None:
+        raise HTTPException(status_code=406, detail="Формат Arrow недоступен: не установлен пакет pyarrow")
+
     try:
-        # Используем переменную marts для формирования пути
-        df = get_csv_from_github(f"{marts}/{mart_name}.csv")
-        return df.head(limit).to_dict(orient="records")
+        # Витрина берётся из кеша; источник (MART_SOURCE) читается, только если файл изменился
+        table = await mart_cache.get(mart_name)
+        df = table.df
+        selected_columns = [column.strip() for column in columns.split(",") if column.strip()] if columns else list(df.columns)
+        unknown = [column for column in selected_columns if column not in df.columns]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Неизвестные колонки: {', '.join(unknown)}")
+
+        # Фильтры отбираются по индексам витрины, страница - бинарным поиском позиции после cursor
+        positions = table.select({'city_name': city_name, 'federal_district': federal_district}, as_of_from, as_of_to, latest)
+        total = len(df) if positions is None else len(positions)
+        after = decode_cursor(cursor, table.version) if cursor else -1
+        if positions is None:
+            start = max(after + 1, 0)
+            page = np.arange(start, total if limit is None else min(start + limit, total))
+        else:
+            start = int(np.searchsorted(positions, after, side='right'))
+            page = positions[start:] if limit is None else positions[start:start + limit]
+        headers = {"X-Total-Count": str(total)}
+        if len(page) and page[-1] != (positions[-1] if positions is not None else total - 1):
+            headers["X-Next-Cursor"] = encode_cursor(page[-1], table.version)
+
+        if response_format != "json":
+            return StreamingResponse(stream_rows(table, page, selected_columns, response_format),
+                                     media_type=media_types[response_format], headers=headers)
+        return Response(_dumps(_records(df.iloc[page][selected_columns])), media_type=media_types["json"], headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,91 @@
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+import clean_data
+import enrich_data
+import ingest_manifest
+import columnar_storage
+
+# Пересборка истории за диапазон дат (например, после изменения правил очистки или обогащения).
+# Каждый день - независимая задача (clean, затем enrich), задачи раздаются пулу процессов
+# с ограниченным числом воркеров. Повторный запуск за тот же день перезаписывает его результаты целиком.
+
+stages_available = ['clean', 'enrich']
+default_workers = int(os.getenv('BACKFILL_WORKERS', str(os.cpu_count() or 1)))
+
+def parse_date(value):
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+def date_range(start, end):
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+# Пересборка одного дня; выполняется в отдельном процессе. Возвращает статистику по дню
+def backfill_day(dt, stages, engine):
+    date_str = dt.strftime("%Y%m%d")
+    stats = {'date': date_str, 'original': 0, 'cleaned': 0, 'enriched': 0}
+    if 'clean' in stages:
+        # Внутри пула сам пакетный движок работает в одном процессе, чтобы не плодить вложенные пулы
+        stats['original'], stats['cleaned'] = clean_data.clean_weather_data_for_date(dt, engine=engine, workers=1)
+    if 'enrich' in stages:
+        cleaned_path = columnar_storage.find_layer_files(clean_data.cleaned_dir, columnar_storage.cleaned_prefix).get(date_str)
+        if cleaned_path:
+            stats['enriched'] = enrich_data.enrich_weather_data_for_date(date_str, [cleaned_path]) or 0
+        else:
+            print(f"Нет cleaned файлов для даты {date_str}")
+    return stats
+
+def run_backfill(start, end, stages=None, workers=None, engine='python'):
+    stages = stages or stages_available
+    workers = max(1, workers or default_workers)
+    dates = date_range(start, end)
+    if not dates:
+        raise ValueError(f"Пустой диапазон дат: {start} - {end}")
+
+    total = {'days': 0, 'failed': 0, 'original': 0, 'cleaned': 0, 'enriched': 0}
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=min(workers, len(dates))) as executor:
+        futures = {executor.submit(backfill_day, dt, stages, engine): dt for dt in dates}
+        for future in as_completed(futures):
+            dt = futures[future]
+            try:
+                stats = future.result()
+            except Exception as e:
+                total['failed'] += 1
+                print(f"ERROR: Backfill за {dt.strftime('%Y-%m-%d')} завершился ошибкой: {e}")
+                continue
+            total['days'] += 1
+            for key in ('original', 'cleaned', 'enriched'):
+                total[key] += stats[key]
+            elapsed = time.perf_counter() - started
+            done = total['days'] + total['failed']
+            print(f"[{done}/{len(dates)}] {dt.strftime('%Y-%m-%d')}: исходных {stats['original']}, "
+                  f"очищенных {stats['cleaned']}, обогащённых {stats['enriched']} "
+                  f"({done / elapsed:.2f} дней/с)")
+
+    # Пересобранные дни убираем из манифеста, чтобы инкрементальная загрузка не дописывала к ним старые записи
+    if 'clean' in stages:
+        manifest = ingest_manifest.load_manifest(clean_data.manifest_path)
+        ingest_manifest.forget_dates(manifest, dates)
+        ingest_manifest.save_manifest(clean_data.manifest_path, manifest)
+
+    elapsed = time.perf_counter() - started
+    records = total['cleaned'] if 'clean' in stages else total['enriched']
+    print(f"SUCCESS: Backfill {start} - {end} ({', '.join(stages)}, {workers} процессов): "
+          f"дней {total['days']}, с ошибками {total['failed']}, за {elapsed:.2f} с "
+          f"({len(dates) / elapsed:.2f} дней/с, {records / elapsed:.0f} записей/с)")
+    return total
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пересборка cleaned/enriched слоёв за диапазон дат")
+    parser.add_argument('--start', type=parse_date, required=True, help="Первая дата диапазона (YYYY-MM-DD)")
+    parser.add_argument('--end', type=parse_date, default=None, help="Последняя дата диапазона включительно (по умолчанию = --start)")
+    parser.add_argument('--stages', nargs='+', choices=stages_available, default=stages_available,
+                        help="Какие этапы пересобирать для каждого дня")
+    parser.add_argument('--workers', type=int, default=default_workers, help="Максимум одновременно обрабатываемых дней")
+    parser.add_argument('--engine', choices=['python', 'batch'], default=os.getenv('CLEAN_ENGINE', 'python'),
+                        help="Движок очистки (см. clean_data.py)")
+    args = parser.parse_args()
+    run_backfill(args.start, args.end or args.start, args.stages, args.workers, args.engine)
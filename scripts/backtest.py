@@ -0,0 +1,274 @@
+import os
+import math
+import time
+import argparse
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+
+import feature_store
+import forecasting
+import mart_writer
+from storage_utils import atomic_write_json
+
+# Бэктест моделей прогноза (forecasting.forecast_models) с плавающей точкой отсчёта (rolling origin).
+# Для каждого города берутся origins последних точек отсчёта с шагом step дней истории: модель обучается
+# только на днях до точки и прогнозирует horizon дней после неё, прогноз сравнивается с фактом.
+# Точка отсчёта допускается, если до неё не меньше min_train дней, а после - полный горизонт.
+# Города делятся на порции и считаются параллельно в пуле процессов (как в forecasting.run_forecasts).
+# Отчёт: MAE/RMSE по модели, цели и горизонту, время обучения и прогноза, пик памяти (tracemalloc)
+# на одно обучение и прогноз. Последний отчёт - backtest_report.json, метрики каждого запуска дописываются
+# снимком в backtest_history.csv (см. mart_writer.py), чтобы следить за ними во времени.
+
+backtest_dir = os.path.join(os.path.dirname(__file__), '..', 'data', 'models', 'backtest')
+report_path = os.path.join(backtest_dir, 'backtest_report.json')
+history_path = os.path.join(backtest_dir, 'backtest_history.csv')
+
+default_origins = int(os.getenv('BACKTEST_ORIGINS', '5'))
+default_step = int(os.getenv('BACKTEST_STEP', '1'))
+default_min_train = int(os.getenv('BACKTEST_MIN_TRAIN', '14'))
+
+targets = forecasting.targets
+
+# Позиции точек отсчёта в истории длиной n: обучение на history[:cut], проверка на history[cut:cut + horizon]
+def origin_positions(n, horizon, origins, step, min_train):
+    cuts = [n - horizon - k * step for k in range(origins)]
+    return sorted(cut for cut in cuts if cut >= max(min_train, 1))
+
+def _empty_costs():
+    return {'fit_seconds': [], 'predict_seconds': [], 'fit_memory': [], 'predict_memory': []}
+
+# Бэктест порции городов всеми моделями; выполняется в отдельном процессе.
+# Возвращает (ошибки {модель: массив [abs, sq, n] x цель x горизонт}, затраты {модель: списки по обучениям},
+# ошибки моделей [(город, модель, текст)], число городов с точками отсчёта, секунды)
+def backtest_chunk(model_names, histories, horizon, origins, step, min_train, timeouts, track_memory=True):
+    started = time.perf_counter()
+    errors = {name: np.zeros((3, len(targets), horizon)) for name in model_names}
+    costs = {name: _empty_costs() for name in model_names}
+    failures = []
+    evaluated = 0
+    if track_memory:
+        tracemalloc.start()
+    try:
+        for city, history in histories:
+            cuts = origin_positions(len(history), horizon, origins, step, min_train)
+            if not cuts:
+                continue
+            evaluated += 1
+            for name in model_names:
+                model_class = forecasting.forecast_models[name]
+                for cut in cuts:
+                    origin = history['date'].iloc[cut - 1]
+                    dates = [origin + timedelta(days=h) for h in range(1, horizon + 1)]
+                    try:
+                        with forecasting.TimeLimit(timeouts[name]):
+                            if track_memory:
+                                tracemalloc.reset_peak()
+                                baseline = tracemalloc.get_traced_memory()[0]
+                            fit_started = time.perf_counter()
+                            model = model_class().fit(history.iloc[:cut])
+                            fit_seconds = time.perf_counter() - fit_started
+                            if track_memory:
+                                fit_memory = tracemalloc.get_traced_memory()[1] - baseline
+                                tracemalloc.reset_peak()
+                                baseline = tracemalloc.get_traced_memory()[0]
+                            predict_started = time.perf_counter()
+                            predictions = model.predict(dates)
+                            predict_seconds = time.perf_counter() - predict_started
+                            if track_memory:
+                                predict_memory = tracemalloc.get_traced_memory()[1] - baseline
+                    except Exception as e:
+                        failures.append((city, name, f"{type(e).__name__}: {e}"))
+                        break
+                    model_costs = costs[name]
+                    model_costs['fit_seconds'].append(fit_seconds)
+                    model_costs['predict_seconds'].append(predict_seconds)
+                    if track_memory:
+                        model_costs['fit_memory'].append(fit_memory)
+                        model_costs['predict_memory'].append(predict_memory)
+
+                    # Факт сопоставляется с прогнозом по дате: пропущенные в истории дни не оцениваются
+                    actual = history.iloc[cut:cut + horizon]
+                    steps = (actual['date'] - origin).dt.days.to_numpy()
+                    valid = (steps >= 1) & (steps <= horizon)
+                    steps = steps[valid]
+                    for i, target in enumerate(targets):
+                        difference = np.asarray(predictions[target], dtype=np.float64)[steps - 1] - \
+                            actual[target].to_numpy(dtype=np.float64)[valid]
+                        errors[name][0, i, steps - 1] += np.abs(difference)
+                        errors[name][1, i, steps - 1] += difference * difference
+                        errors[name][2, i, steps - 1] += 1
+    finally:
+        if track_memory:
+            tracemalloc.stop()
+    return errors, costs, failures, evaluated, time.perf_counter() - started
+
+def _describe(values):
+    if not values:
+        return {'total': 0.0, 'mean': None, 'max': None}
+    values = np.asarray(values, dtype=np.float64)
+    return {'total': float(values.sum()), 'mean': float(values.mean()), 'max': float(values.max())}
+
+def _metrics(abs_sum, sq_sum, count):
+    if count == 0:
+        return {'mae': None, 'rmse': None, 'n': 0}
+    return {'mae': round(float(abs_sum / count), 4), 'rmse': round(float(math.sqrt(sq_sum / count)), 4), 'n': int(count)}
+
+# Бэктест всех городов df (city, date, temp_day, temp_night). Возвращает отчёт (словарь для JSON)
+def run_backtest(df, models=None, horizon=None, origins=None, step=None, min_train=None, workers=None,
+                 timeout=None, track_memory=True):
+    models = models or forecasting.default_models
+    unknown = [name for name in models if name not in forecasting.forecast_models]
+    if unknown:
+        raise ValueError(f"Неизвестные модели: {', '.join(unknown)}. Допустимо: {', '.join(forecasting.forecast_models)}")
+    if 'prophet' in models and forecasting.Prophet is None:
+        print("ERROR: Модель prophet пропущена: пакет prophet не установлен (pip install prophet)")
+        models = [name for name in models if name != 'prophet']
+    horizon = horizon or forecasting.default_horizon
+    origins = origins or default_origins
+    step = step or default_step
+    min_train = min_train or default_min_train
+    workers = max(1, workers or forecasting.default_workers)
+    timeouts = {name: timeout or forecasting.forecast_models[name].default_timeout for name in models}
+
+    histories = forecasting.city_histories(df)
+    chunk_size = max(1, math.ceil(len(histories) / (workers * 4)))
+    tasks = [(models, chunk, horizon, origins, step, min_train, timeouts, track_memory)
+             for chunk in forecasting.split_chunks(histories, chunk_size)]
+
+    errors = {name: np.zeros((3, len(targets), horizon)) for name in models}
+    costs = {name: _empty_costs() for name in models}
+    failed = {name: 0 for name in models}
+    totals = {'evaluated': 0, 'worker_seconds': 0.0}
+    started = time.perf_counter()
+
+    def collect(result):
+        chunk_errors, chunk_costs, failures, evaluated, seconds = result
+        for name in models:
+            errors[name] += chunk_errors[name]
+            for key, values in chunk_costs[name].items():
+                costs[name][key].extend(values)
+        for city, name, error in failures:
+            failed[name] += 1
+            print(f"WARNING: Модель {name} для города {city} не построена: {error}")
+        totals['evaluated'] += evaluated
+        totals['worker_seconds'] += seconds
+
+    if workers == 1 or len(tasks) <= 1:
+        for task in tasks:
+            collect(backtest_chunk(*task))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            futures = {executor.submit(backtest_chunk, *task): task for task in tasks}
+            for future in as_completed(futures):
+                try:
+                    collect(future.result())
+                except Exception as e:
+                    print(f"ERROR: Порция из {len(futures[future][1])} городов завершилась ошибкой: {e}")
+
+    report = {
+        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'config': {'models': models, 'horizon': horizon, 'origins': origins, 'step': step, 'min_train': min_train,
+                   'workers': workers, 'timeout': timeout, 'track_memory': track_memory},
+        'data': {
+            'cities': len(histories),
+            'cities_evaluated': totals['evaluated'],
+            'rows': len(df),
+            'first_date': df['date'].min().strftime('%Y-%m-%d') if len(df) else None,
+            'last_date': df['date'].max().strftime('%Y-%m-%d') if len(df) else None
+        },
+        'seconds': round(time.perf_counter() - started, 3),
+        'worker_seconds': round(totals['worker_seconds'], 3),
+        'models': {}
+    }
+    for name in models:
+        model_errors = errors[name]
+        report['models'][name] = {
+            'fits': len(costs[name]['fit_seconds']),
+            'failed_cities': failed[name],
+            'fit_seconds': _describe(costs[name]['fit_seconds']),
+            'predict_seconds': _describe(costs[name]['predict_seconds']),
+            'fit_peak_memory_bytes': _describe(costs[name]['fit_memory']) if track_memory else None,
+            'predict_peak_memory_bytes': _describe(costs[name]['predict_memory']) if track_memory else None,
+            'overall': {target: _metrics(model_errors[0, i].sum(), model_errors[1, i].sum(), model_errors[2, i].sum())
+                        for i, target in enumerate(targets)},
+            'by_horizon': {target: [dict(horizon=h + 1, **_metrics(*model_errors[:, i, h])) for h in range(horizon)]
+                           for i, target in enumerate(targets)}
+        }
+    return report
+
+# Плоская таблица метрик отчёта: строка на модель, цель и горизонт
+def report_frame(report):
+    rows = []
+    for name, model_report in report['models'].items():
+        memory = model_report['fit_peak_memory_bytes'] or {}
+        for target, horizons in model_report['by_horizon'].items():
+            for metrics in horizons:
+                rows.append({
+                    'model': name,
+                    'target': target,
+                    'horizon': metrics['horizon'],
+                    'mae': metrics['mae'],
+                    'rmse': metrics['rmse'],
+                    'n': metrics['n'],
+                    'fit_seconds_mean': model_report['fit_seconds']['mean'],
+                    'predict_seconds_mean': model_report['predict_seconds']['mean'],
+                    'fit_peak_memory_bytes_max': memory.get('max'),
+                    'cities_evaluated': report['data']['cities_evaluated']
+                })
+    return pd.DataFrame(rows)
+
+def print_report(report):
+    data = report['data']
+    print(f"Бэктест: городов {data['cities_evaluated']} из {data['cities']}, данные {data['first_date']} - {data['last_date']}, "
+          f"{report['seconds']:.2f} с")
+    for name, model_report in report['models'].items():
+        fit = model_report['fit_seconds']
+        predict = model_report['predict_seconds']
+        line = f"Модель {name}: обучений {model_report['fits']}, городов с ошибками {model_report['failed_cities']}"
+        if model_report['fits']:
+            line += f", обучение {fit['mean'] * 1000:.2f} мс, прогноз {predict['mean'] * 1000:.2f} мс"
+            if model_report['fit_peak_memory_bytes']:
+                line += f", пик памяти обучения {model_report['fit_peak_memory_bytes']['max'] / 1024:.0f} КБ"
+        print(line)
+        for target, metrics in model_report['overall'].items():
+            if metrics['n']:
+                print(f"  {target}: MAE {metrics['mae']:.3f}, RMSE {metrics['rmse']:.3f} ({metrics['n']} прогнозов)")
+
+# Сохранение отчёта в JSON и метрик в историю запусков
+def save_report(report, path=None, history=None):
+    path = path or report_path
+    history = history or history_path
+    atomic_write_json(path, report)
+    frame = report_frame(report)
+    if frame.empty:
+        print(f"Отчёт бэктеста сохранён в {path}")
+        return
+    frame['as_of_date'] = report['created_at']
+    mart_writer.append_snapshot(history, frame)
+    print(f"Отчёт бэктеста сохранён в {path}, метрики дописаны в {history}")
+
+# Запуск
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бэктест моделей прогноза температуры с плавающей точкой отсчёта")
+    parser.add_argument('--models', nargs='+', choices=list(forecasting.forecast_models), default=forecasting.default_models)
+    parser.add_argument('--horizon', type=int, default=forecasting.default_horizon, help="На сколько дней вперёд")
+    parser.add_argument('--origins', type=int, default=default_origins, help="Число точек отсчёта на город")
+    parser.add_argument('--step', type=int, default=default_step, help="Шаг между точками отсчёта, дней истории")
+    parser.add_argument('--min-train', type=int, default=default_min_train, help="Минимум дней обучения до точки отсчёта")
+    parser.add_argument('--workers', type=int, default=forecasting.default_workers, help="Число процессов")
+    parser.add_argument('--timeout', type=float, default=None, help="Таймаут на обучение и прогноз, с (по умолчанию - свой у каждой модели)")
+    parser.add_argument('--no-memory', action='store_true', help="Не измерять память (tracemalloc замедляет обучение)")
+    args = parser.parse_args()
+
+    feature_store.update_feature_store()
+    df = feature_store.load_features()
+    if df.empty:
+        print("Нет данных для бэктеста.")
+    else:
+        report = run_backtest(df, args.models, args.horizon, args.origins, args.step, args.min_train, args.workers,
+                              args.timeout, not args.no_memory)
+        print_report(report)
+        save_report(report)
@@ -0,0 +1,119 @@
+import io
+import math
+import numpy as np
+import pandas as pd
+
+from storage_utils import atomic_write_bytes
+
+# Пакетное обучение моделей temp_day/temp_night ~ day_of_year сразу для всех городов.
+# Вместо цикла по городам с train_test_split + LinearRegression на город - один проход по общей таблице:
+# суммы для метода наименьших квадратов считаются по кодам городов через np.bincount,
+# коэффициенты - в закрытой форме (slope = Sxy / Sxx, intercept = mean(y) - slope * mean(x)).
+# Разбиение train/test повторяет train_test_split(test_size=0.2, random_state=42): перестановка зависит
+# только от числа строк города, поэтому считается один раз на каждую встречающуюся длину истории.
+# Результат совпадает с LinearRegression (с точностью до округления float), все модели хранятся
+# в одном файле city_models.npz.
+
+model_type = 'LinearRegression'
+test_size = 0.2
+random_state = 42
+targets = ['temp_day', 'temp_night']
+
+_train_masks = {}
+
+# Маска обучающих строк для истории длиной n (строки по возрастанию даты), как у train_test_split
+def train_mask(n):
+    mask = _train_masks.get(n)
+    if mask is None:
+        n_test = math.ceil(test_size * n)
+        permutation = np.random.RandomState(random_state).permutation(n)
+        mask = np.zeros(n, dtype=bool)
+        mask[permutation[n_test:]] = True
+        _train_masks[n] = mask
+    return mask
+
+# Обучение моделей всех городов. df - дневные признаки (city, date, temp_day, temp_night).
+# Возвращает словарь массивов: cities, n_samples, coef_<target>, intercept_<target>;
+# города с историей меньше 2 дней пропускаются
+def fit_city_models(df):
+    if df.empty:
+        return empty_models()
+    city_codes, cities = pd.factorize(df['city'], sort=False)
+    if (city_codes < 0).any():
+        df = df[city_codes >= 0]
+        city_codes = city_codes[city_codes >= 0]
+    dates = pd.to_datetime(df['date'])
+    order = np.lexsort((dates.to_numpy(), city_codes))
+    city_codes = city_codes[order]
+    x = dates.dt.dayofyear.to_numpy(dtype=np.float64)[order]
+
+    # Позиция строки внутри истории города и длина истории
+    n_cities = len(cities)
+    sizes = np.bincount(city_codes, minlength=n_cities)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    positions = np.arange(len(city_codes)) - starts[city_codes]
+
+    # Маски всех встречающихся длин истории склеены в одну таблицу, строка берёт значение по смещению своей длины
+    unique_sizes = np.unique(sizes[sizes >= 2])
+    mask = np.zeros(len(city_codes), dtype=bool)
+    if len(unique_sizes):
+        table = np.concatenate([train_mask(int(n)) for n in unique_sizes])
+        table_offsets = np.zeros(unique_sizes.max() + 1, dtype=np.int64)
+        table_offsets[unique_sizes] = np.concatenate([[0], np.cumsum(unique_sizes)[:-1]])
+        row_sizes = sizes[city_codes]
+        rows = row_sizes >= 2
+        mask[rows] = table[table_offsets[row_sizes[rows]] + positions[rows]]
+
+    train_codes = city_codes[mask]
+    n_train = np.bincount(train_codes, minlength=n_cities).astype(np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_train = x[mask]
+        x_mean = np.bincount(train_codes, weights=x_train, minlength=n_cities) / n_train
+        x_centered = x_train - x_mean[train_codes]
+        sxx = np.bincount(train_codes, weights=x_centered * x_centered, minlength=n_cities)
+
+        fitted = sizes >= 2
+        models = {'cities': np.asarray(cities, dtype=object)[fitted].astype(str), 'n_samples': sizes[fitted]}
+        for target in targets:
+            y_train = df[target].to_numpy(dtype=np.float64)[order][mask]
+            y_mean = np.bincount(train_codes, weights=y_train, minlength=n_cities) / n_train
+            sxy = np.bincount(train_codes, weights=x_centered * (y_train - y_mean[train_codes]), minlength=n_cities)
+            # Все обучающие day_of_year одинаковы - наклон 0 (как решение lstsq минимальной нормы)
+            coef = np.where(sxx > 0, sxy / np.where(sxx > 0, sxx, 1), 0.0)
+            intercept = y_mean - coef * x_mean
+            models[f'coef_{target}'] = coef[fitted]
+            models[f'intercept_{target}'] = intercept[fitted]
+    return models
+
+def empty_models():
+    models = {'cities': np.array([], dtype=str), 'n_samples': np.array([], dtype=np.int64)}
+    for target in targets:
+        models[f'coef_{target}'] = np.array([], dtype=np.float64)
+        models[f'intercept_{target}'] = np.array([], dtype=np.float64)
+    return models
+
+# Прогноз всех моделей на дату: {target: массив по городам}
+def predict(models, forecast_date):
+    day_of_year = pd.to_datetime(forecast_date).dayofyear
+    return {target: models[f'coef_{target}'] * day_of_year + models[f'intercept_{target}'] for target in targets}
+
+# Таблица прогнозов в формате Forecast.csv (округление до целых, как round() у прежнего прогноза)
+def forecast_frame(models, forecast_date):
+    predictions = predict(models, forecast_date)
+    return pd.DataFrame({
+        'city': models['cities'].astype(object),
+        'forecast_date': forecast_date,
+        'predicted_temp_day': np.rint(predictions['temp_day']).astype(np.int64),
+        'predicted_temp_night': np.rint(predictions['temp_night']).astype(np.int64),
+        'model_type': model_type
+    })
+
+# Все модели одним файлом .npz (запись атомарная)
+def save_models(path, models):
+    buffer = io.BytesIO()
+    np.savez(buffer, model_type=np.array(model_type), **models)
+    atomic_write_bytes(path, buffer.getvalue())
+
+def load_models(path):
+    with np.load(path, allow_pickle=False) as data:
+        return {key: data[key] for key in data.files if key != 'model_type'}
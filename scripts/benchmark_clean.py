@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+
+import clean_batch
+from clean_data import process_json_file, city_mapping
+
+# Бенчмарк очистки raw -> cleaned: построчный process_json_file против пакетного движка clean_batch.py
+# на синтетических записях (по умолчанию 10^5 и 10^6). Сравниваются:
+#   1) преобразование в памяти (записи уже разобраны из JSON);
+#   2) полный путь из JSONL-сегментов на диске (чтение + разбор + преобразование).
+
+def make_records(n, seed=42):
+    rng = np.random.default_rng(seed)
+    cities = list(city_mapping) + [f"City {i}" for i in range(95)]
+    city_idx = rng.integers(0, len(cities), n)
+    temps = np.round(rng.uniform(-60, 70, n), 2)
+    feels = np.round(temps - rng.uniform(0, 5, n), 2)
+    pressure = rng.integers(980, 1045, n)
+    humidity = rng.integers(20, 101, n)
+    wind = np.round(rng.uniform(0, 15, n), 2)
+    clouds = rng.integers(0, 101, n)
+    start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    offsets = np.sort(rng.integers(0, 86400 * 2 * 10**6, n))
+    records = []
+    for i in range(n):
+        timestamp = (start - timedelta(days=1) + timedelta(microseconds=int(offsets[i]))).isoformat()
+        records.append({
+            'weather': [{'description': 'пасмурно'}],
+            'main': {'temp': float(temps[i]), 'feels_like': float(feels[i]), 'temp_min': float(temps[i] - 1),
+                     'temp_max': float(temps[i] + 1), 'pressure': int(pressure[i]), 'humidity': int(humidity[i])},
+            'visibility': 10000,
+            'wind': {'speed': float(wind[i])},
+            'clouds': {'all': int(clouds[i])},
+            'city': cities[city_idx[i]],
+            'timestamp': timestamp,
+            'source': 'openweathermap.org'
+        })
+    return records
+
+def legacy_transform(records):
+    rows = []
+    for data in records:
+        rows.extend(process_json_file(data))
+    return pd.DataFrame(rows)
+
+def batch_transform(records):
+    columns = clean_batch._empty_columns()
+    for data in records:
+        clean_batch._append_record(columns, data)
+    df, _, _ = clean_batch.transform_columns(columns, city_mapping)
+    return df
+
+def write_segments(records, base_dir, n_segments):
+    sources = []
+    size = -(-len(records) // n_segments)
+    for i in range(0, len(records), size):
+        path = os.path.join(base_dir, f"segment_00000000_{i // size + 1:04d}.jsonl")
+        with open(path, 'w', encoding='utf-8') as f:
+            for r in records[i:i + size]:
+                f.write(json.dumps(r, ensure_ascii=False, separators=(',', ':')) + '\n')
+        sources.append({'kind': 'segment', 'path': path, 'key': os.path.basename(path), 'skip_lines': 0})
+    return sources
+
+def legacy_from_segments(sources):
+    rows = []
+    for source in sources:
+        records, _, _ = clean_batch.raw_storage.read_segment(source['path'])
+        for data in records:
+            rows.extend(process_json_file(data))
+    return pd.DataFrame(rows)
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def same_output(df_a, df_b):
+    return df_a.to_csv(index=False) == df_b.to_csv(index=False)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк построчной и пакетной очистки raw данных")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--segments', type=int, default=64, help="На сколько сегментов разложить записи для полного пути")
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        records = make_records(n)
+        print(f"=== {n} записей ===")
+
+        legacy_df, legacy_time = timed(legacy_transform, records)
+        batch_df, batch_time = timed(batch_transform, records)
+        print(f"В памяти:   построчно {legacy_time:7.2f} с, пакетно {batch_time:7.2f} с, "
+              f"ускорение x{legacy_time / batch_time:.1f}, результат совпадает: {same_output(legacy_df, batch_df)}")
+
+        tmp_dir = tempfile.mkdtemp(prefix='clean_bench_')
+        try:
+            sources = write_segments(records, tmp_dir, args.segments)
+            del records
+            legacy_df, legacy_time = timed(legacy_from_segments, sources)
+            clean_batch.min_sources_for_pool = 1
+            dates = sorted({datetime.fromisoformat(t).date() for t in legacy_df['timestamp'].str[:10] + 'T00:00:00'})
+            result, batch_time = timed(clean_batch.clean_sources, sources, dates, city_mapping, args.workers)
+            batch_df = pd.concat([result['frames'][d] for d in dates], ignore_index=True)
+            print(f"С диска:    построчно {legacy_time:7.2f} с, пакетно ({args.workers} процессов) {batch_time:7.2f} с, "
+                  f"ускорение x{legacy_time / batch_time:.1f}, строк: {len(legacy_df)} / {len(batch_df)}")
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
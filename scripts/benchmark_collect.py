@@ -0,0 +1,70 @@
+import os
+import time
+import shutil
+import argparse
+import tempfile
+
+import collect_data
+import raw_storage
+from mock_openweather_server import start_mock_server
+
+# Офлайн-бенчмарк сборщика: последовательный режим против конкурентного на локальном mock-сервере.
+# Данные пишутся во временную папку, data/raw не затрагивается.
+
+# Сколько записей сохранено: JSON файлы (RAW_STORAGE=files) плюс записи сегментов по их индексам .idx
+def count_saved_records(directory):
+    saved = 0
+    for dir_path, _, files in os.walk(directory):
+        for file in files:
+            if file.endswith('.json'):
+                saved += 1
+            elif raw_storage.is_segment_file(file):
+                path = os.path.join(dir_path, file)
+                index = raw_storage.read_segment_index(path)
+                saved += index['records'] if index else len(raw_storage.read_segment(path)[0])
+    return saved
+
+def run_benchmark(n_cities, latency_ms, concurrency, error_rate, skip_sequential):
+    server, base_url = start_mock_server(latency=latency_ms / 1000, error_rate=error_rate)
+    tmp_dir = tempfile.mkdtemp(prefix='collect_bench_')
+    synthetic_cities = [f"City {i:05d}" for i in range(n_cities)]
+
+    # Перенаправляем сборщик на mock-сервер и временную папку
+    collect_data.api_url = base_url
+    results = {}
+    try:
+        modes = [('concurrent', lambda: collect_data.collect_and_save_weather_data_concurrent(
+            synthetic_cities, 'test-key', concurrency=concurrency, rate_per_minute=1e9))]
+        if not skip_sequential:
+            modes.insert(0, ('sequential', lambda: collect_data.collect_and_save_weather_data(synthetic_cities, 'test-key')))
+        for mode, run in modes:
+            collect_data.raw_dir = os.path.join(tmp_dir, mode)
+            collect_data.log_file_path = os.path.join(collect_data.raw_dir, 'data_collection.txt')
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            saved = count_saved_records(collect_data.raw_dir)
+            results[mode] = (elapsed, saved)
+    finally:
+        server.shutdown()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк collect_data.py на синтетических городах")
+    parser.add_argument('--cities', type=int, default=1000)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--skip-sequential', action='store_true', help="Не запускать медленный последовательный режим")
+    args = parser.parse_args()
+
+    # Подавляем построчный лог сборщика, чтобы не мерить скорость вывода в консоль
+    collect_data.log_message = lambda message: None
+
+    results = run_benchmark(args.cities, args.latency_ms, args.concurrency, args.error_rate, args.skip_sequential)
+    print(f"Городов: {args.cities}, задержка mock-сервера: {args.latency_ms} мс, concurrency: {args.concurrency}")
+    for mode, (elapsed, saved) in results.items():
+        print(f"{mode:>10}: {elapsed:8.2f} с, {args.cities / elapsed:8.1f} городов/с, сохранено записей: {saved}")
+    if 'sequential' in results and 'concurrent' in results:
+        print(f"Ускорение: x{results['sequential'][0] / results['concurrent'][0]:.1f}")
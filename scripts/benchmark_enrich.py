@@ -0,0 +1,57 @@
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+from enrich_data import (calculate_comfort_index, determine_recommended_activity, determine_season_match,
+                         add_derived_columns)
+
+# Бенчмарк расчёта производных колонок enriched слоя: построчный apply(axis=1) против векторной версии
+# (comfort_index, recommended_activity, tourist_season_match) на синтетических данных, по умолчанию 10^6 строк.
+# Результат сравнивается побитово через CSV представление.
+
+seasons = ['Круглогодично', 'Май-Сентябрь', 'Май-Октябрь', 'Июнь-Август', 'Ноябрь-Март', 'июнь-август.',
+           'добавьте город в справочник cities_reference.csv']
+
+def make_frame(n, seed=42):
+    rng = np.random.default_rng(seed)
+    pop = np.round(rng.uniform(0, 1, n), 2)
+    pop[rng.uniform(0, 1, n) < 0.7] = np.nan  # Для текущей погоды pop обычно пустой
+    wind = np.round(rng.uniform(0, 15, n), 2)
+    wind[rng.uniform(0, 1, n) < 0.01] = np.nan
+    return pd.DataFrame({
+        'temperature': rng.integers(-40, 40, n),
+        'humidity': rng.integers(10, 101, n),
+        'clouds': rng.integers(0, 101, n),
+        'pop': pop,
+        'wind_speed': wind,
+        'tourism_season': rng.choice(seasons, n)
+    })
+
+def legacy_derived_columns(df, current_month):
+    df['comfort_index'] = df.apply(calculate_comfort_index, axis=1)
+    df['recommended_activity'] = df.apply(lambda row: determine_recommended_activity(row['comfort_index'], row['pop']), axis=1)
+    df['tourist_season_match'] = df.apply(lambda row: determine_season_match(current_month, row['tourism_season']), axis=1)
+    return df
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def same_output(df_a, df_b):
+    return df_a.dtypes.equals(df_b.dtypes) and df_a.to_csv(index=False) == df_b.to_csv(index=False)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк построчного и векторного обогащения")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000_000])
+    parser.add_argument('--month', type=int, default=7, help="Месяц для tourist_season_match")
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        df = make_frame(n)
+        print(f"=== {n} строк ===")
+        legacy_df, legacy_time = timed(legacy_derived_columns, df.copy(), args.month)
+        vector_df, vector_time = timed(add_derived_columns, df.copy(), args.month)
+        print(f"apply(axis=1): {legacy_time:7.2f} с, векторно: {vector_time:7.3f} с, "
+              f"ускорение x{legacy_time / vector_time:.0f}, результат совпадает: {same_output(legacy_df, vector_df)}")
@@ -0,0 +1,130 @@
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+import report_state
+from create_reports import build_marts
+
+# Бенчмарк построения витрин create_reports.py на синтетических enriched данных (по умолчанию 10^6 строк):
+# прежняя схема (три groupby по city_name с x.mode() в лямбдах и построчный apply) против одного прохода
+# report_state.partition_stats (groupby по кодам городов, частоты через bincount), модами через argmax
+# в report_state.city_aggregates и векторных производных колонок build_marts. Витрины сравниваются через CSV.
+
+activities = ['прогулка', 'экскурсии', 'пляжный отдых', 'домашний отдых']
+districts = ['Центральный', 'Северо-Западный', 'Южный', 'Приволжский', 'Уральский', 'Сибирский', 'Дальневосточный']
+seasons = ['Круглогодично', 'Май-Сентябрь', 'Июнь-Август', 'Ноябрь-Март']
+
+def make_frame(n, cities=200, seed=42):
+    rng = np.random.default_rng(seed)
+    city_names = np.array([f"Город {i:03d}" for i in range(cities)], dtype=object)
+    city_codes = rng.integers(0, cities, n)
+    pop = np.round(rng.uniform(0, 1, n), 2)
+    pop[rng.uniform(0, 1, n) < 0.7] = np.nan
+    return pd.DataFrame({
+        'city_name': city_names[city_codes],
+        'comfort_index': np.round(rng.normal(10, 8, n), 2),
+        'temperature': rng.integers(-30, 35, n),
+        'pop': pop,
+        'clouds': rng.integers(0, 101, n),
+        'humidity': rng.integers(10, 101, n),
+        'recommended_activity': rng.choice(activities, n, p=[0.3, 0.3, 0.1, 0.3]),
+        'tourist_season_match': rng.choice(['да', 'нет'], n),
+        # Округ и сезон - свойства города
+        'tourism_season': np.array(seasons, dtype=object)[city_codes % len(seasons)],
+        'federal_district': np.array(districts, dtype=object)[city_codes % len(districts)]
+    })
+
+# Прежняя реализация create_reports.py (без записи файлов)
+def legacy_marts(df_all, current_as_of_date):
+    df_city_rating = df_all.groupby('city_name').agg({
+        'comfort_index': 'mean',
+        'recommended_activity': lambda x: x.mode()[0] if not x.mode().empty else 'неизвестно',
+        'tourist_season_match': lambda x: x.mode()[0] if not x.mode().empty else 'неизвестно',
+        'tourism_season': 'first'
+    }).reset_index()
+    df_city_rating['comfort_index'] = df_city_rating['comfort_index'].round(2)
+    df_city_rating['tour_recommendation'] = df_city_rating.apply(
+        lambda row: f"{row['recommended_activity']} в сезон" if row['tourist_season_match'] == 'да' else f"{row['recommended_activity']} вне сезона", axis=1
+    )
+    df_city_rating = df_city_rating.sort_values('comfort_index').rename(columns={'comfort_index': 'avg_comfort_index'})
+    df_city_rating['as_of_date'] = current_as_of_date
+
+    df_city_agg = df_all.groupby('city_name').agg({
+        'federal_district': 'first',
+        'comfort_index': 'mean',
+        'temperature': 'mean',
+        'recommended_activity': lambda x: x.mode()[0] if not x.mode().empty else 'неизвестно'
+    }).reset_index()
+    df_city_agg['avg_comfort_index'] = df_city_agg['comfort_index'].round(2)
+    df_city_agg['avg_temperature'] = df_city_agg['temperature'].round(2)
+    df_city_agg_filtered = df_city_agg[df_city_agg['recommended_activity'] != 'домашний отдых']
+    df_district_summary = pd.DataFrame({'federal_district': df_city_agg['federal_district'].unique()})
+    temp_summary = df_city_agg.groupby('federal_district')['avg_temperature'].mean().round(2).reset_index()
+    df_district_summary = df_district_summary.merge(temp_summary, on='federal_district', how='left')
+    comfortable_count = df_city_agg_filtered.groupby('federal_district').size().reset_index(name='comfortable_cities_count')
+    df_district_summary = df_district_summary.merge(comfortable_count, on='federal_district', how='left').fillna(0)
+    df_district_summary['comfortable_cities_count'] = df_district_summary['comfortable_cities_count'].astype(int)
+    df_district_summary['general_recommendation'] = df_district_summary.apply(
+        lambda row: "Рекомендуется посетить" if row['avg_temperature'] > 10 and row['comfortable_cities_count'] > 0 else "Лучше остаться дома", axis=1
+    )
+    df_district_summary['as_of_date'] = current_as_of_date
+
+    df_city_agg2 = df_all.groupby('city_name').agg({
+        'comfort_index': 'mean',
+        'recommended_activity': lambda x: x.mode()[0] if not x.mode().empty else 'неизвестно',
+        'pop': 'mean',
+        'temperature': 'mean',
+        'clouds': 'mean',
+        'humidity': 'mean'
+    }).reset_index()
+    df_for_travel = df_city_agg2[df_city_agg2['recommended_activity'] != "домашний отдых"]
+    top_cities = df_for_travel.sort_values('comfort_index', ascending=False).head(3)[['city_name', 'comfort_index']]
+    stay_home_cities = df_city_agg2[df_city_agg2['recommended_activity'] == "домашний отдых"][['city_name', 'comfort_index']]
+    df_city_agg2['additional_notes'] = df_city_agg2.apply(
+        lambda row: (
+            ("Взять зонт" if row['pop'] > 0.5 else "") +
+            ("; Взять теплую одежду" if row['temperature'] < 10 else "") +
+            ("; Солнцезащитный крем" if row['temperature'] > 25 else "") +
+            ("; Очень холодно, риск обморожения" if row['temperature'] < 0 else "") +
+            ("; Сильные осадки, возможно снег/дождь" if row['pop'] > 0.8 else "") +
+            ("; Плохая видимость из-за тумана/облачности" if row['clouds'] > 80 or row['humidity'] > 90 else "")
+        ).strip("; "), axis=1
+    )
+    additional_notes_str = '; '.join([f"{row['city_name']}: {row['additional_notes']}" for _, row in df_city_agg2[df_city_agg2['additional_notes'] != ''].iterrows()])
+    df_mart3 = pd.DataFrame({
+        'top_3_cities': [', '.join(top_cities['city_name'].tolist())],
+        'stay_home_cities': [', '.join(stay_home_cities['city_name'].tolist())],
+        'additional_notes': [additional_notes_str]
+    })
+    df_mart3['as_of_date'] = current_as_of_date
+    return df_city_rating, df_district_summary, df_mart3
+
+# Новая схема: частичные агрегаты партиции -> агрегаты по городам -> витрины
+def fused_marts(df_all, current_as_of_date):
+    state = report_state.empty_state()
+    report_state.add_partition(state, '00000000', {'rows': len(df_all), 'cities': report_state.partition_stats(df_all)})
+    return build_marts(report_state.city_aggregates(state), current_as_of_date)
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def same_marts(marts_a, marts_b):
+    return all(a.to_csv(index=False) == b.to_csv(index=False) for a, b in zip(marts_a, marts_b))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк агрегации витрин create_reports")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000_000])
+    parser.add_argument('--cities', type=int, default=200)
+    args = parser.parse_args()
+
+    as_of_date = '2025-01-01 00:00'
+    for n in args.sizes:
+        df = make_frame(n, args.cities)
+        print(f"=== {n} строк, {args.cities} городов ===")
+        legacy, legacy_time = timed(legacy_marts, df, as_of_date)
+        fused, fused_time = timed(fused_marts, df, as_of_date)
+        print(f"три groupby + mode() + apply: {legacy_time:7.2f} с, один проход: {fused_time:7.3f} с, "
+              f"ускорение x{legacy_time / fused_time:.0f}, витрины совпадают: {same_marts(legacy, fused)}")
@@ -0,0 +1,77 @@
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LinearRegression
+from sklearn.model_selection import train_test_split
+
+import batch_trainer
+
+# Бенчмарк обучения моделей по городам: прежний цикл (train_test_split + LinearRegression на город и цель,
+# как в удалённом train_weather_model.train_and_forecast, без сохранения pickle) против
+# batch_trainer.fit_city_models на синтетических дневных признаках. Прежний цикл запускается на части городов (--legacy-cities), время на все города
+# экстраполируется; коэффициенты и прогнозы сравниваются на этой части.
+
+def make_frame(cities, days, seed=42):
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(max(2, days // 2), days + 1, cities)
+    starts = pd.Timestamp('2025-01-01') + pd.to_timedelta(rng.integers(0, 60, cities), unit='D')
+    city = np.repeat(np.array([f"Город {i:05d}" for i in range(cities)], dtype=object), lengths)
+    offsets = np.concatenate([np.arange(n) for n in lengths])
+    date = np.repeat(starts.to_numpy(), lengths) + pd.to_timedelta(offsets, unit='D').to_numpy()
+    season = np.sin(pd.DatetimeIndex(date).dayofyear.to_numpy() / 365 * 2 * np.pi)
+    return pd.DataFrame({
+        'city': city,
+        'date': date,
+        'temp_day': np.round(10 * season + rng.normal(5, 3, len(city)), 2),
+        'temp_night': np.round(10 * season + rng.normal(0, 3, len(city)), 2)
+    })
+
+def legacy_fit(df, cities, forecast_date):
+    rows = []
+    tomorrow_day = pd.to_datetime(forecast_date).dayofyear
+    for city in cities:
+        df_city = df[df['city'] == city].sort_values('date')
+        X = pd.DataFrame({'day_of_year': df_city['date'].dt.dayofyear})
+        row = {'city': city}
+        for target in batch_trainer.targets:
+            X_train, X_test, y_train, y_test = train_test_split(X, df_city[target], test_size=0.2, random_state=42)
+            model = LinearRegression().fit(X_train, y_train)
+            row[f'coef_{target}'] = model.coef_[0]
+            row[f'intercept_{target}'] = model.intercept_
+            row[f'predicted_{target}'] = round(model.predict(pd.DataFrame([[tomorrow_day]], columns=['day_of_year']))[0])
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк пакетного обучения моделей по городам")
+    parser.add_argument('--cities', type=int, default=10_000)
+    parser.add_argument('--days', type=int, default=90, help="Максимальная длина истории города в днях")
+    parser.add_argument('--legacy-cities', type=int, default=300, help="На скольких городах запускать прежний цикл")
+    args = parser.parse_args()
+
+    forecast_date = '2025-06-01'
+    df = make_frame(args.cities, args.days)
+    print(f"=== {args.cities} городов, {len(df)} строк ===")
+
+    start = time.perf_counter()
+    models = batch_trainer.fit_city_models(df)
+    batch_time = time.perf_counter() - start
+    forecast = batch_trainer.forecast_frame(models, forecast_date)
+
+    sample = models['cities'][:args.legacy_cities]
+    start = time.perf_counter()
+    legacy = legacy_fit(df, sample, forecast_date)
+    legacy_time = (time.perf_counter() - start) / len(sample) * len(models['cities'])
+
+    max_diff = max(
+        np.abs(legacy[f'{kind}_{target}'].to_numpy() - models[f'{kind}_{target}'][:len(sample)]).max()
+        for kind in ['coef', 'intercept'] for target in batch_trainer.targets
+    )
+    same_forecast = all(
+        (legacy[f'predicted_{target}'].to_numpy() == forecast[f'predicted_{target}'].to_numpy()[:len(sample)]).all()
+        for target in batch_trainer.targets
+    )
+    print(f"цикл по городам (экстраполяция с {len(sample)}): {legacy_time:7.2f} с, пакетно: {batch_time:7.3f} с, "
+          f"ускорение x{legacy_time / batch_time:.0f}")
+    print(f"макс. расхождение коэффициентов: {max_diff:.2e}, прогнозы совпадают: {same_forecast}")
@@ -0,0 +1,67 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Подготовка рядов для графиков.
+# - city_series делит данные всех городов на историю и прогноз одним groupby (вместо двух булевых масок
+#   на город в каждом графике).
+# - Каждый ряд прореживается алгоритмом Largest-Triangle-Three-Buckets (LTTB) до point_budget точек
+#   (CHART_POINT_BUDGET): первая и последняя точки сохраняются, из каждой корзины берётся точка с наибольшей
+#   площадью треугольника с предыдущей выбранной точкой и средним следующей корзины - форма ряда (пики, провалы)
+#   сохраняется, а число точек на графике не растёт вместе с историей.
+# - Подписи дат (strftime) считаются только для оставшихся точек.
+
+default_point_budget = int(os.getenv('CHART_POINT_BUDGET', '500'))
+date_label_format = '%d.%m.%y'
+
+# Индексы точек ряда (x по возрастанию), оставляемых LTTB. threshold < 3 или >= len(x) - ряд без прореживания
+def lttb_indices(x, y, threshold):
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # Внутренние точки 1..n-2 делятся на threshold - 2 корзины: корзина i - [edges[i], edges[i + 1])
+    every = (n - 2) / (threshold - 2)
+    edges = (np.arange(threshold - 1) * every).astype(np.int64) + 1
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Третья вершина - среднее следующей корзины (для последней корзины - последняя точка)
+        if i + 2 < len(edges):
+            next_x = x[end:edges[i + 2]].mean()
+            next_y = y[end:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[n - 1], y[n - 1]
+        area = np.abs((x[a] - next_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+# Прореживание frame (строки по возрастанию x_column) по колонке y_column
+def downsample(frame, x_column, y_column, point_budget=None):
+    point_budget = point_budget or default_point_budget
+    if len(frame) <= point_budget:
+        return frame
+    x = frame[x_column]
+    if pd.api.types.is_datetime64_any_dtype(x):
+        x = x.to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    return frame.iloc[lttb_indices(x, frame[y_column].to_numpy(dtype=np.float64), point_budget)]
+
+# Ряды по городам: [(город, история до cutoff, прогноз с cutoff)] в порядке первого появления города в df.
+# df должен быть отсортирован по date
+def city_series(df, cutoff):
+    cutoff = np.datetime64(pd.Timestamp(cutoff), 'ns')
+    series = []
+    for city, rows in df.groupby('city', sort=False):
+        split = int(np.searchsorted(rows['date'].to_numpy(dtype='datetime64[ns]'), cutoff, side='left'))
+        series.append((city, rows.iloc[:split], rows.iloc[split:]))
+    return series
+
+# Точки графика (подписи дат, значения) ряда column после прореживания
+def series_points(rows, column, point_budget=None):
+    rows = downsample(rows, 'date', column, point_budget)
+    return rows['date'].dt.strftime(date_label_format), rows[column]
@@ -0,0 +1,86 @@
+import os
+import json
+import hashlib
+import tempfile
+from datetime import datetime
+from importlib import metadata
+
+import plotly
+import plotly.io as pio
+
+from storage_utils import atomic_write_json, read_json
+
+# Экспорт Plotly графиков в PNG (data/visualizations).
+# - Отпечаток графика - sha256 его JSON (данные, подписи, оформление), размеров и версии plotly. Если отпечаток
+#   не изменился и PNG на месте, график не рендерится и файл не перезаписывается (git не видит изменений).
+#   Отпечатки хранятся в chart_state.json рядом с картинками.
+# - Изменившиеся графики экспортируются одним вызовом plotly.io.write_images - одна сессия kaleido на все
+#   графики (plotly >= 6.1 и kaleido >= 1.0). Со старым kaleido - write_image по очереди (kaleido 0.2 держит
+#   процесс между вызовами).
+# - PNG пишется во временный файл и заменяет прежний через os.replace.
+
+state_version = 1
+
+def _state_path(directory):
+    return os.path.join(directory, 'chart_state.json')
+
+def _kaleido_major():
+    try:
+        return int(metadata.version('kaleido').split('.')[0])
+    except (metadata.PackageNotFoundError, ValueError):
+        return 0
+
+def chart_fingerprint(figure, width=None, height=None, scale=None):
+    payload = json.dumps({
+        'figure': figure.to_plotly_json(),
+        'size': [width, height, scale],
+        'plotly': plotly.__version__
+    }, sort_keys=True, cls=plotly.utils.PlotlyJSONEncoder)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _export(figures, paths, width, height, scale):
+    if hasattr(pio, 'write_images') and _kaleido_major() >= 1:
+        pio.write_images(figures, paths, format='png', width=width, height=height, scale=scale)
+    else:
+        for figure, path in zip(figures, paths):
+            figure.write_image(path, format='png', width=width, height=height, scale=scale)
+
+# Рендер графиков charts {имя файла: go.Figure} в directory. Возвращает список перерисованных файлов
+def render_charts(charts, directory, width=None, height=None, scale=None):
+    os.makedirs(directory, exist_ok=True)
+    state = read_json(_state_path(directory))
+    if not state or state.get('version') != state_version:
+        state = {'version': state_version, 'charts': {}}
+
+    pending = {}
+    for filename, figure in charts.items():
+        fingerprint = chart_fingerprint(figure, width, height, scale)
+        entry = state['charts'].get(filename)
+        if entry and entry['fingerprint'] == fingerprint and os.path.exists(os.path.join(directory, filename)):
+            continue
+        pending[filename] = fingerprint
+    if not pending:
+        print(f"Графики не изменились, PNG не перерисовываются ({len(charts)} шт.)")
+        return []
+
+    filenames = list(pending)
+    temp_paths = []
+    try:
+        for filename in filenames:
+            fd, temp_path = tempfile.mkstemp(prefix='.' + filename + '.', suffix='.png', dir=directory)
+            os.close(fd)
+            temp_paths.append(temp_path)
+        _export([charts[filename] for filename in filenames], temp_paths, width, height, scale)
+        for filename, temp_path in zip(filenames, temp_paths):
+            os.replace(temp_path, os.path.join(directory, filename))
+    finally:
+        for temp_path in temp_paths:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    for filename in filenames:
+        state['charts'][filename] = {'fingerprint': pending[filename], 'rendered_at': now}
+    atomic_write_json(_state_path(directory), state)
+    print(f"Перерисовано графиков: {len(filenames)} из {len(charts)} ({', '.join(filenames)})")
+    return filenames
@@ -0,0 +1,60 @@
+import tempfile
+import pandas as pd
+
+import columnar_storage
+
+# Проверка совместимости CSV и parquet слоёв columnar_storage.py по collection_time (во временной папке):
+# данные из parquet, записанные в CSV (write_layer, LayerWriter, append_layer), читаются обратно с тем же
+# collection_time в формате DD.MM.YYYY HH:MM:SS, а CSV с ISO временем (старые файлы) разбирается запасным форматом.
+
+def check_mixed_format_roundtrip(directory):
+    if columnar_storage.pa is None:
+        raise ImportError("Для проверки нужен пакет pyarrow (pip install pyarrow)")
+    times = ['08.10.2025 17:37:48', '08.10.2025 03:05:00', '09.10.2025 12:00:01']
+    df = pd.DataFrame({'city_name': ['Москва', 'Сочи', 'Казань'], 'temperature': [5, 12, -3], 'collection_time': times})
+    expected = pd.to_datetime(pd.Series(times), format=columnar_storage.collection_time_format)
+
+    parquet_path = columnar_storage.layer_file_path(directory, columnar_storage.cleaned_prefix, '20251008', 'parquet')
+    columnar_storage.write_layer(df, parquet_path, columnar_storage.cleaned_schema)
+    from_parquet = columnar_storage.read_layer_file(parquet_path)
+    results = {}
+
+    csv_path = columnar_storage.layer_file_path(directory, columnar_storage.enriched_prefix, '20251008', 'csv')
+    columnar_storage.write_layer(from_parquet, csv_path, columnar_storage.enriched_schema)
+    results['write_layer'] = columnar_storage.read_layer_file(csv_path)
+
+    writer_path = columnar_storage.layer_file_path(directory, columnar_storage.enriched_prefix, '20251009', 'csv')
+    writer = columnar_storage.LayerWriter(writer_path, columnar_storage.enriched_schema)
+    writer.write(from_parquet.iloc[:1])
+    writer.write(from_parquet.iloc[1:])
+    writer.close()
+    results['LayerWriter'] = columnar_storage.read_layer_file(writer_path)
+
+    append_path = columnar_storage.layer_file_path(directory, columnar_storage.enriched_prefix, '20251010', 'csv')
+    columnar_storage.write_layer(df.iloc[:1], append_path, columnar_storage.enriched_schema)
+    columnar_storage.append_layer(from_parquet.iloc[1:], append_path, columnar_storage.enriched_schema)
+    results['append_layer'] = columnar_storage.read_layer_file(append_path)
+
+    iso_path = columnar_storage.layer_file_path(directory, columnar_storage.enriched_prefix, '20251011', 'csv')
+    from_parquet.to_csv(iso_path, index=False, encoding='utf-8')
+    results['ISO CSV'] = columnar_storage.read_layer_file(iso_path)
+
+    ok = True
+    for name, result in results.items():
+        parsed = columnar_storage.parse_collection_time(result['collection_time'])
+        if not parsed.reset_index(drop=True).equals(expected):
+            print(f"ERROR: {name}: collection_time не совпадает: {list(result['collection_time'])}")
+            ok = False
+        elif name != 'ISO CSV' and list(result['collection_time']) != times:
+            print(f"ERROR: {name}: collection_time записан не в формате {columnar_storage.collection_time_format}: "
+                  f"{list(result['collection_time'])}")
+            ok = False
+    return ok
+
+# Запуск проверки
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        if check_mixed_format_roundtrip(directory):
+            print("SUCCESS: CSV и parquet слои совместимы по collection_time")
+        else:
+            raise SystemExit(1)
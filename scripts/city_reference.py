@@ -0,0 +1,99 @@
+import os
+import numpy as np
+import pandas as pd
+
+from storage_utils import file_sha256
+
+# Справочник городов (data/enriched/cities_reference.csv) в разобранном виде для обогащения.
+# Файл читается и нормализуется один раз на процесс и кешируется по пути; кеш проверяется по mtime,
+# а если mtime изменился - по sha256 содержимого (перезапись тем же содержимым не вызывает повторный разбор).
+# Каждый город получает целочисленный код (позицию в справочнике); данные обогащения берутся по кодам
+# из массивов, строка сезона заранее разобрана в битовую маску месяцев.
+
+cities_ref_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'enriched', 'cities_reference.csv')
+
+required_columns = ['city_name', 'federal_district', 'tourism_season']
+lookup_columns = ['federal_district', 'tourism_season', 'timezone', 'population']
+
+# Словарь месяцев для парсинга диапазонов (на русском)
+month_dict = {
+    'январь': 1, 'февраль': 2, 'март': 3, 'апрель': 4, 'май': 5, 'июнь': 6,
+    'июль': 7, 'август': 8, 'сентябрь': 9, 'октябрь': 10, 'ноябрь': 11, 'декабрь': 12
+}
+
+# Битовая маска месяцев туристического сезона (бит 0 - январь): "Круглогодично" - все месяцы,
+# диапазон "май-сентябрь" - месяцы с мая по сентябрь; нераспознанная строка - ни одного месяца
+def season_month_mask(tourism_season):
+    if not tourism_season or pd.isna(tourism_season):
+        return 0
+    tourism_season = tourism_season.strip().lower()
+    if tourism_season == 'круглогодично':
+        return (1 << 12) - 1
+    parts = tourism_season.replace('.', '').split('-')
+    if len(parts) == 2:
+        start_month = month_dict.get(parts[0].strip(), 0)
+        end_month = month_dict.get(parts[1].strip(), 0)
+        if start_month > 0 and end_month > 0:
+            return sum(1 << (month - 1) for month in range(start_month, end_month + 1))
+    return 0
+
+def normalize_city_name(names):
+    return names.str.lower().str.strip()
+
+class CityReference:
+    def __init__(self, df_cities):
+        df_cities = df_cities.reset_index(drop=True)
+        normalized = normalize_city_name(df_cities['city_name'])
+        duplicated = normalized.duplicated()
+        if duplicated.any():
+            print(f"WARNING: Дубликаты городов в справочнике: {', '.join(normalized[duplicated].astype(str))}. Используется первая запись.")
+        # Код города - номер строки справочника (для дубликатов - первой)
+        self.codes_by_name = {name: code for code, name in reversed(list(enumerate(normalized)))}
+        self.columns = {
+            column: df_cities[column] if column in df_cities.columns else pd.Series(np.nan, index=df_cities.index, dtype=object)
+            for column in lookup_columns
+        }
+        self.season_masks = np.array([season_month_mask(season) for season in self.columns['tourism_season']] + [0], dtype=np.int64)
+
+    def __len__(self):
+        return len(self.columns['federal_district'])
+
+    # Коды городов для колонки названий (без учёта регистра и пробелов); -1 - города нет в справочнике.
+    # Нормализуются только уникальные названия, поэтому стоимость не растёт с числом строк
+    def lookup_codes(self, names):
+        factor_codes, uniques = pd.factorize(names)
+        unique_codes = normalize_city_name(pd.Series(uniques, dtype=object)).map(self.codes_by_name).fillna(-1).astype(np.int64)
+        return np.append(unique_codes.to_numpy(), -1)[factor_codes]
+
+    # Значения колонки справочника по кодам. Для кода -1 - пропуск (и, как после left merge,
+    # целые колонки при наличии пропусков становятся float)
+    def take(self, column, codes):
+        values = self.columns[column]
+        if (codes < 0).any():
+            values = pd.concat([values, pd.Series([np.nan])], ignore_index=True)
+        return values.to_numpy()[codes]
+
+    # Маски месяцев сезона по кодам (для кода -1 - пустая маска)
+    def season_masks_for(self, codes):
+        return self.season_masks[codes]
+
+_cache = {}
+
+# Загрузка справочника с кешированием на процесс. Ошибки чтения и недостающие колонки - исключения
+def load_city_reference(path=None):
+    path = os.path.abspath(path or cities_ref_path)
+    stat = os.stat(path)
+    entry = _cache.get(path)
+    if entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+        return entry['reference']
+    sha256 = file_sha256(path)
+    if entry and entry['sha256'] == sha256:
+        entry['mtime_ns'] = stat.st_mtime_ns
+        return entry['reference']
+
+    df_cities = pd.read_csv(path, encoding='utf-8')
+    if not all(col in df_cities.columns for col in required_columns):
+        raise ValueError(f"Недостающие столбцы в {path}: {required_columns}")
+    reference = CityReference(df_cities)
+    _cache[path] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': sha256, 'reference': reference}
+    return reference
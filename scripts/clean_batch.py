@@ -0,0 +1,286 @@
+import os
+import gc
+import json
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import raw_storage
+
+try:
+    import orjson  # Быстрый JSON-парсер (необязателен, без него используется стандартный json)
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# Пакетный движок очистки raw -> cleaned.
+# Raw файлы и сегменты разбираются в пуле процессов в колонки (списки значений), а округление,
+# конвертация давления, фильтр по температуре и форматирование collection_time выполняются
+# векторно в pandas/NumPy. Результат совпадает с построчным process_json_file из clean_data.py.
+
+# Колонки cleaned слоя в порядке process_json_file
+cleaned_columns = ['city_name', 'temperature', 'feels_like', 'humidity', 'pressure', 'wind_speed',
+                   'weather_description', 'visibility', 'pop', 'clouds', 'temp_min', 'temp_max',
+                   'collection_time', 'timestamp']
+
+# Если источников меньше, пул процессов не запускаем: накладные расходы больше выигрыша
+min_sources_for_pool = 64
+
+def _empty_columns():
+    return {
+        'city': [], 'temp': [], 'feels_like': [], 'humidity': [], 'pressure': [], 'wind_speed': [],
+        'weather_description': [], 'visibility': [], 'clouds': [], 'temp_min': [], 'temp_max': [],
+        'timestamp': []
+    }
+
+# Добавление одной raw записи в колонки. Возвращает текст ошибки или None
+def _append_record(columns, data):
+    try:
+        main = data['main']
+        row = (
+            data['city'], main['temp'], main['feels_like'], main['humidity'], main['pressure'],
+            data['wind']['speed'], data['weather'][0]['description'], data.get('visibility', None),
+            data['clouds']['all'] if 'clouds' in data else None,
+            main['temp_min'] if 'temp_min' in main else None,
+            main['temp_max'] if 'temp_max' in main else None
+        )
+    except KeyError as e:
+        return f"Отсутствующий ключ в данных: {e}"
+    (city, temp, feels_like, humidity, pressure, wind_speed, description,
+     visibility, clouds, temp_min, temp_max) = row
+    columns['city'].append(city)
+    columns['temp'].append(temp)
+    columns['feels_like'].append(feels_like)
+    columns['humidity'].append(humidity)
+    columns['pressure'].append(pressure)
+    columns['wind_speed'].append(wind_speed)
+    columns['weather_description'].append(description)
+    columns['visibility'].append(visibility)
+    columns['clouds'].append(clouds)
+    columns['temp_min'].append(temp_min)
+    columns['temp_max'].append(temp_max)
+    columns['timestamp'].append(data['timestamp'])
+    return None
+
+# Разбор пачки источников (выполняется в процессе пула).
+# Записи без timestamp отбрасываются с проблемой; для записей с битой структурой сохраняется только timestamp,
+# чтобы они попали в счётчик исходных записей своей даты, как в построчном пути.
+# Разобранные словари не накапливаются, а сразу раскладываются по колонкам; сборщик мусора на время
+# разбора отключается: циклических ссылок здесь нет, а на миллионах объектов он заметно тормозит разбор.
+def parse_sources(sources):
+    columns = _empty_columns()
+    failed_timestamps = []
+    problems = []
+    lines_read = {}
+
+    def add(data, label):
+        if not isinstance(data, dict) or not data.get('timestamp'):
+            problems.append(f"Запись из {label} пропущена: отсутствует timestamp")
+            return
+        error = _append_record(columns, data)
+        if error:
+            failed_timestamps.append(data['timestamp'])
+            problems.append(f"Запись из {label}: {error}")
+
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for source in sources:
+            filepath = source['path']
+            name = os.path.basename(filepath)
+            try:
+                if source['kind'] == 'json':
+                    with open(filepath, 'rb') as f:
+                        data = _json_loads(f.read())
+                    # Источник отмечается только после успешного чтения: недописанный файл прочитается в следующий раз
+                    lines_read[source['key']] = 1
+                    add(data, f"файла {name}")
+                else:
+                    label = f"сегмента {name}"
+                    last_line = source.get('skip_lines', 0)
+                    for last_line, data, error in raw_storage.iter_segment(filepath, last_line):
+                        if error:
+                            problems.append(error)
+                        elif data is not None:
+                            add(data, label)
+                    lines_read[source['key']] = last_line
+            except Exception as e:
+                problems.append(f"Ошибка чтения {filepath}: {e}")
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return columns, failed_timestamps, problems, lines_read
+
+# Колонка в float64: быстрый путь через NumPy (None -> NaN, числовые строки как у float()),
+# при нечисловых строках - поэлементно через pd.to_numeric. Второй элемент - маска некорректных значений
+def _to_float(values, required):
+    try:
+        arr = np.asarray(values, dtype=float)
+        bad = np.zeros(len(arr), dtype=bool)
+    except (TypeError, ValueError):
+        series = pd.Series(values, dtype=object)
+        arr = pd.to_numeric(series, errors='coerce').to_numpy(dtype=float)
+        bad = np.isnan(arr) & series.notna().to_numpy()
+    if required:
+        bad |= np.isnan(arr)
+    return arr, bad
+
+# Округление как у встроенного round() для целых (банковское округление) с сохранением пропусков:
+# без пропусков - int64, с пропусками - float64 (так же, как pandas выводит тип из списка int/None)
+def _round_column(arr):
+    rounded = np.rint(arr)
+    if np.isnan(rounded).any():
+        return rounded
+    return rounded.astype(np.int64)
+
+# Позиции символов ISO timestamp "YYYY-MM-DDTHH:MM:SS", из которых собирается "DD.MM.YYYY HH:MM:SS"
+_iso_digit_positions = [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]
+_iso_separators = {4: '-', 7: '-', 10: 'T', 13: ':', 16: ':'}
+_formatted_layout = [8, 9, '.', 5, 6, '.', 0, 1, 2, 3, ' ', 11, 12, 13, 14, 15, 16, 17, 18]
+
+# Векторное форматирование ISO timestamp в DD.MM.YYYY hh:mm:ss; второй элемент - дата как строка YYYY-MM-DD.
+# Строки разбираются как матрица кодов символов NumPy: перестановка столбцов вместо strftime для каждой записи
+def _format_timestamps(timestamps):
+    n = len(timestamps)
+    arr = np.asarray(timestamps, dtype=str)
+    width = arr.dtype.itemsize // 4
+    formatted = np.full(n, '', dtype='U19')
+    date_keys = np.full(n, '', dtype='U10')
+    canonical = np.zeros(n, dtype=bool)
+    if n and width >= 19:
+        codes = np.ascontiguousarray(arr).view(np.uint32).reshape(n, width)
+        digits = codes[:, _iso_digit_positions]
+        canonical = ((digits >= ord('0')) & (digits <= ord('9'))).all(axis=1)
+        for pos, char in _iso_separators.items():
+            canonical &= codes[:, pos] == ord(char)
+        if width > 19:
+            # Дальше допускается только дробная часть секунд ".ffffff" (хвост строки заполнен нулями)
+            tail = codes[:, 20:]
+            canonical &= (codes[:, 19] == 0) | ((codes[:, 19] == ord('.')) & ((tail == 0) | ((tail >= ord('0')) & (tail <= ord('9')))).all(axis=1))
+        layout = np.zeros((n, 19), dtype=np.uint32)
+        for i, source in enumerate(_formatted_layout):
+            layout[:, i] = ord(source) if isinstance(source, str) else codes[:, source]
+        formatted = layout.view('U19').ravel().copy()
+        date_keys = np.ascontiguousarray(codes[:, :10]).view('U10').ravel().copy()
+    # Нестандартные строки (часовой пояс, пробел вместо T и т.п.) разбираем через fromisoformat
+    for i in np.flatnonzero(~canonical):
+        try:
+            dt_obj = datetime.fromisoformat(str(timestamps[i]))
+        except ValueError:
+            formatted[i] = ''
+            date_keys[i] = ''
+            continue
+        formatted[i] = dt_obj.strftime("%d.%m.%Y %H:%M:%S")
+        date_keys[i] = dt_obj.date().isoformat()
+    return formatted, date_keys
+
+# Векторное преобразование колонок в cleaned DataFrame (city_mapping - стандартизация названий городов).
+# Возвращает (DataFrame, даты записей YYYY-MM-DD, проблемы)
+def transform_columns(columns, city_mapping):
+    n = len(columns['timestamp'])
+    if n == 0:
+        return pd.DataFrame(columns=cleaned_columns), np.array([], dtype='U10'), []
+
+    temp_raw, bad = _to_float(columns['temp'], required=True)
+    feels_like_raw, bad_feels_like = _to_float(columns['feels_like'], required=True)
+    pressure_raw, bad_pressure = _to_float(columns['pressure'], required=True)
+    temp_min_raw, bad_temp_min = _to_float(columns['temp_min'], required=False)
+    temp_max_raw, bad_temp_max = _to_float(columns['temp_max'], required=False)
+    bad = bad | bad_feels_like | bad_pressure | bad_temp_min | bad_temp_max
+    problems = [f"Запись {columns['timestamp'][i]} ({columns['city'][i]}) пропущена: некорректное числовое значение"
+                for i in np.flatnonzero(bad)]
+
+    # Фильтрация записей с температурой вне диапазона -50..+60°C и некорректных записей
+    temp = np.rint(temp_raw)
+    keep = (temp >= -50) & (temp <= 60) & ~bad
+    keep_idx = np.flatnonzero(keep)
+    collection_time, date_keys = _format_timestamps(columns['timestamp'])
+
+    # Необработанные колонки берём только по оставшимся строкам, чтобы pandas вывел их типы
+    # так же, как pd.DataFrame(records) в построчном пути (например, visibility без пропусков -> int64)
+    def kept(values):
+        if len(keep_idx) == n:
+            return values
+        values = np.asarray(values, dtype=object)[keep_idx]
+        return values.tolist()
+
+    city = pd.Series(kept(columns['city']), dtype=object)
+    df = pd.DataFrame({
+        'city_name': city.map(city_mapping).fillna(city).to_numpy(),
+        # Округление температуры, feels_like и давления (hPa -> мм.рт.ст.)
+        'temperature': temp[keep_idx].astype(np.int64),
+        'feels_like': np.rint(feels_like_raw[keep_idx]).astype(np.int64),
+        'humidity': kept(columns['humidity']),
+        'pressure': np.rint(pressure_raw[keep_idx] * 0.750062).astype(np.int64),
+        'wind_speed': kept(columns['wind_speed']),
+        'weather_description': kept(columns['weather_description']),
+        'visibility': kept(columns['visibility']),
+        'pop': [None] * len(keep_idx),  # Для текущей погоды pop нет, но оставлено для совместимости
+        'clouds': kept(columns['clouds']),
+        'temp_min': _round_column(temp_min_raw[keep_idx]),
+        'temp_max': _round_column(temp_max_raw[keep_idx]),
+        'collection_time': collection_time[keep_idx].astype(object),
+        'timestamp': kept(columns['timestamp'])
+    }, columns=cleaned_columns)
+    return df, date_keys[keep_idx], problems
+
+def _chunks(items, n_chunks):
+    size = max(1, -(-len(items) // n_chunks))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+# Очистка набора raw источников (см. clean_data.plan_raw_sources) с раскладкой по датам.
+# Возвращает словарь: frames (дата -> DataFrame), counts_original (дата -> число исходных записей),
+# problems, lines_read (ключ источника -> прочитано строк), max_timestamp (для водяного знака)
+def clean_sources(sources, dates, city_mapping, workers=None):
+    workers = workers or os.cpu_count() or 1
+    dates = set(dates)
+
+    if workers > 1 and len(sources) >= min_sources_for_pool:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parts = list(executor.map(parse_sources, _chunks(sources, workers * 4)))
+    else:
+        parts = [parse_sources(sources)]
+
+    columns = _empty_columns()
+    failed_timestamps = []
+    problems = []
+    lines_read = {}
+    for part_columns, part_failed, part_problems, part_lines in parts:
+        for name, values in part_columns.items():
+            columns[name].extend(values)
+        failed_timestamps.extend(part_failed)
+        problems.extend(part_problems)
+        lines_read.update(part_lines)
+
+    # Даты всех разобранных записей (до фильтра по температуре) - для счётчика исходных записей
+    all_timestamps = columns['timestamp'] + failed_timestamps
+    _, all_date_keys = _format_timestamps(all_timestamps)
+    target_keys = {d.isoformat(): d for d in dates}
+    in_range = np.isin(all_date_keys, list(target_keys))
+    keys, key_counts = np.unique(all_date_keys[in_range], return_counts=True)
+    key_counts = dict(zip(keys.tolist(), key_counts.tolist()))
+    counts_original = {d: key_counts.get(key, 0) for key, d in target_keys.items()}
+    # Водяной знак: ISO timestamp начинаются с YYYY-MM-DD, поэтому строковый максимум даёт верную дату
+    max_timestamp = None
+    if in_range.any():
+        max_timestamp = max(np.asarray(all_timestamps, dtype=object)[in_range])
+
+    # Преобразуем каждую дату отдельно: типы колонок выводятся по записям дня, как в построчном пути
+    record_date_keys = all_date_keys[:len(columns['timestamp'])]
+    frames = {}
+    for key, d in target_keys.items():
+        idx = np.flatnonzero(record_date_keys == key)
+        if len(idx) == len(record_date_keys):
+            day_columns = columns
+        else:
+            day_columns = {name: np.asarray(values, dtype=object)[idx].tolist() for name, values in columns.items()}
+        frames[d], _, transform_problems = transform_columns(day_columns, city_mapping)
+        problems.extend(transform_problems)
+    return {
+        'frames': frames,
+        'counts_original': counts_original,
+        'problems': problems,
+        'lines_read': lines_read,
+        'max_timestamp': max_timestamp
+    }
@@ -1,12 +1,19 @@
 import json
 import os
+import argparse
 import pandas as pd
 from datetime import datetime, timedelta
 
+import raw_storage
+import ingest_manifest
+import clean_batch
+import columnar_storage
+
 # Папки (относительные пути от scripts/ к data/)
 raw_dir = os.path.join(os.path.dirname(__file__), '..', 'data', 'raw', 'openweather_api')
 cleaned_dir = os.path.join(os.path.dirname(__file__), '..', 'data', 'cleaned')
 log_dir = cleaned_dir  # Лог в той же папке, что и cleaned
+manifest_path = os.path.join(cleaned_dir, 'ingest_manifest.json')  # Манифест инкрементальной загрузки
 
 # Создаем папки, если не существуют
 os.makedirs(cleaned_dir, exist_ok=True)
@@ -79,88 +86,229 @@ def process_json_file(data):
     
     return records
 
-# Основная функция (чтение JSON, очистка, преобразование, обогащение и сохранение в CSV)
-def clean_weather_data():
+# Папка партиции raw слоя YYYY/MM/DD
+def raw_partition_dir(dt):
+    return os.path.join(raw_dir, dt.strftime("%Y"), dt.strftime("%m"), dt.strftime("%d"))
+
+# Список raw источников, которые нужно прочитать: новые JSON файлы и сегменты с новыми строками
+# в партициях, где по манифесту могут быть новые данные за указанные даты
+def plan_raw_sources(manifest, dates):
+    sources = []
+    for partition_date in ingest_manifest.partitions_to_scan(manifest, dates):
+        partition_dir = raw_partition_dir(partition_date)
+        if not os.path.isdir(partition_dir):
+            continue
+        for file in sorted(os.listdir(partition_dir)):
+            filepath = os.path.join(partition_dir, file)
+            key = ingest_manifest.source_key(raw_dir, filepath)
+            if file.endswith('.json'):
+                # Raw JSON файлы неизменяемы: уже обработанный файл пропускаем
+                if ingest_manifest.processed_records(manifest, key) is None:
+                    sources.append({'kind': 'json', 'path': filepath, 'key': key, 'skip_lines': 0})
+            elif raw_storage.is_segment_file(file):
+                # Сегменты только дописываются: читаем строки после уже обработанных
+                if ingest_manifest.source_unchanged(manifest, key, filepath):
+                    continue
+                # По индексу сегмента пропускаем сегменты без записей за нужные даты, не читая их
+                if not raw_storage.segment_may_contain(raw_storage.read_segment_index(filepath), dates):
+                    continue
+                skip_lines = ingest_manifest.processed_records(manifest, key) or 0
+                sources.append({'kind': 'segment', 'path': filepath, 'key': key, 'skip_lines': skip_lines})
+    return sources
+
+# Типы применяемых правил (для лога очистки)
+cleaning_rules = [
+    "Стандартизация названия города на русский язык",
+    "Округление температуры, feels_like до целого числа",
+    "Конвертация давления из hPa в мм.рт.ст.",
+    "Фильтрация записей с температурой вне диапазона -50..+60°C",
+    "Форматирование collection_time в DD.MM.YYYY hh:mm:ss",
+    "Обогащение новыми полями (visibility, clouds, temp_min, temp_max)"
+]
+
+# Чтение и очистка raw источников с раскладкой записей по датам (только даты из dates).
+# engine='batch' - пакетный движок clean_batch.py (пул процессов + векторные преобразования).
+# Возвращает словарь: records_by_date, counts_original, problems, lines_read, max_timestamp
+def read_raw_sources(sources, dates, engine='python', workers=None):
+    if engine == 'batch':
+        result = clean_batch.clean_sources(sources, dates, city_mapping, workers=workers)
+        result['records_by_date'] = result.pop('frames')
+        return result
+    
     problems = []
-    rules = [
-        "Стандартизация названия города на русский язык",
-        "Округление температуры, feels_like до целого числа",
-        "Конвертация давления из hPa в мм.рт.ст.",
-        "Фильтрация записей с температурой вне диапазона -50..+60°C",
-        "Форматирование collection_time в DD.MM.YYYY hh:mm:ss",
-        "Обогащение новыми полями (visibility, clouds, temp_min, temp_max)"
-    ]
+    # Словарь для хранения записей по датам
+    records_by_date = {dt: [] for dt in dates}
+    counts_original = {dt: 0 for dt in dates}
+    lines_read = {}
+    max_timestamp = None
+    
+    # Обработка одной raw записи (из отдельного JSON файла или строки сегмента)
+    def handle_record(data, source_name):
+        nonlocal max_timestamp
+        # Получаем дату из timestamp внутри JSON
+        timestamp_str = data.get('timestamp')
+        if not timestamp_str:
+            problems.append(f"Запись из {source_name} пропущена: отсутствует timestamp")
+            return
+        dt_obj = datetime.fromisoformat(timestamp_str)
+        file_date = dt_obj.date()
+        
+        # Фильтруем только нужные даты
+        if file_date not in records_by_date:
+            return
+        
+        counts_original[file_date] += 1  # Каждый JSON — одна запись (текущая погода)
+        records = process_json_file(data)
+        records_by_date[file_date].extend(records)
+        if max_timestamp is None or dt_obj > datetime.fromisoformat(max_timestamp):
+            max_timestamp = timestamp_str
+    
+    for source in sources:
+        filepath = source['path']
+        file = os.path.basename(filepath)
+        if source['kind'] == 'json':
+            try:
+                with open(filepath, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                # Источник отмечается только после успешного чтения: недописанный файл прочитается в следующий раз
+                lines_read[source['key']] = 1
+                handle_record(data, f"файла {file}")
+            except Exception as e:
+                problems.append(f"Ошибка чтения файла {filepath}: {e}")
+        else:
+            try:
+                segment_records, segment_errors, lines_read[source['key']] = raw_storage.read_segment(filepath, skip_lines=source['skip_lines'])
+                problems.extend(segment_errors)
+                for data in segment_records:
+                    try:
+                        handle_record(data, f"сегмента {file}")
+                    except Exception as e:
+                        problems.append(f"Ошибка обработки записи из сегмента {filepath}: {e}")
+            except Exception as e:
+                problems.append(f"Ошибка чтения сегмента {filepath}: {e}")
+    return {
+        'records_by_date': records_by_date,
+        'counts_original': counts_original,
+        'problems': problems,
+        'lines_read': lines_read,
+        'max_timestamp': max_timestamp
+    }
+
+# Путь к cleaned файлу за дату в текущем формате слоя (LAYER_FORMAT: csv или parquet)
+def cleaned_file_path(date_str):
+    return columnar_storage.layer_file_path(cleaned_dir, columnar_storage.cleaned_prefix, date_str)
+
+# Сохранение очищенных записей за дату в CSV/parquet и лога очистки.
+# append=True - записи дописываются в существующий файл; totals - накопленные счётчики за дату для лога
+def save_cleaned_day(dt, day_records, totals, problems, append=False):
+    # Формат даты для имени файла
+    date_str = dt.strftime("%Y%m%d")
+    csv_path = cleaned_file_path(date_str)
+    
+    # Сохранить CSV или parquet (пакетный движок возвращает готовый DataFrame)
+    df = day_records if isinstance(day_records, pd.DataFrame) else pd.DataFrame(day_records)
+    if append:
+        columnar_storage.append_layer(df, csv_path, columnar_storage.cleaned_schema)
+    else:
+        columnar_storage.write_layer(df, csv_path, columnar_storage.cleaned_schema)
     
+    # Лог
+    log_filename = f"cleaning_log_{date_str}.txt"
+    log_path = os.path.join(log_dir, log_filename)
+    with open(log_path, 'w', encoding='utf-8') as log_file:
+        log_file.write(f"Количество исходных записей: {totals['original']}\n")
+        log_file.write(f"Количество очищенных записей: {totals['cleaned']}\n")
+        log_file.write("Типы примененных правил:\n")
+        for rule in cleaning_rules:
+            log_file.write(f"- {rule}\n")
+        log_file.write("Найденные проблемы:\n")
+        for problem in problems:
+            log_file.write(f"- {problem}\n")
+    
+    if append:
+        print(f"Новые очищенные данные за {dt.strftime('%Y-%m-%d')} ({len(df)} записей) дописаны в {csv_path}")
+    else:
+        print(f"Очищенные данные за {dt.strftime('%Y-%m-%d')} сохранены в {csv_path}")
+    print(f"Лог сохранен в {log_path}")
+
+# Основная функция (чтение JSON, очистка, преобразование, обогащение и сохранение в CSV или parquet).
+# В инкрементальном режиме по манифесту читаются только новые raw файлы и новые строки сегментов
+# и только в партициях YYYY/MM/DD, где они могут появиться; новые записи дописываются в cleaned CSV.
+# incremental=False - полная пересборка дат за вчера и сегодня (манифест создаётся заново).
+def clean_weather_data(incremental=True, engine='python', workers=None):
     # Определяем даты сегодня и вчера
     today = datetime.today().date()
     yesterday = today - timedelta(days=1)
     
-    # Словарь для хранения записей по датам
-    records_by_date = {today: [], yesterday: []}
-    counts_original = {today: 0, yesterday: 0}
+    manifest = ingest_manifest.load_manifest(manifest_path) if incremental else ingest_manifest.empty_manifest()
+    # Если cleaned CSV за дату пропал или не совпадает с отпечатком из манифеста (прошлый запуск упал между
+    # дописыванием и сохранением манифеста), дату нужно собрать заново целиком - иначе строки задвоятся
+    for dt in [yesterday, today]:
+        date_str = dt.strftime("%Y%m%d")
+        if not ingest_manifest.date_counts(manifest, date_str):
+            continue
+        csv_path = cleaned_file_path(date_str)
+        if not os.path.exists(csv_path):
+            ingest_manifest.forget_dates(manifest, [dt])
+        elif not ingest_manifest.cleaned_unchanged(manifest, date_str, csv_path):
+            print(f"WARNING: {csv_path} изменился после сохранения манифеста - дата пересобирается целиком")
+            ingest_manifest.forget_dates(manifest, [dt])
     
-    # Найти все JSON файлы (только чтение, без изменений)
-    for root, dirs, files in os.walk(raw_dir):
-        for file in files:
-            if file.endswith('.json'):
-                filepath = os.path.join(root, file)
-                try:
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                    
-                    # Получаем дату из timestamp внутри JSON
-                    timestamp_str = data.get('timestamp')
-                    if not timestamp_str:
-                        problems.append(f"Файл {file} пропущен: отсутствует timestamp")
-                        continue
-                    dt_obj = datetime.fromisoformat(timestamp_str)
-                    file_date = dt_obj.date()
-                    
-                    # Фильтруем только сегодня и вчера
-                    if file_date not in records_by_date:
-                        continue
-                    
-                    counts_original[file_date] += 1  # Каждый JSON — одна запись (текущая погода)
-                    records = process_json_file(data)
-                    records_by_date[file_date].extend(records)
-                except Exception as e:
-                    problems.append(f"Ошибка чтения файла {filepath}: {e}")
+    # Сканируем только партиции, в которых могут быть новые данные (только чтение, без изменений)
+    sources = plan_raw_sources(manifest, [yesterday, today])
+    result = read_raw_sources(sources, [yesterday, today], engine=engine, workers=workers)
+    for source in sources:
+        if source['key'] in result['lines_read']:
+            ingest_manifest.mark_source(manifest, source['key'], source['path'], result['lines_read'][source['key']])
+    if result['max_timestamp']:
+        ingest_manifest.advance_watermark(manifest, result['max_timestamp'])
+    print(f"Прочитано новых raw источников: {len(sources)} (водяной знак: {manifest.get('watermark')})")
     
     # Сохраняем по отдельности для каждой даты
     for dt in [yesterday, today]:
-        day_records = records_by_date[dt]
-        total_cleaned = len(day_records)
-        total_original = counts_original[dt]
-        
-        if not day_records:
-            print(f"Нет данных для даты {dt.strftime('%Y-%m-%d')}")
-            continue
-        
-        # Формат даты для имени файла
+        day_records = result['records_by_date'][dt]
         date_str = dt.strftime("%Y%m%d")
+        csv_path = cleaned_file_path(date_str)
         
-        # Сохранить CSV
-        df = pd.DataFrame(day_records)
-        csv_filename = f"weather_cleaned_{date_str}.csv"
-        csv_path = os.path.join(cleaned_dir, csv_filename)
-        df.to_csv(csv_path, index=False, encoding='utf-8')
+        # Дата уже загружалась раньше - новые записи дописываем в существующий CSV
+        append = ingest_manifest.date_counts(manifest, date_str) is not None and os.path.exists(csv_path)
+        ingest_manifest.add_date_counts(manifest, date_str, result['counts_original'][dt], len(day_records))
         
-        # Лог
-        log_filename = f"cleaning_log_{date_str}.txt"
-        log_path = os.path.join(log_dir, log_filename)
-        with open(log_path, 'w', encoding='utf-8') as log_file:
-            log_file.write(f"Количество исходных записей: {total_original}\n")
-            log_file.write(f"Количество очищенных записей: {total_cleaned}\n")
-            log_file.write("Типы примененных правил:\n")
-            for rule in rules:
-                log_file.write(f"- {rule}\n")
-            log_file.write("Найденные проблемы:\n")
-            for problem in problems:
-                log_file.write(f"- {problem}\n")
+        if len(day_records) == 0:
+            if append:
+                print(f"Нет новых данных для даты {dt.strftime('%Y-%m-%d')}")
+            else:
+                print(f"Нет данных для даты {dt.strftime('%Y-%m-%d')}")
+            continue
         
-        print(f"Очищенные данные за {dt.strftime('%Y-%m-%d')} сохранены в {csv_path}")
-        print(f"Лог сохранен в {log_path}")
+        # Лог содержит счётчики, накопленные по всем запускам за дату
+        save_cleaned_day(dt, day_records, ingest_manifest.date_counts(manifest, date_str), result['problems'], append=append)
+        ingest_manifest.mark_cleaned(manifest, date_str, csv_path)
+    
+    # Партиции старше вчерашней больше не сканируются - убираем их из манифеста
+    ingest_manifest.prune(manifest, yesterday)
+    ingest_manifest.save_manifest(manifest_path, manifest)
+
+# Полная пересборка одной даты из её raw партиции (идемпотентно: CSV и лог перезаписываются).
+# Используется backfill.py; манифест инкрементальной загрузки не трогает.
+# Возвращает (количество исходных записей, количество очищенных записей)
+def clean_weather_data_for_date(dt, engine='python', workers=1):
+    sources = plan_raw_sources(ingest_manifest.empty_manifest(), [dt])
+    result = read_raw_sources(sources, [dt], engine=engine, workers=workers)
+    day_records = result['records_by_date'][dt]
+    totals = {'original': result['counts_original'][dt], 'cleaned': len(day_records)}
+    if len(day_records) == 0:
+        print(f"Нет данных для даты {dt.strftime('%Y-%m-%d')}")
+        return totals['original'], 0
+    save_cleaned_day(dt, day_records, totals, result['problems'])
+    return totals['original'], totals['cleaned']
 
 # Запуск
 if __name__ == "__main__":
-    clean_weather_data()
+    parser = argparse.ArgumentParser(description="Очистка raw данных за вчера и сегодня")
+    parser.add_argument('--full', action='store_true', help="Полная пересборка без учёта манифеста инкрементальной загрузки")
+    parser.add_argument('--engine', choices=['python', 'batch'], default=os.getenv('CLEAN_ENGINE', 'python'),
+                        help="python - построчная обработка, batch - пул процессов и векторные преобразования")
+    parser.add_argument('--workers', type=int, default=None, help="Количество процессов для --engine batch")
+    args = parser.parse_args()
+    clean_weather_data(incremental=not args.full, engine=args.engine, workers=args.workers)
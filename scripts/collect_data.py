@@ -1,8 +1,16 @@
 import os
 import json
+import time
+import random
+import argparse
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
+from raw_storage import SegmentStore
+
 # Список городов
 cities = ["Moscow", "Saint Petersburg", "Sochi", "Kazan", "Novosibirsk"]
 
@@ -10,56 +18,226 @@ cities = ["Moscow", "Saint Petersburg", "Sochi", "Kazan", "Novosibirsk"]
 raw_dir = os.path.join(os.path.dirname(__file__), '..', 'data', 'raw', 'openweather_api')
 log_file_path = os.path.join(raw_dir, "data_collection.txt")
 
+# Адрес API (можно переопределить, например, на локальный mock-сервер для бенчмарков)
+api_url = os.getenv('OPENWEATHER_API_URL', "https://api.openweathermap.org/data/2.5/weather")
+
+# Настройки конкурентного режима (по умолчанию рассчитаны на бесплатный тариф OpenWeather: 60 запросов в минуту)
+default_concurrency = int(os.getenv('OPENWEATHER_CONCURRENCY', '8'))
+default_rate_per_minute = float(os.getenv('OPENWEATHER_RATE_PER_MINUTE', '60'))
+default_max_retries = int(os.getenv('OPENWEATHER_MAX_RETRIES', '3'))
+
+# Формат raw слоя: files - отдельный JSON на город и запуск, segments - дневные JSONL-сегменты (см. raw_storage.py)
+default_storage = os.getenv('RAW_STORAGE', 'files')
+# Сколько записей копится в памяти до дописывания в сегмент (при падении теряется не больше одной пачки)
+default_segment_batch = int(os.getenv('RAW_SEGMENT_BATCH', '100'))
+
+# Статусы, при которых имеет смысл повторить запрос
+retry_statuses = {429, 500, 502, 503, 504}
+
+# Лок для записи в лог из нескольких потоков
+log_lock = threading.Lock()
+
 def log_message(message):
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     log_entry = f"[{timestamp}] {message}"
-    print(log_entry)  # вывод в консоль (GitHub Actions лог)
-    os.makedirs(raw_dir, exist_ok=True)
-    with open(log_file_path, "a", encoding="utf-8") as log_file:
-        log_file.write(log_entry + "\n")
+    with log_lock:
+        print(log_entry)  # вывод в консоль (GitHub Actions лог)
+        os.makedirs(raw_dir, exist_ok=True)
+        with open(log_file_path, "a", encoding="utf-8") as log_file:
+            log_file.write(log_entry + "\n")
+
+# Добавляем метаданные к ответу API
+def add_metadata(city, data, current_datetime):
+    data['city'] = city
+    data['timestamp'] = current_datetime.isoformat()
+    data['source'] = 'openweathermap.org'
+    return data
+
+# Сохранение ответа API для одного города в raw слой (отдельным JSON файлом)
+def save_weather_data(city, data, current_datetime):
+    add_metadata(city, data, current_datetime)
+
+    city_safe = city.replace(" ", "_")
+    dir_path = os.path.join(raw_dir, current_datetime.strftime("%Y"), current_datetime.strftime("%m"), current_datetime.strftime("%d"))
+    os.makedirs(dir_path, exist_ok=True)
+
+    filename = f"weather_{city_safe}_{current_datetime.strftime('%Y%m%d_%H%M')}.json"
+    filepath = os.path.join(dir_path, filename)
+
+    with open(filepath, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+    return filepath
+
+# Раскладка полученных ответов по выбранному формату raw слоя.
+# В режиме segments записи копятся в памяти и дописываются в сегмент пачками по batch_size записей;
+# остаток дописывает flush() в конце запуска (вызывается и при ошибке).
+class RawWriter:
+    def __init__(self, storage, current_datetime, batch_size=None):
+        if storage not in ('files', 'segments'):
+            raise ValueError(f"Неизвестный формат raw слоя: {storage}")
+        self.current_datetime = current_datetime
+        self.store = SegmentStore(raw_dir) if storage == 'segments' else None
+        self.batch_size = batch_size or default_segment_batch
+        self.pending = []
+        self.lock = threading.Lock()
 
-def collect_and_save_weather_data(cities, api_key):
+    def save(self, city, data):
+        if self.store is None:
+            filepath = save_weather_data(city, data, self.current_datetime)
+            log_message(f"SUCCESS: Данные для {city} сохранены в {filepath}")
+            return
+        with self.lock:
+            self.pending.append(add_metadata(city, data, self.current_datetime))
+            if len(self.pending) >= self.batch_size:
+                self._write_pending()
+        log_message(f"SUCCESS: Данные для {city} получены")
+
+    def flush(self):
+        if self.store is None:
+            return
+        with self.lock:
+            self._write_pending()
+
+    # Дописывание накопленных записей в сегменты (вызывается под self.lock)
+    def _write_pending(self):
+        if not self.pending:
+            return
+        segments = self.store.append(self.pending)
+        log_message(f"SUCCESS: {len(self.pending)} записей дописано в сегменты: {', '.join(segments)}")
+        self.pending = []
+
+def collect_and_save_weather_data(cities, api_key, storage=None):
     current_datetime = datetime.now()
-    timestamp_str = current_datetime.strftime("%Y%m%d_%H%M")
-    year = current_datetime.strftime("%Y")
-    month = current_datetime.strftime("%m")
-    day = current_datetime.strftime("%d")
-
-    for city in cities:
-        url = "https://api.openweathermap.org/data/2.5/weather"
-        params = {
-            'q': city,
-            'appid': api_key,
-            'units': 'metric',
-            'lang': 'ru'
-        }
+    writer = RawWriter(storage or default_storage, current_datetime)
+
+    try:
+        for city in cities:
+            params = {
+                'q': city,
+                'appid': api_key,
+                'units': 'metric',
+                'lang': 'ru'
+            }
+            try:
+                response = requests.get(api_url, params=params)
+                if response.status_code == 200:
+                    writer.save(city, response.json())
+                else:
+                    log_message(f"ERROR: Для {city} получен статус {response.status_code}")
+            except Exception as e:
+                log_message(f"EXCEPTION: Ошибка при получении данных для {city}: {e}")
+    finally:
+        writer.flush()
+
+# Token bucket: не более rate_per_minute запросов в минуту, допускается всплеск до burst запросов
+class TokenBucket:
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60.0  # токенов в секунду
+        self.capacity = float(burst if burst is not None else max(1, int(self.rate)))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+# Экспоненциальная задержка с "full jitter": случайное время от 0 до base * 2^attempt (не более cap)
+def backoff_delay(attempt, base=0.5, cap=30.0):
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+# Создание сессии с пулом соединений, общим для всех потоков
+def create_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+# Запрос погоды для одного города с учётом rate limit и повторов
+def fetch_city_weather(session, city, api_key, bucket, max_retries, timeout=10):
+    params = {
+        'q': city,
+        'appid': api_key,
+        'units': 'metric',
+        'lang': 'ru'
+    }
+    attempt = 0
+    while True:
+        bucket.acquire()
         try:
-            response = requests.get(url, params=params)
+            response = session.get(api_url, params=params, timeout=timeout)
             if response.status_code == 200:
-                data = response.json()
-                # Добавляем метаданные
-                data['city'] = city
-                data['timestamp'] = current_datetime.isoformat()
-                data['source'] = 'openweathermap.org'
+                return response.json(), None
+            if response.status_code not in retry_statuses or attempt >= max_retries:
+                return None, f"получен статус {response.status_code}"
+            # Уважаем Retry-After, если сервер его прислал
+            retry_after = response.headers.get('Retry-After')
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else backoff_delay(attempt)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt >= max_retries:
+                return None, f"сетевая ошибка: {e}"
+            delay = backoff_delay(attempt)
+        attempt += 1
+        time.sleep(delay)
 
-                city_safe = city.replace(" ", "_")
-                dir_path = os.path.join(raw_dir, year, month, day)
-                os.makedirs(dir_path, exist_ok=True)
+# Конкурентный сбор: пул потоков + одна сессия с пулом соединений + token bucket + повторы с jitter
+def collect_and_save_weather_data_concurrent(cities, api_key, concurrency=None, rate_per_minute=None, max_retries=None, storage=None):
+    concurrency = concurrency or default_concurrency
+    rate_per_minute = rate_per_minute or default_rate_per_minute
+    max_retries = default_max_retries if max_retries is None else max_retries
 
-                filename = f"weather_{city_safe}_{timestamp_str}.json"
-                filepath = os.path.join(dir_path, filename)
-
-                with open(filepath, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, ensure_ascii=False, indent=4)
+    current_datetime = datetime.now()
+    writer = RawWriter(storage or default_storage, current_datetime)
+    bucket = TokenBucket(rate_per_minute)
+    session = create_session(concurrency)
+    succeeded = 0
 
-                log_message(f"SUCCESS: Данные для {city} сохранены в {filepath}")
-            else:
-                log_message(f"ERROR: Для {city} получен статус {response.status_code}")
-        except Exception as e:
-            log_message(f"EXCEPTION: Ошибка при получении данных для {city}: {e}")
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = {
+                executor.submit(fetch_city_weather, session, city, api_key, bucket, max_retries): city
+                for city in cities
+            }
+            for future in as_completed(futures):
+                city = futures[future]
+                try:
+                    data, error = future.result()
+                    if data is None:
+                        log_message(f"ERROR: Для {city} {error}")
+                        continue
+                    writer.save(city, data)
+                    succeeded += 1
+                except Exception as e:
+                    log_message(f"EXCEPTION: Ошибка при получении данных для {city}: {e}")
+    finally:
+        writer.flush()
+        session.close()
+    return succeeded
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сбор текущей погоды из OpenWeather API")
+    parser.add_argument('--mode', choices=['sequential', 'concurrent'], default=os.getenv('OPENWEATHER_COLLECT_MODE', 'sequential'),
+                        help="sequential - по одному городу, concurrent - пул потоков с общим пулом соединений")
+    parser.add_argument('--concurrency', type=int, default=default_concurrency, help="Максимум одновременных запросов")
+    parser.add_argument('--rate-per-minute', type=float, default=default_rate_per_minute, help="Лимит запросов в минуту (квота API)")
+    parser.add_argument('--max-retries', type=int, default=default_max_retries, help="Количество повторов при 429/5xx и сетевых ошибках")
+    parser.add_argument('--storage', choices=['files', 'segments'], default=default_storage,
+                        help="files - JSON на город и запуск, segments - дописывание в дневные JSONL-сегменты")
+    args = parser.parse_args()
+
     api_key = os.getenv('OPENWEATHER_API_KEY')
     if not api_key:
         raise ValueError("API ключ не найден! Установите переменную окружения OPENWEATHER_API_KEY")
-    collect_and_save_weather_data(cities, api_key)
+    if args.mode == 'concurrent':
+        collect_and_save_weather_data_concurrent(cities, api_key, args.concurrency, args.rate_per_minute, args.max_retries, args.storage)
+    else:
+        collect_and_save_weather_data(cities, api_key, args.storage)
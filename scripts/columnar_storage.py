@@ -0,0 +1,255 @@
+import os
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow нужен только при LAYER_FORMAT=parquet
+    pa = None
+    pq = None
+
+# Формат хранения cleaned и enriched слоёв.
+# csv - как раньше (weather_cleaned_YYYYMMDD.csv), parquet - типизированные колоночные файлы,
+# по одному на дату (weather_cleaned_YYYYMMDD.parquet) с явной схемой: целые температуры,
+# словарные (категориальные) строки и collection_time как datetime.
+# Читатели получают только нужные колонки (projection) и фильтры, которые для parquet
+# проверяются по статистике row group ещё до чтения данных (predicate pushdown).
+# Если за дату есть оба файла, используется parquet - это позволяет переключать формат без пересборки истории.
+
+layer_formats = {'csv': '.csv', 'parquet': '.parquet'}
+default_layer_format = os.getenv('LAYER_FORMAT', 'csv')
+
+cleaned_prefix = 'weather_cleaned_'
+enriched_prefix = 'weather_enriched_'
+
+collection_time_format = '%d.%m.%Y %H:%M:%S'
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("Для LAYER_FORMAT=parquet установите пакет pyarrow (pip install pyarrow)")
+
+def _category():
+    return pa.dictionary(pa.int32(), pa.string())
+
+# Явные схемы слоёв (колонки вне схемы сохраняются с выведенным типом)
+def cleaned_schema():
+    _require_pyarrow()
+    return pa.schema([
+        ('city_name', _category()),
+        ('temperature', pa.int64()),
+        ('feels_like', pa.int64()),
+        ('humidity', pa.int64()),
+        ('pressure', pa.int64()),
+        ('wind_speed', pa.float64()),
+        ('weather_description', _category()),
+        ('visibility', pa.int64()),
+        ('pop', pa.float64()),
+        ('clouds', pa.int64()),
+        ('temp_min', pa.int64()),
+        ('temp_max', pa.int64()),
+        ('collection_time', pa.timestamp('s')),
+        ('timestamp', pa.string())  # Исходная ISO строка, хранится без изменений
+    ])
+
+def enriched_schema():
+    return pa.schema(list(cleaned_schema()) + [
+        ('federal_district', _category()),
+        ('tourism_season', _category()),
+        ('timezone', _category()),
+        ('population', pa.int64()),
+        ('comfort_index', pa.float64()),
+        ('recommended_activity', _category()),
+        ('tourist_season_match', _category())
+    ])
+
+def layer_file_path(directory, prefix, date_str, layer_format=None):
+    layer_format = layer_format or default_layer_format
+    if layer_format not in layer_formats:
+        raise ValueError(f"Неизвестный формат слоя: {layer_format}. Допустимо: {', '.join(layer_formats)}")
+    return os.path.join(directory, f"{prefix}{date_str}{layer_formats[layer_format]}")
+
+# Файлы слоя по датам: {YYYYMMDD: путь}; при наличии обоих форматов за дату берётся parquet
+def find_layer_files(directory, prefix):
+    files = {}
+    for file in sorted(os.listdir(directory)):
+        for layer_format, extension in layer_formats.items():
+            if file.startswith(prefix) and file.endswith(extension):
+                date_part = file[len(prefix):-len(extension)]
+                if len(date_part) == 8 and date_part.isdigit():
+                    if layer_format == 'parquet' or date_part not in files:
+                        files[date_part] = os.path.join(directory, file)
+                else:
+                    print(f"WARNING: Неверный формат даты в файле {file}, пропускаем")
+    return files
+
+# Разбор collection_time из текста. Основной формат - DD.MM.YYYY HH:MM:SS; значения, которые в нём не разобрались,
+# пробуются как ISO (так попадали в CSV данные, прочитанные из parquet, до форматирования при записи)
+def parse_collection_time(series):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    parsed = pd.to_datetime(series, format=collection_time_format, errors='coerce')
+    retry = parsed.isna() & series.notna()
+    if retry.any():
+        parsed[retry] = pd.to_datetime(series[retry], format='ISO8601', errors='coerce')
+    return parsed
+
+# В CSV collection_time всегда пишется текстом в формате collection_time_format, даже если данные пришли из parquet
+def _csv_frame(df):
+    if 'collection_time' in df.columns and pd.api.types.is_datetime64_any_dtype(df['collection_time']):
+        df = df.assign(collection_time=df['collection_time'].dt.strftime(collection_time_format))
+    return df
+
+def _to_arrow_column(series, field):
+    if field.name == 'collection_time':
+        series = parse_collection_time(series)
+    try:
+        return pa.array(series, type=field.type, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+        print(f"WARNING: Колонка {field.name} не приведена к типу {field.type} ({e}), тип выводится автоматически")
+        return pa.array(series, from_pandas=True)
+
+def _to_arrow_table(df, schema):
+    arrays = []
+    names = []
+    for column in df.columns:
+        if column in schema.names:
+            arrays.append(_to_arrow_column(df[column], schema.field(column)))
+        else:
+            arrays.append(pa.array(df[column], from_pandas=True))
+        names.append(column)
+    return pa.Table.from_arrays(arrays, names=names)
+
+# Запись датафрейма слоя; формат определяется расширением пути.
+# Parquet пишется во временный файл и атомарно подменяет старый
+def write_layer(df, path, schema_func):
+    if path.endswith(layer_formats['csv']):
+        _csv_frame(df).to_csv(path, index=False, encoding='utf-8')
+        return
+    _require_pyarrow()
+    tmp_path = path + '.tmp'
+    pq.write_table(_to_arrow_table(df, schema_func()), tmp_path, compression='zstd')
+    os.replace(tmp_path, path)
+
+# Дописывание строк в файл слоя (CSV - дописывание без заголовка, parquet - перезапись файла целиком)
+def append_layer(df, path, schema_func):
+    if path.endswith(layer_formats['csv']):
+        _csv_frame(df).to_csv(path, mode='a', header=False, index=False, encoding='utf-8')
+        return
+    existing = read_layer([path])
+    if 'collection_time' in df.columns:
+        df = df.assign(collection_time=parse_collection_time(df['collection_time']))
+    write_layer(pd.concat([existing, df], ignore_index=True), path, schema_func)
+
+# Применение фильтров в формате pyarrow ([(колонка, оператор, значение), ...] - условия через И) к датафрейму
+def _filter_mask(df, filters):
+    mask = pd.Series(True, index=df.index)
+    for column, op, value in filters:
+        values = df[column]
+        if op in ('==', '='):
+            mask &= values == value
+        elif op == '!=':
+            mask &= values != value
+        elif op == '<':
+            mask &= values < value
+        elif op == '<=':
+            mask &= values <= value
+        elif op == '>':
+            mask &= values > value
+        elif op == '>=':
+            mask &= values >= value
+        elif op == 'in':
+            mask &= values.isin(value)
+        elif op == 'not in':
+            mask &= ~values.isin(value)
+        else:
+            raise ValueError(f"Неподдерживаемый оператор фильтра: {op}")
+    return mask
+
+def _read_csv(path, columns, filters):
+    usecols = (lambda c: c in columns) if columns is not None else None
+    df = pd.read_csv(path, encoding='utf-8', usecols=usecols)
+    if filters:
+        if 'collection_time' in {f[0] for f in filters} and 'collection_time' in df.columns:
+            # В CSV время хранится текстом - для сравнения с датами приводим его к datetime
+            df['collection_time'] = parse_collection_time(df['collection_time'])
+        df = df[_filter_mask(df, filters)].reset_index(drop=True)
+    return df
+
+def _read_parquet(path, columns, filters, categories):
+    _require_pyarrow()
+    available = pq.read_schema(path).names
+    if columns is not None:
+        columns = [c for c in columns if c in available]
+    df = pq.read_table(path, columns=columns, filters=filters or None).to_pandas()
+    return df if categories else _decode_categories(df)
+
+# Словарные колонки как обычные строки - так же, как после чтения CSV
+def _decode_categories(df):
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype(object)
+    return df
+
+# Чтение файлов слоя (CSV и parquet можно смешивать).
+# columns - какие колонки читать (отсутствующие в файле пропускаются), filters - условия отбора строк,
+# categories=False - словарные колонки parquet возвращаются строками, а не pandas Categorical
+def read_layer_file(path, columns=None, filters=None, categories=False):
+    if path.endswith(layer_formats['parquet']):
+        return _read_parquet(path, columns, filters, categories)
+    return _read_csv(path, columns, filters)
+
+def read_layer(paths, columns=None, filters=None, categories=False):
+    dfs = [read_layer_file(path, columns, filters, categories) for path in paths]
+    if not dfs:
+        return pd.DataFrame(columns=columns or [])
+    return pd.concat(dfs, ignore_index=True)
+
+# Потоковое чтение файла слоя порциями не более chunk_rows строк (память не зависит от размера файла)
+def iter_layer_chunks(path, chunk_rows, columns=None):
+    if path.endswith(layer_formats['parquet']):
+        _require_pyarrow()
+        parquet_file = pq.ParquetFile(path)
+        if columns is not None:
+            columns = [c for c in columns if c in parquet_file.schema_arrow.names]
+        for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=columns):
+            yield _decode_categories(batch.to_pandas())
+        return
+    usecols = (lambda c: c in columns) if columns is not None else None
+    with pd.read_csv(path, encoding='utf-8', usecols=usecols, chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            yield chunk
+
+# Запись файла слоя порциями: данные пишутся во временный файл, который по close() атомарно
+# подменяет итоговый (при ошибке - abort(), старый файл остаётся нетронутым)
+class LayerWriter:
+    def __init__(self, path, schema_func):
+        self.path = path
+        self.tmp_path = path + '.tmp'
+        self.schema_func = schema_func
+        self.is_csv = path.endswith(layer_formats['csv'])
+        self.parquet_writer = None
+        self.rows = 0
+        if not self.is_csv:
+            _require_pyarrow()
+
+    def write(self, df):
+        if self.is_csv:
+            _csv_frame(df).to_csv(self.tmp_path, mode='w' if self.rows == 0 else 'a', header=self.rows == 0, index=False, encoding='utf-8')
+        else:
+            table = _to_arrow_table(df, self.schema_func())
+            if self.parquet_writer is None:
+                self.parquet_writer = pq.ParquetWriter(self.tmp_path, table.schema, compression='zstd')
+            self.parquet_writer.write_table(table.cast(self.parquet_writer.schema))
+        self.rows += len(df)
+
+    def close(self):
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+        if os.path.exists(self.tmp_path):
+            os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
@@ -0,0 +1,118 @@
+import os
+import argparse
+from datetime import datetime, timedelta
+import pandas as pd
+
+import mart_index
+from storage_utils import atomic_write_bytes
+
+# Компактация накопленной истории витрин data/aggregated и истории прогнозов data/models/forecast
+# (forecast_history.csv, см. forecasting.py) по политике хранения:
+# - все снимки за последние keep_all_days дней;
+# - старше - один снимок в день (последний за день) до daily_days дней;
+# - ещё старше - один снимок в неделю (последний за ISO неделю).
+# Снимки берутся из индекса (mart_index.py), оставляемые копируются побайтно без разбора CSV,
+# файл заменяется атомарно, затем индекс пересобирается. Снимки с неразбираемой as_of_date не удаляются.
+
+aggregated_dir = os.path.join(os.path.dirname(__file__), '..', 'data', 'aggregated')
+forecasts_dir = os.path.join(os.path.dirname(__file__), '..', 'data', 'models', 'forecast')
+default_dirs = [aggregated_dir, forecasts_dir]
+
+default_keep_all_days = int(os.getenv('MART_RETENTION_ALL_DAYS', '7'))
+default_daily_days = int(os.getenv('MART_RETENTION_DAILY_DAYS', '365'))
+
+# Какие as_of_date оставить: {as_of_date: время} -> множество as_of_date
+def select_snapshots(times, now, keep_all_days=default_keep_all_days, daily_days=default_daily_days):
+    keep = set()
+    buckets = {}
+    for as_of_date, value in times.items():
+        if pd.isna(value) or value > now - timedelta(days=keep_all_days):
+            keep.add(as_of_date)
+            continue
+        if value > now - timedelta(days=daily_days):
+            bucket = ('day', value.date())
+        else:
+            bucket = ('week',) + tuple(value.isocalendar()[:2])
+        buckets.setdefault(bucket, []).append((value, as_of_date))
+    for snapshots in buckets.values():
+        latest = max(value for value, _ in snapshots)
+        keep.update(as_of_date for value, as_of_date in snapshots if value == latest)
+    return keep
+
+# Компактация одного файла. Возвращает статистику {file, snapshots, dropped_snapshots, rows, dropped_rows, bytes, new_bytes}
+# или None, если у файла нет индекса снимков (нет колонки as_of_date)
+def compact_file(path, now, keep_all_days=default_keep_all_days, daily_days=default_daily_days, dry_run=False):
+    index = mart_index.load_index(path)
+    if index is None:
+        return None
+    snapshots = index['snapshots']
+    dates = list(dict.fromkeys(snapshot['as_of_date'] for snapshot in snapshots))
+    parsed = pd.to_datetime(pd.Series(dates, dtype=object), errors='coerce')
+    keep = select_snapshots(dict(zip(dates, parsed)), now, keep_all_days, daily_days)
+    kept = [snapshot for snapshot in snapshots if snapshot['as_of_date'] in keep]
+
+    with open(path, 'rb') as f:
+        header = f.readline()
+    new_bytes = len(header) + sum(snapshot['length'] for snapshot in kept)
+    stats = {
+        'file': os.path.basename(path),
+        'snapshots': len(dates),
+        'dropped_snapshots': len(dates) - len(keep & set(dates)),
+        'rows': index['rows'],
+        'dropped_rows': index['rows'] - sum(snapshot['rows'] for snapshot in kept),
+        'bytes': index['file_size'],
+        'new_bytes': new_bytes
+    }
+    if dry_run or stats['dropped_snapshots'] == 0:
+        return stats
+
+    data = [header]
+    with open(path, 'rb') as f:
+        for snapshot in kept:
+            f.seek(snapshot['offset'])
+            data.append(f.read(snapshot['length']))
+    # Файл не должен был измениться с момента чтения индекса (иначе дописанный снимок потерялся бы)
+    if os.path.getsize(path) != index['file_size']:
+        print(f"WARNING: {path} изменился во время компактации, пропускаем")
+        stats.update(dropped_snapshots=0, dropped_rows=0, new_bytes=stats['bytes'])
+        return stats
+    atomic_write_bytes(path, b''.join(data))
+    mart_index.rebuild_index(path)
+    return stats
+
+# Компактация всех CSV с индексом снимков в папках directories (по умолчанию - default_dirs)
+def compact_marts(directories=None, now=None, keep_all_days=default_keep_all_days, daily_days=default_daily_days, dry_run=False):
+    directories = directories or default_dirs
+    now = now or datetime.now()
+    results = []
+    for directory in directories:
+        if not os.path.exists(directory):
+            print(f"WARNING: Папка {directory} не найдена, пропускаем")
+            continue
+        for file in sorted(os.listdir(directory)):
+            if not file.endswith('.csv'):
+                continue
+            stats = compact_file(os.path.join(directory, file), now, keep_all_days, daily_days, dry_run)
+            if stats is None:
+                print(f"WARNING: В {file} нет колонки as_of_date, пропускаем")
+                continue
+            results.append(stats)
+            print(f"{stats['file']}: снимков {stats['snapshots']} -> {stats['snapshots'] - stats['dropped_snapshots']}, "
+                  f"строк {stats['rows']} -> {stats['rows'] - stats['dropped_rows']}, байт {stats['bytes']} -> {stats['new_bytes']}")
+
+    reclaimed_bytes = sum(stats['bytes'] - stats['new_bytes'] for stats in results)
+    reclaimed_rows = sum(stats['dropped_rows'] for stats in results)
+    prefix = "Будет освобождено" if dry_run else "Освобождено"
+    print(f"SUCCESS: {prefix} {reclaimed_bytes} байт, {reclaimed_rows} строк "
+          f"(политика: все снимки {keep_all_days} дн., ежедневные до {daily_days} дн., далее еженедельные)")
+    return results
+
+# Запуск
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Компактация истории витрин и прогнозов по политике хранения")
+    parser.add_argument('--keep-all-days', type=int, default=default_keep_all_days, help="Сколько дней хранить все снимки")
+    parser.add_argument('--daily-days', type=int, default=default_daily_days, help="До скольких дней хранить по одному снимку в день")
+    parser.add_argument('--dir', nargs='+', default=default_dirs, help="Папки с витринами и историей прогнозов")
+    parser.add_argument('--dry-run', action='store_true', help="Только показать, сколько будет освобождено")
+    args = parser.parse_args()
+    compact_marts(args.dir, keep_all_days=args.keep_all_days, daily_days=args.daily_days, dry_run=args.dry_run)
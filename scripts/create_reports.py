@@ -1,7 +1,13 @@
 import pandas as pd
+import numpy as np
 import os
+import argparse
 from datetime import datetime
 
+import columnar_storage
+import report_state
+import mart_writer
+
 # Папки (относительные пути от scripts/ к data/)
 enriched_dir = os.path.join(os.path.dirname(__file__), '..', 'data', 'enriched')
 reports_dir = os.path.join(os.path.dirname(__file__), '..', 'data', 'aggregated')  # Переименовано
@@ -10,70 +16,28 @@ log_dir = reports_dir  # Лог в той же папке
 # Создаем папки
 os.makedirs(reports_dir, exist_ok=True)
 
-# Основная функция
-def create_reports():
-    # Найти все enriched CSV файлы
-    enriched_files = [f for f in os.listdir(enriched_dir) if f.startswith("weather_enriched_") and f.endswith(".csv")]
-    if not enriched_files:
-        print("ERROR: Нет enriched CSV файлов в data/enriched/")
-        return
-    
-    # Прочитать и объединить все enriched файлы
-    dfs = []
-    for file in enriched_files:
-        file_path = os.path.join(enriched_dir, file)
-        try:
-            df = pd.read_csv(file_path, encoding='utf-8')
-            dfs.append(df)
-        except Exception as e:
-            print(f"ERROR: Ошибка чтения {file_path}: {e}")
-            continue
-    if not dfs:
-        print("ERROR: Не удалось прочитать ни одного файла")
-        return
-    
-    # Объединить все данные
-    df_all = pd.concat(dfs, ignore_index=True)
-    
-    # Добавить столбец as_of_date (формат YYYY-MM-DD hh:mm)
-    current_as_of_date = datetime.now().strftime('%Y-%m-%d %H:%M')
-    df_all['as_of_date'] = current_as_of_date
-    
-    # Теперь df_all содержит все данные за весь период с as_of_date
-    
+# Состояние инкрементальной агрегации (текущие агрегаты по городам и отпечатки партиций, см. report_state.py)
+state_path = os.path.join(reports_dir, 'report_state.json')
+
+# Витрины по агрегатам городов (df_city_stats - одна строка на город, см. report_state.city_aggregates).
+# Производные колонки считаются векторно, без построчного apply
+def build_marts(df_city_stats, current_as_of_date):
     # Витрина 1: Рейтинг городов для туризма
-    df_city_rating = df_all.groupby('city_name').agg({
-        'comfort_index': 'mean',
-        'recommended_activity': lambda x: x.mode()[0] if not x.mode().empty else 'неизвестно',  # Самая частая активность
-        'tourist_season_match': lambda x: x.mode()[0] if not x.mode().empty else 'неизвестно',
-        'tourism_season': 'first'
-    }).reset_index()
+    # Средний comfort_index, самые частые активность и совпадение сезона, первый tourism_season
+    df_city_rating = df_city_stats[['city_name', 'comfort_index', 'recommended_activity', 'tourist_season_match', 'tourism_season']].copy()
     df_city_rating['comfort_index'] = df_city_rating['comfort_index'].round(2)
-    df_city_rating['tour_recommendation'] = df_city_rating.apply(
-        lambda row: f"{row['recommended_activity']} в сезон" if row['tourist_season_match'] == 'да' else f"{row['recommended_activity']} вне сезона", axis=1
+    df_city_rating['tour_recommendation'] = np.where(
+        df_city_rating['tourist_season_match'] == 'да',
+        df_city_rating['recommended_activity'].astype(str) + " в сезон",
+        df_city_rating['recommended_activity'].astype(str) + " вне сезона"
     )
     df_city_rating = df_city_rating.sort_values('comfort_index').rename(columns={'comfort_index': 'avg_comfort_index'})
     # Добавить as_of_date в витрину
     df_city_rating['as_of_date'] = current_as_of_date
     
-    # Аккумуляция витрины 1
-    city_rating_path = os.path.join(reports_dir, "city_tourism_rating.csv")
-    if os.path.exists(city_rating_path):
-        try:
-            df_existing = pd.read_csv(city_rating_path, encoding='utf-8')
-            df_city_rating = pd.concat([df_existing, df_city_rating], ignore_index=True)
-        except Exception as e:
-            print(f"WARNING: Ошибка чтения существующего {city_rating_path}: {e}. Создадим новый.")
-    df_city_rating.to_csv(city_rating_path, index=False, encoding='utf-8')
-    
     # Витрина 2: Сводка по федеральным округам
     # Сначала группируем по city_name для уникальных городов
-    df_city_agg = df_all.groupby('city_name').agg({
-        'federal_district': 'first',
-        'comfort_index': 'mean',
-        'temperature': 'mean',
-        'recommended_activity': lambda x: x.mode()[0] if not x.mode().empty else 'неизвестно'
-    }).reset_index()
+    df_city_agg = df_city_stats[['city_name', 'federal_district', 'comfort_index', 'temperature', 'recommended_activity']].copy()
     df_city_agg['avg_comfort_index'] = df_city_agg['comfort_index'].round(2)
     df_city_agg['avg_temperature'] = df_city_agg['temperature'].round(2)
     
@@ -95,33 +59,17 @@ def create_reports():
     df_district_summary['comfortable_cities_count'] = df_district_summary['comfortable_cities_count'].astype(int)
     
     # Рекомендация
-    df_district_summary['general_recommendation'] = df_district_summary.apply(
-        lambda row: "Рекомендуется посетить" if row['avg_temperature'] > 10 and row['comfortable_cities_count'] > 0 else "Лучше остаться дома", axis=1
+    df_district_summary['general_recommendation'] = np.where(
+        (df_district_summary['avg_temperature'] > 10) & (df_district_summary['comfortable_cities_count'] > 0),
+        "Рекомендуется посетить", "Лучше остаться дома"
     )
     
     # Добавить as_of_date
     df_district_summary['as_of_date'] = current_as_of_date
     
-    # Аккумуляция витрины 2
-    district_summary_path = os.path.join(reports_dir, "federal_districts_summary.csv")
-    if os.path.exists(district_summary_path):
-        try:
-            df_existing = pd.read_csv(district_summary_path, encoding='utf-8')
-            df_district_summary = pd.concat([df_existing, df_district_summary], ignore_index=True)
-        except Exception as e:
-            print(f"WARNING: Ошибка чтения существующего {district_summary_path}: {e}. Создадим новый.")
-    df_district_summary.to_csv(district_summary_path, index=False, encoding='utf-8')
-    
     # Витрина 3: Отчет для турагентств (travel_recommendations.csv)
     # Группируем по city_name для уникальных
-    df_city_agg2 = df_all.groupby('city_name').agg({
-        'comfort_index': 'mean',
-        'recommended_activity': lambda x: x.mode()[0] if not x.mode().empty else 'неизвестно',
-        'pop': 'mean',
-        'temperature': 'mean',
-        'clouds': 'mean',
-        'humidity': 'mean'
-    }).reset_index()
+    df_city_agg2 = df_city_stats[['city_name', 'comfort_index', 'recommended_activity', 'pop', 'temperature', 'clouds', 'humidity']].copy()
     
     # Топ-3 для поездок: Только города с recommended_activity != "домашний отдых", сортировка по avg_comfort_index descending
     df_for_travel = df_city_agg2[df_city_agg2['recommended_activity'] != "домашний отдых"]
@@ -132,18 +80,20 @@ def create_reports():
     stay_home_cities['comfort_index'] = stay_home_cities['comfort_index'].round(2)
     
     # Объединяем special_recommendations и weather_warnings в additional_notes с маской <Город>: <рекомендация>
-    df_city_agg2['additional_notes'] = df_city_agg2.apply(
-        lambda row: (
-            ("Взять зонт" if row['pop'] > 0.5 else "") +
-            ("; Взять теплую одежду" if row['temperature'] < 10 else "") +
-            ("; Солнцезащитный крем" if row['temperature'] > 25 else "") +
-            ("; Очень холодно, риск обморожения" if row['temperature'] < 0 else "") +
-            ("; Сильные осадки, возможно снег/дождь" if row['pop'] > 0.8 else "") +
-            ("; Плохая видимость из-за тумана/облачности" if row['clouds'] > 80 or row['humidity'] > 90 else "")
-        ).strip("; "), axis=1
-    )
+    notes = pd.Series('', index=df_city_agg2.index, dtype=object)
+    for condition, note in [
+        (df_city_agg2['pop'] > 0.5, "Взять зонт"),
+        (df_city_agg2['temperature'] < 10, "; Взять теплую одежду"),
+        (df_city_agg2['temperature'] > 25, "; Солнцезащитный крем"),
+        (df_city_agg2['temperature'] < 0, "; Очень холодно, риск обморожения"),
+        (df_city_agg2['pop'] > 0.8, "; Сильные осадки, возможно снег/дождь"),
+        ((df_city_agg2['clouds'] > 80) | (df_city_agg2['humidity'] > 90), "; Плохая видимость из-за тумана/облачности")
+    ]:
+        notes = notes + np.where(condition, note, '')
+    df_city_agg2['additional_notes'] = notes.str.strip("; ")
     # Теперь формируем строку с городом: <Город>: <рекомендация>; <Город>: <рекомендация>...
-    additional_notes_str = '; '.join([f"{row['city_name']}: {row['additional_notes']}" for _, row in df_city_agg2[df_city_agg2['additional_notes'] != ''].iterrows()])
+    with_notes = df_city_agg2[df_city_agg2['additional_notes'] != '']
+    additional_notes_str = '; '.join((with_notes['city_name'].astype(str) + ': ' + with_notes['additional_notes']).tolist())
     
     # Создать сводный DataFrame для витрины
     mart3_data = {
@@ -154,23 +104,48 @@ def create_reports():
     df_mart3 = pd.DataFrame(mart3_data)
     # Добавить as_of_date в витрину
     df_mart3['as_of_date'] = current_as_of_date
+    return df_city_rating, df_district_summary, df_mart3
+
+# Основная функция. Enriched партиции читаются только если они новые или изменились,
+# агрегаты по городам берутся из сохранённого состояния; full=True - пересчёт состояния с нуля
+def create_reports(full=False):
+    # Найти все enriched файлы (CSV или parquet)
+    enriched_paths = columnar_storage.find_layer_files(enriched_dir, columnar_storage.enriched_prefix)
+    enriched_files = [os.path.basename(path) for path in enriched_paths.values()]
+    if not enriched_files:
+        print("ERROR: Нет enriched CSV файлов в data/enriched/")
+        return
+    
+    # Добавить в состояние новые и изменившиеся партиции
+    state = report_state.empty_state() if full else report_state.load_state(state_path)
+    refreshed_files = report_state.update_state(state, enriched_paths)
+    if not state['partitions']:
+        print("ERROR: Не удалось прочитать ни одного файла")
+        return
+    report_state.save_state(state_path, state)
+    
+    # Агрегаты по городам за весь период (средние, моды, первые значения) - из состояния, O(городов)
+    df_city_stats = report_state.city_aggregates(state)
+    total_rows = report_state.total_rows(state)
+    
+    # Добавить столбец as_of_date (формат YYYY-MM-DD hh:mm)
+    current_as_of_date = datetime.now().strftime('%Y-%m-%d %H:%M')
+    
+    # Витрины 1-3
+    df_city_rating, df_district_summary, df_mart3 = build_marts(df_city_stats, current_as_of_date)
     
-    # Аккумуляция витрины 3
-    travel_rec_path = os.path.join(reports_dir, "travel_recommendations.csv")
-    if os.path.exists(travel_rec_path):
-        try:
-            df_existing = pd.read_csv(travel_rec_path, encoding='utf-8')
-            df_mart3 = pd.concat([df_existing, df_mart3], ignore_index=True)
-        except Exception as e:
-            print(f"WARNING: Ошибка чтения существующего {travel_rec_path}: {e}. Создадим новый.")
-    df_mart3.to_csv(travel_rec_path, index=False, encoding='utf-8')
+    # Аккумуляция витрин (новый снимок дописывается в конец файла)
+    mart_writer.append_snapshot(os.path.join(reports_dir, "city_tourism_rating.csv"), df_city_rating)
+    mart_writer.append_snapshot(os.path.join(reports_dir, "federal_districts_summary.csv"), df_district_summary)
+    mart_writer.append_snapshot(os.path.join(reports_dir, "travel_recommendations.csv"), df_mart3)
     
     # Лог (дописываем, а не перезаписываем)
     log_path = os.path.join(log_dir, "reports_log.txt")
     with open(log_path, 'a', encoding='utf-8') as log_file:  # 'a' для append
         log_file.write(f"\n--- Новый запуск: {current_as_of_date} ---\n")
         log_file.write(f"Обработано файлов: {len(enriched_files)} ({', '.join(enriched_files)})\n")
-        log_file.write(f"Всего строк данных: {len(df_all)}\n")
+        log_file.write(f"Заново прочитано файлов: {len(refreshed_files)}" + (f" ({', '.join(refreshed_files)})" if refreshed_files else "") + "\n")
+        log_file.write(f"Всего строк данных: {total_rows}\n")
         log_file.write("Витрина 1: Рейтинг городов (city_tourism_rating.csv) - сортировка по avg_comfort_index\n")
         log_file.write("Витрина 2: Сводка по округам (federal_districts_summary.csv) - средняя temp по всем городам, комфортные города (comfort > 15 и не домашний отдых), рекомендация\n")
         log_file.write("Витрина 3: Рекомендации (travel_recommendations.csv) - топ-3, дома, дополнительные заметки\n")
@@ -180,4 +155,7 @@ def create_reports():
 
 # Запуск
 if __name__ == "__main__":
-    create_reports()
+    parser = argparse.ArgumentParser(description="Построение витрин data/aggregated по enriched данным")
+    parser.add_argument('--full', action='store_true', help="Пересчитать состояние агрегации по всем enriched файлам")
+    args = parser.parse_args()
+    create_reports(full=args.full)
@@ -1,7 +1,11 @@
 import pandas as pd
+import numpy as np
 import os
+import argparse
 from datetime import datetime, timedelta
-from collections import defaultdict
+
+import columnar_storage
+from city_reference import month_dict, season_month_mask, load_city_reference
 
 # Папки (предполагаем, что cleaned_data находится в data/cleaned/, а enriched в data/enriched/)
 cleaned_dir = os.path.join(os.path.dirname(__file__), '..', 'data', 'cleaned')
@@ -11,12 +15,6 @@ cities_ref_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'enriche
 # Создаем папки
 os.makedirs(enriched_dir, exist_ok=True)
 
-# Словарь месяцев для парсинга диапазонов (на русском)
-month_dict = {
-    'январь': 1, 'февраль': 2, 'март': 3, 'апрель': 4, 'май': 5, 'июнь': 6,
-    'июль': 7, 'август': 8, 'сентябрь': 9, 'октябрь': 10, 'ноябрь': 11, 'декабрь': 12
-}
-
 def calculate_comfort_index(row):
     try:
         # Преобразуем в float, обрабатывая пустые строки как 0 или дефолт
@@ -66,27 +64,176 @@ def determine_season_match(current_month, tourism_season):
             return "да"
     return "нет"
 
-def enrich_weather_data_for_date(date_str, file_paths):
+# Векторные версии правил выше: тот же результат (побитово), но без apply по строкам
+
+# Дефолты для пропусков в расчёте comfort_index (как в calculate_comfort_index)
+comfort_defaults = {'temperature': 20, 'humidity': 50, 'clouds': 50, 'pop': 0, 'wind_speed': 5}
+
+activity_active = "активный туризм"
+activity_cultural = "культурный туризм"
+activity_home = "домашний отдых"
+
+# Колонка как float64 с дефолтом вместо пропусков; вторым элементом - маска нечисловых значений
+# (в построчной версии на них float() бросает ValueError)
+def _numeric_with_default(series, default):
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return series.astype('float64').fillna(default).to_numpy(), np.zeros(len(series), dtype=bool)
+    numeric = pd.to_numeric(series, errors='coerce')
+    invalid = (series.notna() & numeric.isna()).to_numpy()
+    return numeric.astype('float64').fillna(default).to_numpy(), invalid
+
+# Округление до 2 знаков как у встроенного round(): np.round отличается от него только у значений
+# на границе .xx5, такие значения (их единицы) досчитываются встроенным round
+def _round2(values):
+    rounded = np.round(values, 2)
+    scaled = values * 100
+    near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    for i in np.flatnonzero(near_half):
+        rounded[i] = round(float(values[i]), 2)
+    return rounded
+
+def calculate_comfort_index_vectorized(df):
+    columns = {}
+    invalid = np.zeros(len(df), dtype=bool)
+    for column, default in comfort_defaults.items():
+        columns[column], column_invalid = _numeric_with_default(df[column], default)
+        invalid |= column_invalid
+    comfort = (columns['temperature'] * 0.4) + (columns['humidity'] * -0.2) + (columns['clouds'] * -0.1) + \
+              (columns['pop'] * -0.3) + (columns['wind_speed'] * -0.1) + 20
+    comfort = _round2(comfort)
+    if invalid.any():
+        print(f"WARNING: Ошибка расчёта comfort_index для {invalid.sum()} строк (нечисловые значения), например для строк {list(df.index[invalid][:5])}")
+        if invalid.all():
+            return pd.Series(10, index=df.index)  # Как у apply: все значения - целый дефолт
+        comfort[invalid] = 10  # Дефолт
+    return pd.Series(comfort, index=df.index)
+
+def determine_recommended_activity_vectorized(comfort_index, pop):
+    pop_val, pop_invalid = _numeric_with_default(pop, 0)
+    if pop_invalid.any():
+        print(f"WARNING: Ошибка определения activity для {pop_invalid.sum()} строк: нечисловой pop")
+    comfort = comfort_index.to_numpy(dtype='float64')
+    activity = np.select(
+        [pop_invalid, (comfort > 15) & (pop_val < 0.3), comfort > 10],
+        [activity_home, activity_active, activity_cultural],
+        default=activity_home
+    )
+    return pd.Series(activity, index=comfort_index.index, dtype=object)
+
+# season_masks - готовые маски месяцев по строкам (из справочника городов); без них строка сезона
+# разбирается один раз на уникальное значение, а не для каждой строки
+def determine_season_match_vectorized(current_month, tourism_season, season_masks=None):
+    if season_masks is None:
+        codes, uniques = pd.factorize(tourism_season)
+        masks = np.array([season_month_mask(season) for season in uniques] + [0], dtype=np.int64)  # -1 (пропуск) -> 0
+        season_masks = masks[codes]
+    matched = (season_masks >> (current_month - 1)) & 1
+    return pd.Series(np.where(matched == 1, "да", "нет"), index=tourism_season.index, dtype=object)
+
+# Расчёт производных колонок enriched слоя (comfort_index, recommended_activity, tourist_season_match)
+def add_derived_columns(df, current_month, season_masks=None):
+    df['comfort_index'] = calculate_comfort_index_vectorized(df)
+    df['recommended_activity'] = determine_recommended_activity_vectorized(df['comfort_index'], df['pop'])
+    df['tourist_season_match'] = determine_season_match_vectorized(current_month, df['tourism_season'], season_masks)
+    return df
+
+# Столбцы cleaned данных, без которых обогащение невозможно
+required_cols = ['city_name', 'temperature', 'humidity', 'clouds', 'pop', 'wind_speed']
+
+# Обогащение порции cleaned данных (дубликаты уже удалены): справочник городов и производные колонки.
+# None - в данных нет необходимых столбцов
+def enrich_frame(combined_df, reference, current_month):
+    # Проверяем наличие необходимых столбцов
+    if not all(col in combined_df.columns for col in required_cols):
+        return None
+    
+    # Заменяем пустые строки на NaN для корректной обработки
+    combined_df = combined_df.replace('', pd.NA)
+    
+    # Присоединяем данные справочника по целочисленным кодам городов (сравнение без учёта регистра и пробелов)
+    combined_df = combined_df.reset_index(drop=True)
+    city_codes = reference.lookup_codes(combined_df['city_name'])
+    for column in ['federal_district', 'tourism_season', 'timezone', 'population']:
+        combined_df[column] = reference.take(column, city_codes)
+    
+    # Для городов, не найденных в справочнике, устанавливаем дефолты
+    combined_df['federal_district'] = combined_df['federal_district'].fillna('Неизвестный федеральный округ')
+    combined_df['tourism_season'] = combined_df['tourism_season'].fillna('добавьте город в справочник cities_reference.csv')
+    combined_df['timezone'] = combined_df['timezone'].fillna('UTC+3')  # Дефолт
+    combined_df['population'] = combined_df['population'].fillna(0)  # Дефолт
+    
+    # Рассчитываем comfort_index, recommended_activity и tourist_season_match (векторно)
+    return add_derived_columns(combined_df, current_month, reference.season_masks_for(city_codes))
+
+# Множество 64-битных хешей строк для удаления дубликатов между порциями.
+# Хеши хранятся в отсортированных numpy массивах (8 байт на строку вместо ~70 байт у set из int);
+# массивы близкого размера сливаются, поэтому их всегда O(log n)
+class RowHashSet:
+    def __init__(self):
+        self.runs = []
+
+    def __len__(self):
+        return sum(len(run) for run in self.runs)
+
+    def contains(self, hashes):
+        found = np.zeros(len(hashes), dtype=bool)
+        for run in self.runs:
+            positions = np.minimum(np.searchsorted(run, hashes), len(run) - 1)
+            found |= run[positions] == hashes
+        return found
+
+    def add(self, hashes):
+        run = np.unique(hashes)
+        if len(run) == 0:
+            return
+        while self.runs and len(self.runs[-1]) <= 2 * len(run):
+            run = np.union1d(self.runs.pop(), run)
+        self.runs.append(run)
+
+# Хеши строк порции, не зависящие от того, как pandas вывел типы в конкретной порции (5 и 5.0 - одно значение)
+def row_hashes(chunk):
+    canonical = pd.DataFrame({
+        column: chunk[column].astype('float64') if pd.api.types.is_numeric_dtype(chunk[column]) and not pd.api.types.is_bool_dtype(chunk[column]) else chunk[column].astype(object)
+        for column in chunk.columns
+    })
+    return pd.util.hash_pandas_object(canonical, index=False).to_numpy()
+
+# Строки порции, которые ещё не встречались (ни в этой порции, ни в предыдущих)
+def drop_seen_duplicates(chunk, seen):
+    hashes = row_hashes(chunk)
+    keep = ~pd.Series(hashes).duplicated().to_numpy() & ~seen.contains(hashes)
+    seen.add(hashes[keep])
+    return chunk[keep]
+
+# chunk_rows - размер порции для потокового режима; 0 - все файлы за дату обрабатываются в памяти целиком
+default_chunk_rows = int(os.getenv('ENRICH_CHUNK_ROWS', '0'))
+
+def enrich_weather_data_for_date(date_str, file_paths, chunk_rows=None):
+    chunk_rows = default_chunk_rows if chunk_rows is None else chunk_rows
     # Загружаем справочник городов
     if not os.path.exists(cities_ref_path):
         print(f"ERROR: Файл {cities_ref_path} не найден. Пропускаем обогащение для даты {date_str}.")
         return
     try:
-        df_cities = pd.read_csv(cities_ref_path, encoding='utf-8')
-        required_city_cols = ['city_name', 'federal_district', 'tourism_season']
-        if not all(col in df_cities.columns for col in required_city_cols):
-            print(f"ERROR: Недостающие столбцы в {cities_ref_path}: {required_city_cols}. Пропускаем.")
-            return
-        # Нормализуем city_name в справочнике для точного совпадения
-        df_cities['city_name'] = df_cities['city_name'].str.lower().str.strip()
+        # Справочник разбирается один раз на процесс и кешируется (см. city_reference.py)
+        reference = load_city_reference(cities_ref_path)
     except Exception as e:
         print(f"ERROR: Ошибка чтения {cities_ref_path}: {e}. Пропускаем.")
         return
     
+    # Месяц для tourist_season_match - из date_str, а не текущего времени
+    current_month = int(date_str[4:6])  # Извлекаем месяц из YYYYMMDD (MM)
+    
+    # Формируем имя файла: weather_enriched_YYYYMMDD.csv или .parquet (без времени, формат - LAYER_FORMAT)
+    enriched_path = columnar_storage.layer_file_path(enriched_dir, columnar_storage.enriched_prefix, date_str)
+    
+    if chunk_rows > 0:
+        return enrich_weather_data_streaming(date_str, file_paths, reference, current_month, enriched_path, chunk_rows)
+    
     all_data = []
     for file_path in file_paths:
         try:
-            df = pd.read_csv(file_path, encoding='utf-8')
+            df = columnar_storage.read_layer_file(file_path)
             if not df.empty:
                 all_data.append(df)
             else:
@@ -104,82 +251,80 @@ def enrich_weather_data_for_date(date_str, file_paths):
     # Удаляем дубликаты, если есть (на случай повторяющихся строк)
     combined_df = combined_df.drop_duplicates()
     
-    # Проверяем наличие необходимых столбцов
-    required_cols = ['city_name', 'temperature', 'humidity', 'clouds', 'pop', 'wind_speed']
-    if not all(col in combined_df.columns for col in required_cols):
+    combined_df = enrich_frame(combined_df, reference, current_month)
+    if combined_df is None:
         print(f"ERROR: Недостающие столбцы для даты {date_str}: {required_cols}")
         return
     
-    # Заменяем пустые строки на NaN для корректной обработки
-    combined_df = combined_df.replace('', pd.NA)
-    
-    # Сохраняем оригинальный city_name (с заглавной русской буквы)
-    combined_df['original_city_name'] = combined_df['city_name']
-    
-    # Нормализуем city_name в combined_df для точного совпадения
-    combined_df['city_name'] = combined_df['city_name'].str.lower().str.strip()
-    
-    # Мерджим с данными из cities_reference.csv по city_name
-    combined_df = combined_df.merge(
-        df_cities[['city_name', 'federal_district', 'tourism_season', 'timezone', 'population']],
-        on='city_name',
-        how='left'
-    )
-    
-    # Для городов, не найденных в справочнике, устанавливаем дефолты
-    combined_df['federal_district'] = combined_df['federal_district'].fillna('Неизвестный федеральный округ')
-    combined_df['tourism_season'] = combined_df['tourism_season'].fillna('добавьте город в справочник cities_reference.csv')
-    combined_df['timezone'] = combined_df['timezone'].fillna('UTC+3')  # Дефолт
-    combined_df['population'] = combined_df['population'].fillna(0)  # Дефолт
-    
-    # Восстанавливаем оригинальный city_name
-    combined_df['city_name'] = combined_df['original_city_name']
-    combined_df = combined_df.drop(columns=['original_city_name'])
-    
-    # Рассчитываем comfort_index
-    combined_df['comfort_index'] = combined_df.apply(calculate_comfort_index, axis=1)
-    
-    # Определяем recommended_activity
-    combined_df['recommended_activity'] = combined_df.apply(lambda row: determine_recommended_activity(row['comfort_index'], row['pop']), axis=1)
-    
-    # Определяем tourist_season_match (на основе месяца из date_str, а не текущего времени)
-    current_month = int(date_str[4:6])  # Извлекаем месяц из YYYYMMDD (MM)
-    combined_df['tourist_season_match'] = combined_df.apply(lambda row: determine_season_match(current_month, row['tourism_season']), axis=1)
-    
-    # Формируем имя файла: weather_enriched_YYYYMMDD.csv (без времени)
-    enriched_file = f"weather_enriched_{date_str}.csv"
-    enriched_path = os.path.join(enriched_dir, enriched_file)
-    
     # Сохраняем enriched файл
     try:
-        combined_df.to_csv(enriched_path, index=False, encoding='utf-8')
+        columnar_storage.write_layer(combined_df, enriched_path, columnar_storage.enriched_schema)
         print(f"SUCCESS: Enriched data for date {date_str} saved to {enriched_path} (объединено {len(file_paths)} файлов)")
     except Exception as e:
         print(f"ERROR: Ошибка сохранения в {enriched_path}: {e}")
+        return
+    return len(combined_df)
+
+# Потоковый режим: файлы читаются порциями по chunk_rows строк, дубликаты отсекаются по хешам строк
+# (в том числе между порциями и файлами), обогащённые порции сразу дописываются во временный файл,
+# который в конце подменяет enriched файл. В памяти одновременно одна порция и хеши уже виденных строк.
+# Порции уже записаны, поэтому ошибка чтения любого файла прерывает обогащение даты целиком.
+def enrich_weather_data_streaming(date_str, file_paths, reference, current_month, enriched_path, chunk_rows):
+    writer = columnar_storage.LayerWriter(enriched_path, columnar_storage.enriched_schema)
+    seen = RowHashSet()
+    rows_read = 0
+    try:
+        for file_path in file_paths:
+            for chunk in columnar_storage.iter_layer_chunks(file_path, chunk_rows):
+                rows_read += len(chunk)
+                chunk = drop_seen_duplicates(chunk, seen)
+                if chunk.empty:
+                    continue
+                enriched_chunk = enrich_frame(chunk, reference, current_month)
+                if enriched_chunk is None:
+                    writer.abort()
+                    print(f"ERROR: Недостающие столбцы в {file_path}: {required_cols}")
+                    return
+                writer.write(enriched_chunk)
+        if writer.rows == 0:
+            writer.abort()
+            print(f"WARNING: Нет данных для даты {date_str}")
+            return
+        writer.close()
+    except Exception as e:
+        writer.abort()
+        print(f"ERROR: Ошибка потокового обогащения для даты {date_str}: {e}")
+        return
+    print(f"SUCCESS: Enriched data for date {date_str} saved to {enriched_path} (объединено {len(file_paths)} файлов, "
+          f"порциями по {chunk_rows} строк: прочитано {rows_read}, без дубликатов {writer.rows})")
+    return writer.rows
+
+# Группировка cleaned файлов по дате: {YYYYMMDD: [пути]} (CSV или parquet, см. columnar_storage.py)
+def find_cleaned_files_by_date():
+    files = columnar_storage.find_layer_files(cleaned_dir, columnar_storage.cleaned_prefix)
+    return {date_str: [path] for date_str, path in files.items()}
 
 # Основная логика: группируем файлы по дате и обрабатываем только за сегодня и вчера
+# (историю за произвольный диапазон дат пересобирает backfill.py)
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Обогащение cleaned данных за вчера и сегодня")
+    parser.add_argument('--chunk-rows', type=int, default=default_chunk_rows,
+                        help="Потоковая обработка порциями по N строк (0 - весь день в памяти)")
+    args = parser.parse_args()
+    
     # Определяем даты сегодня и вчера
     today = datetime.today().date()
     yesterday = today - timedelta(days=1)
     
     if os.path.exists(cleaned_dir):
         # Группируем файлы по дате
-        date_to_files = defaultdict(list)
-        for file in os.listdir(cleaned_dir):
-            if file.startswith("weather_cleaned_") and file.endswith(".csv"):
-                # Извлекаем YYYYMMDD
-                date_part = file[len("weather_cleaned_"):-len(".csv")]
-                if len(date_part) == 8 and date_part.isdigit():  # Проверяем формат YYYYMMDD
-                    date_to_files[date_part].append(os.path.join(cleaned_dir, file))
-                else:
-                    print(f"WARNING: Неверный формат даты в файле {file}, пропускаем")
+        date_to_files = find_cleaned_files_by_date()
         
         # Обрабатываем только даты за вчера и сегодня
         for dt in [yesterday, today]:
             date_str = dt.strftime("%Y%m%d")
             if date_str in date_to_files:
-                enrich_weather_data_for_date(date_str, date_to_files[date_str])
+                enrich_weather_data_for_date(date_str, date_to_files[date_str], chunk_rows=args.chunk_rows)
             else:
                 print(f"Нет cleaned файлов для даты {date_str}")
     else:
@@ -0,0 +1,161 @@
+import io
+import os
+import numpy as np
+import pandas as pd
+
+import columnar_storage
+from storage_utils import atomic_write_bytes, atomic_write_json, read_json, check_fingerprint
+
+try:
+    import pyarrow  # noqa: F401 - нужен только для хранения таблицы в parquet
+    default_feature_format = os.getenv('FEATURE_STORE_FORMAT', 'parquet')
+except ImportError:
+    default_feature_format = os.getenv('FEATURE_STORE_FORMAT', 'csv')
+
+# Хранилище дневных признаков для обучения моделей (data/features): средняя дневная (11:00-18:00)
+# и ночная температура по (город, дата).
+# В таблице хранятся частичные суммы и количества по enriched партициям (колонка partition), поэтому
+# при обновлении заново читаются только новые и изменившиеся партиции (отпечатки - в feature_state.json),
+# строки исчезнувших партиций удаляются. Классификация часов и агрегация векторные.
+# load_features собирает из таблицы тот же датафрейм, что train_weather_model.load_data_from_directory.
+
+features_dir = os.path.join(os.path.dirname(__file__), '..', 'data', 'features')
+enriched_dir = os.path.join(os.path.dirname(__file__), '..', 'data', 'enriched')
+
+state_version = 1
+day_start_hour = 11
+day_end_hour = 18
+table_columns = ['partition', 'city', 'date', 'temp_day_sum', 'temp_day_count', 'temp_night_sum', 'temp_night_count']
+
+def _table_path(directory, feature_format):
+    return os.path.join(directory, f"daily_temperature.{feature_format}")
+
+def _state_path(directory):
+    return os.path.join(directory, 'feature_state.json')
+
+def _empty_table():
+    return pd.DataFrame({
+        'partition': pd.Series(dtype=object), 'city': pd.Series(dtype=object), 'date': pd.Series(dtype='datetime64[ns]'),
+        'temp_day_sum': pd.Series(dtype=np.float64), 'temp_day_count': pd.Series(dtype=np.int64),
+        'temp_night_sum': pd.Series(dtype=np.float64), 'temp_night_count': pd.Series(dtype=np.int64)
+    })
+
+def load_table(directory=None, feature_format=None):
+    path = _table_path(directory or features_dir, feature_format or default_feature_format)
+    if not os.path.exists(path):
+        return _empty_table()
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    return pd.read_csv(path, encoding='utf-8', dtype={'partition': str}, parse_dates=['date'])
+
+def _save_table(table, directory, feature_format):
+    buffer = io.BytesIO()
+    if feature_format == 'parquet':
+        table.to_parquet(buffer, index=False)
+    else:
+        table.to_csv(buffer, index=False, encoding='utf-8')
+    atomic_write_bytes(_table_path(directory, feature_format), buffer.getvalue())
+
+# Частичные суммы и количества температуры по (город, дата) одной партиции.
+# Час из интервала [11, 18) - день, остальные (в том числе неразобранное время) - ночь
+def partition_features(df, partition):
+    times = columnar_storage.parse_collection_time(df['collection_time'])
+    hours = times.dt.hour.to_numpy()
+    is_day = (hours >= day_start_hour) & (hours < day_end_hour)
+    temperature = pd.to_numeric(df['temperature'], errors='coerce').to_numpy(dtype=np.float64)
+    has_value = ~np.isnan(temperature)
+    values = np.where(has_value, temperature, 0.0)
+    frame = pd.DataFrame({
+        'city': df['city_name'].to_numpy(),
+        'date': times.dt.normalize().to_numpy(),
+        'temp_day_sum': np.where(is_day, values, 0.0),
+        'temp_day_count': (is_day & has_value).astype(np.int64),
+        'temp_night_sum': np.where(is_day, 0.0, values),
+        'temp_night_count': (~is_day & has_value).astype(np.int64)
+    })
+    # Строки без города или даты в признаки не попадают (как при groupby)
+    frame = frame[frame['city'].notna() & frame['date'].notna()]
+    aggregated = frame.groupby(['city', 'date'], sort=True).sum().reset_index()
+    aggregated.insert(0, 'partition', partition)
+    return aggregated[table_columns]
+
+# Обновление таблицы по enriched партициям. Возвращает список заново прочитанных файлов
+def update_feature_store(source_dir=None, directory=None, feature_format=None):
+    source_dir = source_dir or enriched_dir
+    directory = directory or features_dir
+    feature_format = feature_format or default_feature_format
+    enriched_paths = columnar_storage.find_layer_files(source_dir, columnar_storage.enriched_prefix)
+
+    state = read_json(_state_path(directory))
+    table_exists = os.path.exists(_table_path(directory, feature_format))
+    if not state or state.get('version') != state_version or not table_exists:
+        # Без состояния таблица строится заново из всех партиций
+        state = {'version': state_version, 'partitions': {}}
+        table_exists = False
+    partitions = state['partitions']
+
+    dropped = [date_str for date_str in partitions if date_str not in enriched_paths]
+    for date_str in dropped:
+        del partitions[date_str]
+    refreshed = []
+    new_frames = []
+    for date_str, path in sorted(enriched_paths.items()):
+        unchanged, fingerprint = check_fingerprint(partitions.get(date_str), path)
+        if unchanged:
+            partitions[date_str].update(fingerprint)
+            continue
+        dropped.append(date_str)
+        try:
+            df = columnar_storage.read_layer_file(path, columns=['city_name', 'collection_time', 'temperature'])
+        except Exception as e:
+            print(f"ERROR: Ошибка чтения {path}: {e}")
+            partitions.pop(date_str, None)
+            continue
+        if 'city_name' not in df.columns:
+            print(f"Предупреждение: В файле {os.path.basename(path)} нет колонки 'city_name'. Пропускаем файл.")
+            features = _empty_table()
+        else:
+            features = partition_features(df, date_str)
+        new_frames.append(features)
+        partitions[date_str] = dict(fingerprint, rows=len(features))
+        refreshed.append(os.path.basename(path))
+
+    if not dropped and table_exists:
+        return refreshed
+    table = load_table(directory, feature_format) if table_exists else _empty_table()
+    table = table[~table['partition'].isin(dropped)]
+    table = pd.concat([table] + [frame for frame in new_frames if len(frame)], ignore_index=True)
+    table = table.sort_values(['city', 'date', 'partition'], kind='stable', ignore_index=True)
+    # Сначала таблица, затем состояние: при сбое между ними партиции просто будут прочитаны повторно
+    _save_table(table[table_columns], directory, feature_format)
+    atomic_write_json(_state_path(directory), state)
+    return refreshed
+
+# Дневные признаки в формате load_data_from_directory: city, temp_day, temp_night, date
+# (одна строка на город и дату, пропуски заполнены средним по колонке).
+# cities - фильтр по городам, since - первая дата
+def load_features(cities=None, since=None, directory=None, feature_format=None):
+    table = load_table(directory, feature_format)
+    if cities is not None:
+        table = table[table['city'].isin(list(cities))]
+    if since is not None:
+        table = table[table['date'] >= pd.Timestamp(since).normalize()]
+    if table.empty:
+        return pd.DataFrame()
+
+    # Таблица отсортирована по (city, date); суммирование нужно, только если дата встречается в нескольких партициях
+    city = table['city'].to_numpy()
+    date = table['date'].to_numpy()
+    repeated = (city[1:] == city[:-1]) & (date[1:] == date[:-1])
+    if repeated.any():
+        table = table.groupby(['city', 'date'], sort=True)[table_columns[3:]].sum().reset_index()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        features = pd.DataFrame({
+            'city': table['city'].to_numpy(dtype=object),
+            'temp_day': np.where(table['temp_day_count'] > 0, table['temp_day_sum'] / table['temp_day_count'], np.nan),
+            'temp_night': np.where(table['temp_night_count'] > 0, table['temp_night_sum'] / table['temp_night_count'], np.nan),
+            'date': table['date'].to_numpy()
+        })
+    features['temp_day'] = features['temp_day'].fillna(features['temp_day'].mean())
+    features['temp_night'] = features['temp_night'].fillna(features['temp_night'].mean())
+    return features
@@ -0,0 +1,250 @@
+import os
+import math
+import time
+import signal
+import logging
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+
+import batch_trainer
+import feature_store
+import mart_writer
+
+try:
+    from prophet import Prophet
+except ImportError:  # prophet нужен только для модели prophet
+    Prophet = None
+
+# Движок прогнозов температуры (temp_day/temp_night) на несколько дней вперёд для всех городов.
+# Модели подключаются через словарь forecast_models (имя -> класс с fit(history) и predict(dates)):
+# - linear - регрессия по day_of_year по всей истории (случайное разбиение train/test, как у Forecast.csv
+#   в batch_trainer, здесь не нужно - отложенные строки ни для чего не используются);
+# - seasonal_naive - повтор последних season_days наблюдений;
+# - prophet - Prophet по дневному ряду (нужен пакет prophet).
+# Города делятся на порции и обучаются параллельно в пуле процессов; обучение и прогноз одного города
+# одной моделью ограничены таймаутом модели. Прогнозы дописываются в историю forecast_history.csv
+# (снимок на каждый запуск, см. mart_writer.py), а не перезаписывают файл; старые снимки прореживает
+# compact_marts.py по той же политике хранения, что и витрины.
+
+forecasts_dir = os.path.join(os.path.dirname(__file__), '..', 'data', 'models', 'forecast')
+history_path = os.path.join(forecasts_dir, 'forecast_history.csv')
+
+default_models = os.getenv('FORECAST_MODELS', 'linear,seasonal_naive').split(',')
+default_horizon = int(os.getenv('FORECAST_HORIZON', '7'))
+default_workers = int(os.getenv('FORECAST_WORKERS', str(os.cpu_count() or 1)))
+default_season_days = int(os.getenv('FORECAST_SEASON_DAYS', '7'))
+
+targets = batch_trainer.targets
+
+class LinearModel:
+    default_timeout = 10
+
+    def fit(self, history):
+        x = history['date'].dt.dayofyear.to_numpy(dtype=np.float64)
+        if len(x) < 2:
+            raise ValueError("Недостаточно данных для модели (нужно минимум 2 дня)")
+        x_centered = x - x.mean()
+        sxx = (x_centered * x_centered).sum()
+        self.coef = {}
+        self.intercept = {}
+        for target in targets:
+            y = history[target].to_numpy(dtype=np.float64)
+            coef = (x_centered * (y - y.mean())).sum() / sxx if sxx > 0 else 0.0
+            self.coef[target] = coef
+            self.intercept[target] = y.mean() - coef * x.mean()
+        return self
+
+    def predict(self, dates):
+        day_of_year = pd.DatetimeIndex(dates).dayofyear.to_numpy(dtype=np.float64)
+        return {target: self.coef[target] * day_of_year + self.intercept[target] for target in targets}
+
+class SeasonalNaiveModel:
+    default_timeout = 10
+
+    def __init__(self, season_days=None):
+        self.season_days = season_days or default_season_days
+
+    def fit(self, history):
+        if history.empty:
+            raise ValueError("Нет данных для модели")
+        # Последний сезон наблюдений; при короткой истории сезон - вся история
+        self.last_date = history['date'].iloc[-1]
+        self.season = {target: history[target].to_numpy(dtype=np.float64)[-self.season_days:] for target in targets}
+        return self
+
+    def predict(self, dates):
+        steps = (pd.DatetimeIndex(dates) - self.last_date).days.to_numpy()
+        result = {}
+        for target in targets:
+            season = self.season[target]
+            result[target] = season[(steps - 1) % len(season)]
+        return result
+
+class ProphetModel:
+    default_timeout = 120
+
+    def fit(self, history):
+        if Prophet is None:
+            raise ImportError("Для модели prophet установите пакет prophet (pip install prophet)")
+        if len(history) < 2:
+            raise ValueError("Недостаточно данных для модели (нужно минимум 2 дня)")
+        logging.getLogger('cmdstanpy').setLevel(logging.WARNING)
+        self.models = {}
+        for target in targets:
+            model = Prophet()
+            model.fit(pd.DataFrame({'ds': history['date'], 'y': history[target]}))
+            self.models[target] = model
+        return self
+
+    def predict(self, dates):
+        frame = pd.DataFrame({'ds': pd.DatetimeIndex(dates)})
+        return {target: self.models[target].predict(frame)['yhat'].to_numpy() for target in targets}
+
+forecast_models = {
+    'linear': LinearModel,
+    'seasonal_naive': SeasonalNaiveModel,
+    'prophet': ProphetModel
+}
+
+# Ограничение времени блока через SIGALRM (только в главном потоке; на платформах без SIGALRM таймаут не действует)
+class TimeLimit:
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.enabled = bool(seconds) and hasattr(signal, 'SIGALRM') and threading.current_thread() is threading.main_thread()
+
+    def _expired(self, signum, frame):
+        raise TimeoutError(f"превышен таймаут {self.seconds} с")
+
+    def __enter__(self):
+        if self.enabled:
+            self.previous = signal.signal(signal.SIGALRM, self._expired)
+            signal.setitimer(signal.ITIMER_REAL, self.seconds)
+        return self
+
+    def __exit__(self, *exc):
+        if self.enabled:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, self.previous)
+        return False
+
+# Прогноз порции городов одной моделью; выполняется в отдельном процессе.
+# histories - [(город, история)], возвращает (строки прогноза, ошибки [(город, текст)], секунды)
+def forecast_chunk(model_name, histories, dates, timeout):
+    started = time.perf_counter()
+    rows = []
+    failures = []
+    model_class = forecast_models[model_name]
+    for city, history in histories:
+        try:
+            with TimeLimit(timeout):
+                predictions = model_class().fit(history).predict(dates)
+        except Exception as e:
+            failures.append((city, f"{type(e).__name__}: {e}"))
+            continue
+        for horizon, date in enumerate(dates, start=1):
+            rows.append({
+                'city': city,
+                'model': model_name,
+                'forecast_date': date.strftime('%Y-%m-%d'),
+                'horizon': horizon,
+                'predicted_temp_day': round(float(predictions['temp_day'][horizon - 1]), 2),
+                'predicted_temp_night': round(float(predictions['temp_night'][horizon - 1]), 2)
+            })
+    return rows, failures, time.perf_counter() - started
+
+def city_histories(df):
+    df = df.dropna(subset=['city']).sort_values(['city', 'date'], kind='stable')
+    return [(city, history[['date'] + targets].reset_index(drop=True)) for city, history in df.groupby('city', sort=False)]
+
+def split_chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+# Прогнозы всех городов df (city, date, temp_day, temp_night) моделями models на horizon дней после start_date
+# (по умолчанию - после сегодняшнего дня). timeout - секунд на город и модель (None - таймаут модели)
+def run_forecasts(df, models=None, horizon=None, workers=None, timeout=None, start_date=None):
+    models = models or default_models
+    unknown = [name for name in models if name not in forecast_models]
+    if unknown:
+        raise ValueError(f"Неизвестные модели: {', '.join(unknown)}. Допустимо: {', '.join(forecast_models)}")
+    if 'prophet' in models and Prophet is None:
+        print("ERROR: Модель prophet пропущена: пакет prophet не установлен (pip install prophet)")
+        models = [name for name in models if name != 'prophet']
+    horizon = horizon or default_horizon
+    workers = max(1, workers or default_workers)
+    start_date = pd.Timestamp(start_date or datetime.now().date())
+    dates = [start_date + timedelta(days=h) for h in range(1, horizon + 1)]
+
+    histories = city_histories(df)
+    if not histories:
+        return pd.DataFrame()
+    chunk_size = max(1, math.ceil(len(histories) / (workers * 4)))
+    tasks = [(name, chunk, dates, timeout or forecast_models[name].default_timeout)
+             for name in models for chunk in split_chunks(histories, chunk_size)]
+
+    rows = []
+    stats = {name: {'cities': 0, 'failed': 0, 'seconds': 0.0} for name in models}
+    started = time.perf_counter()
+
+    def collect(task, result):
+        chunk_rows, failures, seconds = result
+        rows.extend(chunk_rows)
+        stats[task[0]]['cities'] += len(task[1]) - len(failures)
+        stats[task[0]]['failed'] += len(failures)
+        stats[task[0]]['seconds'] += seconds
+        for city, error in failures:
+            print(f"WARNING: Модель {task[0]} для города {city} не построена: {error}")
+
+    if workers == 1 or len(tasks) == 1:
+        for task in tasks:
+            collect(task, forecast_chunk(*task))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            futures = {executor.submit(forecast_chunk, *task): task for task in tasks}
+            for future in as_completed(futures):
+                task = futures[future]
+                try:
+                    collect(task, future.result())
+                except Exception as e:
+                    stats[task[0]]['failed'] += len(task[1])
+                    print(f"ERROR: Порция из {len(task[1])} городов (модель {task[0]}) завершилась ошибкой: {e}")
+
+    for name, model_stats in stats.items():
+        print(f"Модель {name}: городов {model_stats['cities']}, с ошибками {model_stats['failed']}, "
+              f"обучение и прогноз {model_stats['seconds']:.2f} с")
+    print(f"Прогнозы на {horizon} дн. построены за {time.perf_counter() - started:.2f} с ({workers} процессов)")
+    if not rows:
+        return pd.DataFrame()
+    forecasts = pd.DataFrame(rows)
+    return forecasts.sort_values(['model', 'city', 'horizon'], kind='stable', ignore_index=True)
+
+# Дописать прогнозы в историю (снимок с as_of_date)
+def append_forecast_history(forecasts, as_of_date=None, path=None):
+    if forecasts.empty:
+        print("Нет прогнозов для сохранения.")
+        return
+    path = path or history_path
+    forecasts = forecasts.copy()
+    forecasts['as_of_date'] = as_of_date or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    mart_writer.append_snapshot(path, forecasts)
+    print(f"Прогнозы ({len(forecasts)} строк) дописаны в {path}")
+
+# Запуск
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Прогнозы температуры на несколько дней для всех городов")
+    parser.add_argument('--models', nargs='+', choices=list(forecast_models), default=default_models)
+    parser.add_argument('--horizon', type=int, default=default_horizon, help="На сколько дней вперёд")
+    parser.add_argument('--workers', type=int, default=default_workers, help="Число процессов")
+    parser.add_argument('--timeout', type=float, default=None, help="Таймаут на город и модель, с (по умолчанию - свой у каждой модели)")
+    args = parser.parse_args()
+
+    feature_store.update_feature_store()
+    df = feature_store.load_features()
+    if df.empty:
+        print("Нет данных для прогноза.")
+    else:
+        forecasts = run_forecasts(df, args.models, args.horizon, args.workers, args.timeout)
+        append_forecast_history(forecasts)
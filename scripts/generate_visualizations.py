@@ -3,20 +3,24 @@ import os
 import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
 
+import mart_index
+import chart_data
+
 # Папки
 aggregated_dir = os.path.join(os.path.dirname(__file__), '..', 'data', 'aggregated')
 visualizations_dir = os.path.join(os.path.dirname(__file__), '..', 'data', 'visualizations')
 os.makedirs(visualizations_dir, exist_ok=True)
 
-# Функция для загрузки данных из aggregated слоя
-def load_aggregated_data(filename):
+# Функция для загрузки данных из aggregated слоя.
+# latest_only=True - только последний снимок (читается по индексу снимков, без разбора всей истории)
+def load_aggregated_data(filename, latest_only=False):
     file_path = os.path.join(aggregated_dir, filename)
     if not os.path.exists(file_path):
         print(f"Файл {file_path} не найден.")
         return pd.DataFrame()
     
     try:
-        df = pd.read_csv(file_path, encoding='utf-8')
+        df = mart_index.read_snapshot(file_path) if latest_only else pd.read_csv(file_path, encoding='utf-8')
         # Преобразуем as_of_date в datetime, если есть
         if 'as_of_date' in df.columns:
             df['as_of_date'] = pd.to_datetime(df['as_of_date'], errors='coerce')
@@ -33,6 +37,8 @@ def generate_comfort_index_trend(df):
     
     # Группировка по as_of_date (предполагаем, что данные уже агрегированы по городам, но если нужно, добавьте группировку)
     df_trend = df.groupby('as_of_date')['avg_comfort_index'].mean().reset_index()
+    # История витрины растёт с каждым запуском: ряд прореживается до CHART_POINT_BUDGET точек (LTTB, см. chart_data.py)
+    df_trend = chart_data.downsample(df_trend, 'as_of_date', 'avg_comfort_index')
     
     plt.figure(figsize=(12, 6))
     plt.plot(df_trend['as_of_date'], df_trend['avg_comfort_index'], marker='o', label='Средний Comfort Index')
@@ -84,7 +90,7 @@ def generate_visualizations():
     generate_comfort_index_trend(df_rating)
     
     # 2. federal_districts_summary.csv
-    df_district = load_aggregated_data('federal_districts_summary.csv')
+    df_district = load_aggregated_data('federal_districts_summary.csv', latest_only=True)
     generate_district_histogram(df_district)
     
     # 3. travel_recommendations.csv - графики не генерируются, только данные (обновление README оставлено для update_readme.py)
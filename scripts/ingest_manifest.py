@@ -0,0 +1,94 @@
+import os
+from datetime import datetime
+
+from storage_utils import atomic_write_json, read_json, check_fingerprint
+
+# Манифест инкрементальной загрузки raw -> cleaned.
+# Хранит водяной знак (максимальный timestamp уже очищенных записей), уже обработанные raw источники
+# (JSON файлы и сегменты с количеством прочитанных записей), накопленные счётчики по датам и отпечатки
+# cleaned файлов на момент сохранения манифеста.
+# Благодаря ему clean_data.py читает только новые файлы и только партиции YYYY/MM/DD, где они могут появиться.
+
+manifest_version = 1
+
+def empty_manifest():
+    return {'version': manifest_version, 'watermark': None, 'sources': {}, 'dates': {}}
+
+def load_manifest(path):
+    manifest = read_json(path)
+    if not manifest or manifest.get('version') != manifest_version:
+        return empty_manifest()
+    manifest.setdefault('sources', {})
+    manifest.setdefault('dates', {})
+    return manifest
+
+def save_manifest(path, manifest):
+    manifest['updated_at'] = datetime.now().isoformat()
+    atomic_write_json(path, manifest)
+
+def get_watermark(manifest):
+    return datetime.fromisoformat(manifest['watermark']) if manifest.get('watermark') else None
+
+def advance_watermark(manifest, timestamp_str):
+    current = get_watermark(manifest)
+    if current is None or datetime.fromisoformat(timestamp_str) > current:
+        manifest['watermark'] = timestamp_str
+
+# Партиции raw слоя, в которых могут быть новые данные: из запрошенных дат те, что не раньше даты
+# водяного знака, плюс даты, которые ещё ни разу не сканировались
+def partitions_to_scan(manifest, dates):
+    watermark = get_watermark(manifest)
+    return [d for d in sorted(dates)
+            if watermark is None or d >= watermark.date() or d.strftime('%Y%m%d') not in manifest['dates']]
+
+# Ключ источника - путь относительно raw_dir (не зависит от расположения репозитория)
+def source_key(raw_dir, filepath):
+    return os.path.relpath(filepath, raw_dir).replace(os.sep, '/')
+
+# Сколько записей источника уже обработано; None - источник ещё не встречался
+def processed_records(manifest, key):
+    entry = manifest['sources'].get(key)
+    return entry['records'] if entry else None
+
+def mark_source(manifest, key, filepath, records):
+    stat = os.stat(filepath)
+    manifest['sources'][key] = {'records': records, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+# Не изменился ли источник с прошлого запуска (для дописываемых сегментов)
+def source_unchanged(manifest, key, filepath):
+    entry = manifest['sources'].get(key)
+    if not entry:
+        return False
+    stat = os.stat(filepath)
+    return entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns
+
+def date_counts(manifest, date_str):
+    return manifest['dates'].get(date_str)
+
+def add_date_counts(manifest, date_str, original, cleaned):
+    counts = manifest['dates'].setdefault(date_str, {'original': 0, 'cleaned': 0})
+    counts['original'] += original
+    counts['cleaned'] += cleaned
+
+# Отпечаток cleaned файла даты после записи (сохраняется вместе с манифестом)
+def mark_cleaned(manifest, date_str, path):
+    manifest['dates'][date_str]['cleaned_file'] = check_fingerprint(None, path)[1]
+
+# Совпадает ли cleaned файл даты с отпечатком из манифеста. Нет отпечатка (старый манифест) - считается совпадающим
+def cleaned_unchanged(manifest, date_str, path):
+    entry = manifest['dates'].get(date_str, {}).get('cleaned_file')
+    return entry is None or check_fingerprint(entry, path)[0]
+
+# Забыть даты (например, после backfill), чтобы следующий инкрементальный запуск пересобрал их целиком
+def forget_dates(manifest, dates):
+    prefixes = {d.strftime('%Y/%m/%d/') for d in dates}
+    manifest['sources'] = {k: v for k, v in manifest['sources'].items() if k[:11] not in prefixes}
+    for d in dates:
+        manifest['dates'].pop(d.strftime('%Y%m%d'), None)
+
+# Удаление записей о партициях старше min_date: они больше никогда не сканируются, манифест остаётся маленьким
+def prune(manifest, min_date):
+    min_prefix = min_date.strftime('%Y/%m/%d/')
+    manifest['sources'] = {k: v for k, v in manifest['sources'].items() if k[:11] >= min_prefix}
+    min_date_str = min_date.strftime('%Y%m%d')
+    manifest['dates'] = {k: v for k, v in manifest['dates'].items() if k >= min_date_str}
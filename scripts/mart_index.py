@@ -0,0 +1,164 @@
+import io
+import os
+import csv
+import pandas as pd
+
+from storage_utils import atomic_write_json, read_json
+
+# Индекс снимков накопительных CSV (витрины data/aggregated, Forecast.csv): рядом с файлом лежит
+# <файл>.index.json со списком снимков - as_of_date, смещение и длина в байтах, номер первой строки и число строк.
+# Читатели по индексу сразу переходят к нужному снимку (по умолчанию - последнему) и разбирают только его байты.
+# Индекс поддерживает mart_writer при каждой записи. Если индекс отстал от файла (файл дописан без индекса),
+# досканируется только хвост; если файл перезаписан или укорочен - индекс строится заново одним проходом.
+
+index_version = 1
+
+def index_path(path):
+    return path + '.index.json'
+
+def _empty_index():
+    return {'version': index_version, 'file_size': 0, 'mtime_ns': 0, 'rows': 0, 'snapshots': [], 'latest': [], 'latest_time': None}
+
+# Указатель на самый поздний снимок (по времени as_of_date, а не по порядку в файле) обновляется при сканировании,
+# поэтому читателю не нужно разбирать даты всех снимков. Несколько строк as_of_date с одинаковым временем
+# (например, '2025-01-01 10:00' и '2025-01-01 10:00:00') считаются одним снимком - как фильтр == max() после to_datetime
+def _track_latest(index, dates):
+    if not dates:
+        return
+    parsed = pd.to_datetime(pd.Series(dates, dtype=object), errors='coerce')
+    if parsed.isna().all():
+        return
+    best = parsed.max()
+    latest_time = pd.Timestamp(index['latest_time']) if index['latest_time'] else None
+    if latest_time is not None and best < latest_time:
+        return
+    if latest_time is None or best > latest_time:
+        index['latest'] = []
+        index['latest_time'] = best.isoformat()
+    index['latest'] += [date for date, value in zip(dates, parsed) if value == best and date not in index['latest']]
+
+# Построчное чтение бинарного файла с учётом позиции (csv.reader сам склеивает строки с переводами внутри кавычек)
+class _LineReader:
+    def __init__(self, f):
+        self.f = f
+        self.position = f.tell()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.f.readline()
+        if not line:
+            raise StopIteration
+        self.position += len(line)
+        return line.decode('utf-8')
+
+# Досканирование файла с позиции index['file_size'] (0 - с начала): новые записи добавляются в список снимков,
+# подряд идущие строки с одинаковым as_of_date объединяются в один снимок
+def _scan(path, index):
+    snapshots = index['snapshots']
+    new_dates = []
+    with open(path, 'rb') as f:
+        header = next(csv.reader([f.readline().decode('utf-8')]), [])
+        if 'as_of_date' not in header:
+            return None
+        column = header.index('as_of_date')
+        f.seek(max(index['file_size'], f.tell()))
+        lines = _LineReader(f)
+        reader = csv.reader(lines)
+        while True:
+            record_start = lines.position
+            try:
+                record = next(reader)
+            except StopIteration:
+                break
+            record_length = lines.position - record_start
+            if not record:
+                # Пустая строка (pandas её пропускает) - относится к текущему снимку, но строкой не считается
+                if snapshots:
+                    snapshots[-1]['length'] += record_length
+                continue
+            as_of_date = record[column] if column < len(record) else ''
+            last = snapshots[-1] if snapshots else None
+            if last and last['as_of_date'] == as_of_date and last['offset'] + last['length'] == record_start:
+                last['length'] += record_length
+                last['rows'] += 1
+            else:
+                snapshots.append({'as_of_date': as_of_date, 'offset': record_start, 'length': record_length,
+                                  'row_start': index['rows'], 'rows': 1})
+                new_dates.append(as_of_date)
+            index['rows'] += 1
+        index['file_size'] = lines.position
+    _track_latest(index, new_dates)
+    return index
+
+def _file_ends_at(path, size):
+    if size == 0:
+        return True
+    with open(path, 'rb') as f:
+        f.seek(size - 1)
+        return f.read(1) == b'\n'
+
+# Индекс снимков файла, согласованный с его текущим содержимым (при необходимости досканируется или строится заново
+# и сохраняется). None - файла нет или в нём нет колонки as_of_date
+def load_index(path):
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    index = read_json(index_path(path))
+    if index and index.get('version') == index_version:
+        if index['file_size'] == stat.st_size and index['mtime_ns'] == stat.st_mtime_ns:
+            return index
+        # Файл дописан после последнего обновления индекса - сканируем только хвост
+        if index['file_size'] >= stat.st_size or not _file_ends_at(path, index['file_size']):
+            index = None
+    else:
+        index = None
+    index = _scan(path, index or _empty_index())
+    if index is None:
+        return None
+    index['mtime_ns'] = stat.st_mtime_ns
+    try:
+        atomic_write_json(index_path(path), index)
+    except OSError as e:
+        print(f"WARNING: Не удалось сохранить индекс {index_path(path)}: {e}")
+    return index
+
+# Пересобрать индекс с нуля (после полной перезаписи файла)
+def rebuild_index(path):
+    if os.path.exists(index_path(path)):
+        os.remove(index_path(path))
+    return load_index(path)
+
+def _dates(index):
+    return list(dict.fromkeys(snapshot['as_of_date'] for snapshot in index['snapshots']))
+
+# Список as_of_date снимков в порядке записи
+def snapshot_dates(path):
+    index = load_index(path)
+    return _dates(index) if index is not None else []
+
+# Самый поздний as_of_date (по дате, а не по порядку в файле); None - снимков нет
+def latest_as_of_date(path):
+    index = load_index(path)
+    return index['latest'][-1] if index is not None and index['latest'] else None
+
+# Строки одного снимка (as_of_date=None - последнего). Читаются только заголовок и байты снимка;
+# индекс строк совпадает с номерами строк в полном файле, как после фильтрации pd.read_csv всего файла.
+# Если индекса построить нельзя (нет колонки as_of_date), файл читается целиком
+def read_snapshot(path, as_of_date=None):
+    index = load_index(path)
+    if index is None:
+        return pd.read_csv(path, encoding='utf-8')
+    dates = index['latest'] if as_of_date is None else [as_of_date]
+    snapshots = [snapshot for snapshot in index['snapshots'] if snapshot['as_of_date'] in dates]
+    with open(path, 'rb') as f:
+        data = [f.readline()]
+        for snapshot in snapshots:
+            f.seek(snapshot['offset'])
+            data.append(f.read(snapshot['length']))
+    df = pd.read_csv(io.BytesIO(b''.join(data)), encoding='utf-8')
+    row_numbers = [row for snapshot in snapshots for row in range(snapshot['row_start'], snapshot['row_start'] + snapshot['rows'])]
+    if len(row_numbers) == len(df):
+        df.index = pd.Index(row_numbers)
+    return df
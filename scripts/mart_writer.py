@@ -0,0 +1,89 @@
+import io
+import os
+import pandas as pd
+
+import mart_index
+from storage_utils import atomic_write_bytes
+
+# Накопление витрин data/aggregated без перезаписи истории: новый снимок (as_of_date) дописывается
+# в конец CSV, а не через чтение всего файла + concat + запись заново.
+# - Дописывание идёт одним write с fsync; если запись упала, файл обрезается до исходного размера.
+# - Недописанная строка в конце (после падения процесса посреди записи) отрезается перед следующей записью.
+# - Если заголовок файла не совпадает с колонками снимка (поменялся состав витрины), файл один раз
+#   перезаписывается целиком (как раньше, с объединением колонок) - атомарно через временный файл.
+# - После каждой записи обновляется индекс снимков <файл>.index.json (см. mart_index.py).
+
+def _to_csv_bytes(df, header):
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=header)
+    return buffer.getvalue().encode('utf-8')
+
+def _read_header(path):
+    with open(path, 'rb') as f:
+        return f.readline().rstrip(b'\r\n')
+
+# Отрезает недописанную последнюю строку (файл должен заканчиваться переводом строки).
+# Возвращает количество отрезанных байт
+def repair_tail(path):
+    size = os.path.getsize(path)
+    if size == 0:
+        return 0
+    with open(path, 'rb+') as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) == b'\n':
+            return 0
+        # Ищем последний перевод строки с конца файла блоками
+        position = size
+        while position > 0:
+            block_start = max(0, position - 65536)
+            f.seek(block_start)
+            block = f.read(position - block_start)
+            newline = block.rfind(b'\n')
+            if newline != -1:
+                new_size = block_start + newline + 1
+                break
+            position = block_start
+        else:
+            new_size = 0
+        f.truncate(new_size)
+        f.flush()
+        os.fsync(f.fileno())
+    print(f"WARNING: В {path} отрезана недописанная строка ({size - new_size} байт)")
+    return size - new_size
+
+def _append_bytes(path, data):
+    with open(path, 'ab') as f:
+        start = f.tell()
+        try:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            f.truncate(start)
+            raise
+
+# Дописать снимок витрины в CSV
+def append_snapshot(path, df):
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        atomic_write_bytes(path, _to_csv_bytes(df, header=True))
+        mart_index.rebuild_index(path)
+        return
+
+    repair_tail(path)
+    header = _to_csv_bytes(df.iloc[:0], header=True).rstrip(b'\r\n')
+    if _read_header(path) == header:
+        # Индекс досканирует только дописанный хвост (укороченный repair_tail файл - пересобирается)
+        _append_bytes(path, _to_csv_bytes(df, header=False))
+        mart_index.load_index(path)
+        return
+
+    # Состав колонок изменился - перезаписываем файл целиком
+    print(f"WARNING: Колонки {os.path.basename(path)} изменились, витрина перезаписывается целиком")
+    df_existing = pd.read_csv(path, encoding='utf-8')
+    atomic_write_bytes(path, _to_csv_bytes(pd.concat([df_existing, df], ignore_index=True), header=True))
+    mart_index.rebuild_index(path)
+
+# Заменить содержимое файла одним снимком (для файлов без накопления истории, например Forecast.csv)
+def write_snapshot(path, df):
+    atomic_write_bytes(path, _to_csv_bytes(df, header=True))
+    mart_index.rebuild_index(path)
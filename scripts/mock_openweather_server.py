@@ -0,0 +1,90 @@
+import json
+import time
+import random
+import argparse
+import threading
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# Локальный mock OpenWeather API (/data/2.5/weather) для офлайн-бенчмарков сборщика.
+# Отвечает синтетическими данными той же структуры, что и настоящий API, с настраиваемой задержкой и долей ошибок.
+
+def make_weather_payload(city):
+    rnd = random.Random(city)  # Детерминированные значения для каждого города
+    temp = round(rnd.uniform(-25, 30), 2)
+    return {
+        "coord": {"lon": round(rnd.uniform(20, 180), 4), "lat": round(rnd.uniform(40, 70), 4)},
+        "weather": [{"id": 804, "main": "Clouds", "description": "пасмурно", "icon": "04n"}],
+        "base": "stations",
+        "main": {
+            "temp": temp,
+            "feels_like": round(temp - rnd.uniform(0, 5), 2),
+            "temp_min": round(temp - 1, 2),
+            "temp_max": round(temp + 1, 2),
+            "pressure": rnd.randint(990, 1040),
+            "humidity": rnd.randint(30, 100)
+        },
+        "visibility": 10000,
+        "wind": {"speed": round(rnd.uniform(0, 12), 2), "deg": rnd.randint(0, 359)},
+        "clouds": {"all": rnd.randint(0, 100)},
+        "dt": int(time.time()),
+        "timezone": 10800,
+        "id": rnd.randint(100000, 999999),
+        "name": city,
+        "cod": 200
+    }
+
+def make_handler(latency, error_rate):
+    class MockWeatherHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, чтобы пул соединений клиента реально переиспользовался
+
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            if parsed.path != '/data/2.5/weather':
+                self.send_json(404, {"cod": "404", "message": "not found"})
+                return
+            city = parse_qs(parsed.query).get('q', [''])[0]
+            if latency:
+                time.sleep(latency)
+            if error_rate and random.random() < error_rate:
+                self.send_json(503, {"cod": "503", "message": "service unavailable"})
+                return
+            self.send_json(200, make_weather_payload(city))
+
+        def send_json(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Не засоряем вывод бенчмарка
+
+    return MockWeatherHandler
+
+# Запуск сервера в фоновом потоке; возвращает (server, base_url)
+def start_mock_server(host='127.0.0.1', port=0, latency=0.05, error_rate=0.0):
+    server = ThreadingHTTPServer((host, port), make_handler(latency, error_rate))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://{host}:{server.server_address[1]}/data/2.5/weather"
+    return server, base_url
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Локальный mock OpenWeather API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=50, help="Искусственная задержка ответа")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Доля ответов 503 (для проверки повторов)")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args.latency_ms / 1000, args.error_rate))
+    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Mock OpenWeather API: http://{args.host}:{args.port}/data/2.5/weather")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,148 @@
+import os
+import json
+import hashlib
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+import batch_trainer
+from storage_utils import atomic_write_json, read_json
+
+# Реестр моделей городов (data/models/registry).
+# Для каждого города считается отпечаток входа обучения: sha256 от его дневных признаков (date, temp_day,
+# temp_night в порядке дат) и конфигурации модели. Переобучаются только города с изменившимся отпечатком,
+# параметры остальных переносятся из текущей версии. Каждое обучение с изменениями сохраняет новую версию -
+# файл city_models_vNNNNNN.npz со всеми городами - и метаданные в registry.json (когда и на скольких днях
+# обучен каждый город, какие города переобучены в версии). Хранятся последние keep_versions версий.
+# Для прогноза версия загружается один раз на процесс (кеш по пути и mtime файла).
+
+registry_dir = os.path.join(os.path.dirname(__file__), '..', 'data', 'models', 'registry')
+registry_version = 1
+default_keep_versions = int(os.getenv('MODEL_REGISTRY_KEEP', '5'))
+feature_columns = ['date'] + batch_trainer.targets
+
+# Конфигурация модели входит в отпечаток: её изменение переобучает все города
+def model_config():
+    return {
+        'model_type': batch_trainer.model_type,
+        'features': ['day_of_year'],
+        'targets': batch_trainer.targets,
+        'test_size': batch_trainer.test_size,
+        'random_state': batch_trainer.random_state
+    }
+
+def _registry_path(directory):
+    return os.path.join(directory, 'registry.json')
+
+def load_registry(directory=None):
+    registry = read_json(_registry_path(directory or registry_dir))
+    if not registry or registry.get('version') != registry_version:
+        return {'version': registry_version, 'current': None, 'versions': [], 'cities': {}}
+    return registry
+
+# Отпечатки входа обучения по городам: {город: sha256}
+def city_fingerprints(df):
+    if df.empty:
+        return {}
+    df = df.dropna(subset=['city']).sort_values(['city', 'date'], kind='stable')
+    row_hashes = pd.util.hash_pandas_object(df[feature_columns], index=False).to_numpy()
+    config = json.dumps(model_config(), sort_keys=True).encode('utf-8')
+    codes, cities = pd.factorize(df['city'], sort=False)
+    bounds = np.flatnonzero(np.diff(codes)) + 1
+    fingerprints = {}
+    for city, block in zip(cities, np.split(row_hashes, bounds)):
+        fingerprints[city] = hashlib.sha256(config + block.tobytes()).hexdigest()
+    return fingerprints
+
+_cache = {}
+
+# Загрузка версии моделей с кешированием на процесс
+def load_models(path):
+    path = os.path.abspath(path)
+    mtime_ns = os.stat(path).st_mtime_ns
+    entry = _cache.get(path)
+    if entry is None or entry['mtime_ns'] != mtime_ns:
+        models = batch_trainer.load_models(path)
+        entry = {'mtime_ns': mtime_ns, 'models': models, 'positions': {city: i for i, city in enumerate(models['cities'])}}
+        _cache[path] = entry
+    return entry
+
+# Текущая версия моделей (пустой набор, если реестр пуст или файл версии потерян)
+def current_models(directory=None, registry=None):
+    directory = directory or registry_dir
+    registry = registry or load_registry(directory)
+    if not registry['current']:
+        return batch_trainer.empty_models()
+    path = os.path.join(directory, registry['current'])
+    if not os.path.exists(path):
+        print(f"WARNING: Файл моделей {path} не найден")
+        return batch_trainer.empty_models()
+    return load_models(path)['models']
+
+# Прогноз одного города по текущей версии: {target: значение} или None, если модели города нет
+def predict_city(city, forecast_date, directory=None):
+    directory = directory or registry_dir
+    registry = load_registry(directory)
+    if not registry['current']:
+        return None
+    entry = load_models(os.path.join(directory, registry['current']))
+    position = entry['positions'].get(city)
+    if position is None:
+        return None
+    day_of_year = pd.to_datetime(forecast_date).dayofyear
+    models = entry['models']
+    return {target: float(models[f'coef_{target}'][position] * day_of_year + models[f'intercept_{target}'][position])
+            for target in batch_trainer.targets}
+
+# Модели для всех городов df с переобучением только изменившихся. Возвращает (модели, переобученные города)
+def train_models(df, directory=None, keep_versions=default_keep_versions):
+    directory = directory or registry_dir
+    registry = load_registry(directory)
+    fingerprints = city_fingerprints(df)
+    previous = current_models(directory, registry)
+    previous_positions = {city: i for i, city in enumerate(previous['cities'])}
+
+    changed = [city for city, fingerprint in fingerprints.items()
+               if city not in previous_positions or registry['cities'].get(city, {}).get('fingerprint') != fingerprint]
+    trained = batch_trainer.fit_city_models(df[df['city'].isin(changed)]) if changed else batch_trainer.empty_models()
+    trained_positions = {city: i for i, city in enumerate(trained['cities'])}
+
+    # Сборка полного набора: переобученные города из trained, остальные - из текущей версии (порядок - как в df)
+    cities = [city for city in df['city'].dropna().unique() if city in trained_positions or
+              (city in previous_positions and city not in changed)]
+    models = {'cities': np.array(cities, dtype=str)}
+    for key in ['n_samples'] + [f'{kind}_{target}' for kind in ['coef', 'intercept'] for target in batch_trainer.targets]:
+        models[key] = np.array([trained[key][trained_positions[city]] if city in trained_positions
+                                else previous[key][previous_positions[city]] for city in cities],
+                               dtype=previous[key].dtype if len(previous[key]) else trained[key].dtype)
+
+    retrained = [str(city) for city in trained['cities']]
+    removed = set(registry['cities']) - set(cities)
+    if not retrained and not removed and registry['current']:
+        print(f"Модели не изменились, переобучение не требуется (версия {registry['current']})")
+        return models, retrained
+
+    version = (registry['versions'][-1]['version'] + 1) if registry['versions'] else 1
+    artifact = f"city_models_v{version:06d}.npz"
+    batch_trainer.save_models(os.path.join(directory, artifact), models)
+
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    for city in removed:
+        del registry['cities'][city]
+    for city in retrained:
+        registry['cities'][city] = {'fingerprint': fingerprints[city], 'version': version, 'trained_at': now,
+                                    'n_samples': int(trained['n_samples'][trained_positions[city]])}
+    registry['versions'].append({'version': version, 'artifact': artifact, 'created_at': now, 'cities': len(cities),
+                                 'retrained': len(retrained), 'config': model_config()})
+    registry['current'] = artifact
+
+    # Старые версии удаляются после того, как реестр указывает на новую
+    obsolete = registry['versions'][:-keep_versions] if keep_versions > 0 else []
+    registry['versions'] = registry['versions'][len(obsolete):]
+    atomic_write_json(_registry_path(directory), registry)
+    for entry in obsolete:
+        path = os.path.join(directory, entry['artifact'])
+        if os.path.exists(path):
+            os.remove(path)
+    print(f"Версия моделей {version}: переобучено {len(retrained)} из {len(cities)} городов")
+    return models, retrained
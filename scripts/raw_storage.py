@@ -0,0 +1,191 @@
+import os
+import re
+import io
+import json
+import gzip
+import threading
+from datetime import datetime
+
+from storage_utils import atomic_write_json, read_json
+
+try:
+    import orjson  # Быстрый разбор строк сегментов, если установлен
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+try:
+    import zstandard
+except ImportError:  # zstd необязателен: нужен только при RAW_SEGMENT_COMPRESSION=zstd
+    zstandard = None
+
+# Сегментное хранилище raw слоя: вместо отдельного JSON на каждый город и запуск
+# записи дописываются компактными строками в дневные JSONL-сегменты
+# raw/openweather_api/YYYY/MM/DD/segment_YYYYMMDD_NNNN.jsonl[.gz|.zst].
+# Сегмент ротируется по размеру, рядом лежит небольшой индекс <сегмент>.idx (JSON)
+# с количеством записей, диапазоном timestamp и списком городов.
+
+compression_extensions = {'none': '.jsonl', 'gzip': '.jsonl.gz', 'zstd': '.jsonl.zst'}
+default_max_segment_bytes = int(os.getenv('RAW_SEGMENT_MAX_BYTES', str(64 * 1024 * 1024)))
+default_compression = os.getenv('RAW_SEGMENT_COMPRESSION', 'none')
+
+segment_pattern = re.compile(r'^segment_(\d{8})_(\d{4})\.jsonl(\.gz|\.zst)?$')
+index_suffix = '.idx'
+
+def is_segment_file(filename):
+    return segment_pattern.match(filename) is not None
+
+def segment_index_path(segment_path):
+    return segment_path + index_suffix
+
+def compression_of(segment_path):
+    if segment_path.endswith('.gz'):
+        return 'gzip'
+    if segment_path.endswith('.zst'):
+        return 'zstd'
+    return 'none'
+
+def _require_zstandard():
+    if zstandard is None:
+        raise ImportError("Для сжатия zstd установите пакет zstandard (pip install zstandard)")
+
+# Кодирование пачки записей в байты для дописывания в конец сегмента.
+# gzip и zstd допускают конкатенацию: каждая пачка становится отдельным member/frame.
+def _encode_batch(lines, compression):
+    payload = ''.join(lines).encode('utf-8')
+    if compression == 'gzip':
+        return gzip.compress(payload)
+    if compression == 'zstd':
+        _require_zstandard()
+        return zstandard.ZstdCompressor().compress(payload)
+    return payload
+
+def _open_segment_text(segment_path):
+    compression = compression_of(segment_path)
+    if compression == 'gzip':
+        return gzip.open(segment_path, 'rt', encoding='utf-8')
+    if compression == 'zstd':
+        _require_zstandard()
+        raw = open(segment_path, 'rb')
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+        return io.TextIOWrapper(reader, encoding='utf-8')
+    return open(segment_path, 'r', encoding='utf-8')
+
+# Потоковое чтение сегмента начиная со строки skip_lines + 1: выдаёт (номер строки, запись, ошибка).
+# Битая строка (например, недописанная после падения) выдаётся с record=None и текстом ошибки
+def iter_segment(segment_path, skip_lines=0):
+    with _open_segment_text(segment_path) as f:
+        for line_no, line in enumerate(f, start=1):
+            if line_no <= skip_lines:
+                continue
+            line = line.strip()
+            if not line:
+                yield line_no, None, None
+                continue
+            try:
+                yield line_no, _json_loads(line), None
+            except ValueError as e:
+                yield line_no, None, f"Сегмент {os.path.basename(segment_path)}, строка {line_no}: {e}"
+
+# Чтение записей сегмента начиная со строки skip_lines + 1; битые строки возвращаются как ошибки.
+# Третий элемент результата - сколько строк сегмента прочитано всего
+def read_segment(segment_path, skip_lines=0):
+    records = []
+    errors = []
+    last_line = skip_lines
+    for line_no, record, error in iter_segment(segment_path, skip_lines):
+        last_line = line_no
+        if error:
+            errors.append(error)
+        elif record is not None:
+            records.append(record)
+    return records, errors, last_line
+
+def read_segment_index(segment_path):
+    return read_json(segment_index_path(segment_path))
+
+# Проверка по индексу, могут ли в сегменте быть записи за указанные даты (без чтения самого сегмента)
+def segment_may_contain(index, dates):
+    if not index or not index.get('min_timestamp') or not index.get('max_timestamp'):
+        return True  # Индекса нет - придётся читать сегмент
+    try:
+        min_date = datetime.fromisoformat(index['min_timestamp']).date()
+        max_date = datetime.fromisoformat(index['max_timestamp']).date()
+    except ValueError:
+        return True
+    return any(min_date <= d <= max_date for d in dates)
+
+class SegmentStore:
+    def __init__(self, base_dir, max_segment_bytes=None, compression=None):
+        self.base_dir = base_dir
+        self.max_segment_bytes = max_segment_bytes or default_max_segment_bytes
+        self.compression = compression or default_compression
+        if self.compression not in compression_extensions:
+            raise ValueError(f"Неизвестный тип сжатия: {self.compression}. Допустимо: {', '.join(compression_extensions)}")
+        if self.compression == 'zstd':
+            _require_zstandard()
+        self.lock = threading.Lock()
+
+    def partition_dir(self, dt):
+        return os.path.join(self.base_dir, dt.strftime("%Y"), dt.strftime("%m"), dt.strftime("%d"))
+
+    # Текущий (последний) сегмент дня с тем же сжатием или новый, если последний превысил лимит размера
+    def _current_segment(self, dt):
+        dir_path = self.partition_dir(dt)
+        os.makedirs(dir_path, exist_ok=True)
+        date_str = dt.strftime("%Y%m%d")
+        extension = compression_extensions[self.compression]
+        last_number = 0
+        last_path = None
+        for file in os.listdir(dir_path):
+            match = segment_pattern.match(file)
+            if match and match.group(1) == date_str:
+                number = int(match.group(2))
+                if number > last_number:
+                    last_number = number
+                    last_path = os.path.join(dir_path, file)
+        if (last_path is not None and compression_of(last_path) == self.compression
+                and os.path.getsize(last_path) < self.max_segment_bytes):
+            return last_path
+        return os.path.join(dir_path, f"segment_{date_str}_{last_number + 1:04d}{extension}")
+
+    # Дописывание записей; записи группируются по дате из поля timestamp. Возвращает список затронутых сегментов
+    def append(self, records):
+        by_date = {}
+        for record in records:
+            dt = datetime.fromisoformat(record['timestamp'])
+            by_date.setdefault(dt.date(), (dt, []))[1].append(record)
+
+        written = []
+        with self.lock:
+            for _, (dt, day_records) in sorted(by_date.items()):
+                segment_path = self._current_segment(dt)
+                lines = [json.dumps(r, ensure_ascii=False, separators=(',', ':')) + '\n' for r in day_records]
+                with open(segment_path, 'ab') as f:
+                    f.write(_encode_batch(lines, self.compression))
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._update_index(segment_path, day_records)
+                written.append(segment_path)
+        return written
+
+    def _update_index(self, segment_path, new_records):
+        index = read_segment_index(segment_path) or {
+            'segment': os.path.basename(segment_path),
+            'compression': self.compression,
+            'records': 0,
+            'min_timestamp': None,
+            'max_timestamp': None,
+            'cities': []
+        }
+        timestamps = [r['timestamp'] for r in new_records]
+        if index['min_timestamp']:
+            timestamps.append(index['min_timestamp'])
+            timestamps.append(index['max_timestamp'])
+        index['records'] += len(new_records)
+        index['min_timestamp'] = min(timestamps, key=datetime.fromisoformat)
+        index['max_timestamp'] = max(timestamps, key=datetime.fromisoformat)
+        index['cities'] = sorted(set(index['cities']) | {r.get('city') for r in new_records if r.get('city')})
+        index['bytes'] = os.path.getsize(segment_path)
+        index['updated_at'] = datetime.now().isoformat()
+        atomic_write_json(segment_index_path(segment_path), index)
@@ -0,0 +1,228 @@
+import os
+import math
+import numpy as np
+import pandas as pd
+
+import columnar_storage
+from storage_utils import atomic_write_json, read_json, check_fingerprint
+
+# Состояние инкрементальной агрегации для create_reports.py (data/aggregated/report_state.json).
+# - totals - текущие агрегаты по городам за всю историю: суммы (с компенсацией ошибки округления) и количества
+#   числовых колонок, частоты recommended_activity и tourist_season_match, первые непустые значения
+#   tourism_season и federal_district с датой партиции, из которой они взяты, число партиций с городом.
+# - partitions - для каждой enriched партиции (даты) её отпечаток (размер, mtime, sha256) и число строк;
+#   частичные агрегаты по городам (cities) хранятся только для последних partial_days партиций
+#   (REPORT_STATE_PARTIAL_DAYS) - только их можно вычесть из totals при изменении.
+# При запуске заново читаются только новые и изменившиеся партиции: старые частичные агрегаты вычитаются
+# из totals, новые прибавляются; исчезнувшие партиции вычитаются. Если изменилась или исчезла партиция
+# без частичных агрегатов, состояние пересчитывается с нуля. Агрегаты по городам берутся из totals, O(городов).
+
+state_version = 2
+partial_days = int(os.getenv('REPORT_STATE_PARTIAL_DAYS', '7'))
+
+mean_columns = ['comfort_index', 'temperature', 'pop', 'clouds', 'humidity']
+mode_columns = ['recommended_activity', 'tourist_season_match']
+first_columns = ['tourism_season', 'federal_district']
+state_columns = ['city_name'] + mean_columns + mode_columns + first_columns
+
+def empty_state():
+    return {'version': state_version, 'rows': 0, 'totals': {}, 'partitions': {}}
+
+def load_state(path):
+    state = read_json(path)
+    if not state or state.get('version') != state_version:
+        return empty_state()
+    for key, value in empty_state().items():
+        state.setdefault(key, value)
+    return state
+
+def save_state(path, state):
+    atomic_write_json(path, state)
+
+def _json_value(value):
+    return None if pd.isna(value) else value
+
+# Частоты значений колонки по кодам городов одним проходом: матрица [город x значение] и отсортированные значения.
+# Пропуски не учитываются (как в groupby)
+def _frequency_matrix(city_codes, n_cities, values):
+    value_codes, categories = pd.factorize(values, sort=True)
+    valid = value_codes >= 0
+    flat = city_codes[valid] * len(categories) + value_codes[valid]
+    counts = np.bincount(flat, minlength=n_cities * len(categories))
+    return counts.reshape(n_cities, len(categories)), categories
+
+# Частичные агрегаты партиции по городам: {город: {sums, counts, frequencies, first}}.
+# Один groupby по кодам городов (суммы, количества и первые значения сразу), частоты - через bincount по кодам
+def partition_stats(df):
+    stats = {}
+    city_codes, cities = pd.factorize(df['city_name'])
+    present = city_codes >= 0
+    if not present.any():
+        return stats
+    df = df[present]
+    city_codes = city_codes[present]
+    aggregated = df.groupby(city_codes).agg(
+        {**{column: ['sum', 'count'] for column in mean_columns}, **{column: ['first'] for column in first_columns}}
+    )
+    sums = {column: aggregated[column, 'sum'].to_numpy(dtype=np.float64).tolist() for column in mean_columns}
+    counts = {column: aggregated[column, 'count'].to_numpy(dtype=np.int64).tolist() for column in mean_columns}
+    firsts = {column: aggregated[column, 'first'].tolist() for column in first_columns}
+    frequencies = {column: _frequency_matrix(city_codes, len(cities), df[column]) for column in mode_columns}
+    for code, city in enumerate(cities):
+        stats[city] = {
+            'sums': {column: sums[column][code] for column in mean_columns},
+            'counts': {column: counts[column][code] for column in mean_columns},
+            'frequencies': {
+                column: {str(categories[i]): int(matrix[code, i]) for i in np.flatnonzero(matrix[code])}
+                for column, (matrix, categories) in frequencies.items()
+            },
+            'first': {column: _json_value(firsts[column][code]) for column in first_columns}
+        }
+    return stats
+
+# Сумма с компенсацией (Неймайер): total - [сумма, накопленная ошибка округления]
+def _add_sum(total, value):
+    value = float(value)
+    result = total[0] + value
+    if abs(total[0]) >= abs(value):
+        total[1] += (total[0] - result) + value
+    else:
+        total[1] += (value - result) + total[0]
+    total[0] = result
+
+# Прибавление (sign=1) или вычитание (sign=-1) частичных агрегатов партиции date_str из totals.
+# Возвращает города, у которых вычтенная партиция была источником первого значения
+def _apply_partition(state, date_str, entry, sign):
+    totals = state['totals']
+    state['rows'] += sign * entry['rows']
+    lost_first = set()
+    for city, stats in entry['cities'].items():
+        total = totals.setdefault(city, {
+            'partitions': 0,
+            'sums': {column: [0.0, 0.0] for column in mean_columns},
+            'counts': {column: 0 for column in mean_columns},
+            'frequencies': {column: {} for column in mode_columns},
+            'first': {column: None for column in first_columns}
+        })
+        total['partitions'] += sign
+        for column in mean_columns:
+            _add_sum(total['sums'][column], sign * stats['sums'][column])
+            total['counts'][column] += sign * stats['counts'][column]
+        for column in mode_columns:
+            frequencies = total['frequencies'][column]
+            for value, count in stats['frequencies'][column].items():
+                frequencies[value] = frequencies.get(value, 0) + sign * count
+                if frequencies[value] == 0:
+                    del frequencies[value]
+        for column in first_columns:
+            current = total['first'][column]
+            if sign > 0 and stats['first'][column] is not None and (current is None or date_str < current[0]):
+                total['first'][column] = [date_str, stats['first'][column]]
+            elif sign < 0 and current is not None and current[0] == date_str:
+                total['first'][column] = None
+                lost_first.add(city)
+        if total['partitions'] == 0:
+            del totals[city]
+            lost_first.discard(city)
+    return lost_first
+
+# Первые значения городов, чей источник был вычтен, - из следующих партиций с частичными агрегатами
+# (все более ранние партиции значения для города не содержали)
+def _restore_first(state, cities):
+    for city in cities:
+        total = state['totals'].get(city)
+        if total is None:
+            continue
+        for column in first_columns:
+            if total['first'][column] is not None:
+                continue
+            for date_str in sorted(state['partitions']):
+                value = state['partitions'][date_str].get('cities', {}).get(city, {}).get('first', {}).get(column)
+                if value is not None:
+                    total['first'][column] = [date_str, value]
+                    break
+
+# Добавление партиции в состояние: entry - {rows, cities, ...отпечаток}
+def add_partition(state, date_str, entry):
+    state['partitions'][date_str] = entry
+    _apply_partition(state, date_str, entry, 1)
+
+# Удаление партиции из состояния. False - у партиции нет частичных агрегатов, вычесть её нельзя
+def remove_partition(state, date_str):
+    entry = state['partitions'].get(date_str)
+    if entry is None:
+        return True
+    if 'cities' not in entry:
+        return False
+    del state['partitions'][date_str]
+    _restore_first(state, _apply_partition(state, date_str, entry, -1))
+    return True
+
+# Частичные агрегаты остаются только у последних partial_days партиций
+def _prune_partials(state):
+    for date_str in sorted(state['partitions'])[:-partial_days or None]:
+        state['partitions'][date_str].pop('cities', None)
+
+# Добавление в состояние новых и изменившихся партиций, удаление исчезнувших.
+# enriched_paths - {YYYYMMDD: путь}; возвращает список заново прочитанных файлов
+def update_state(state, enriched_paths):
+    partitions = state['partitions']
+    changed = {}
+    for date_str, path in sorted(enriched_paths.items()):
+        entry = partitions.get(date_str)
+        unchanged, fingerprint = check_fingerprint(entry, path)
+        if unchanged:
+            entry.update(fingerprint)
+            continue
+        changed[date_str] = fingerprint
+
+    # Исчезнувшие и изменившиеся партиции вычитаются из totals
+    for date_str in [d for d in partitions if d not in enriched_paths] + list(changed):
+        if not remove_partition(state, date_str):
+            print(f"WARNING: Партиция {date_str} изменилась или удалена, а её частичных агрегатов нет - состояние пересчитывается с нуля")
+            state.clear()
+            state.update(empty_state())
+            return update_state(state, enriched_paths)
+
+    refreshed = []
+    for date_str, fingerprint in changed.items():
+        path = enriched_paths[date_str]
+        try:
+            df = columnar_storage.read_layer_file(path, columns=state_columns)
+        except Exception as e:
+            print(f"ERROR: Ошибка чтения {path}: {e}")
+            continue
+        add_partition(state, date_str, dict(fingerprint, rows=len(df), cities=partition_stats(df)))
+        refreshed.append(os.path.basename(path))
+    _prune_partials(state)
+    return refreshed
+
+def total_rows(state):
+    return state['rows']
+
+# Моды по списку частот {значение: количество}: argmax по матрице частот с отсортированными значениями,
+# поэтому при равенстве берётся наименьшее (как Series.mode()[0]); без значений - 'неизвестно'
+def _modes(frequencies_list):
+    matrix = pd.DataFrame(frequencies_list, columns=sorted(set().union(*frequencies_list)))
+    counts = matrix.fillna(0).to_numpy()
+    if counts.shape[1] == 0:
+        return ['неизвестно'] * len(frequencies_list)
+    best = matrix.columns.to_numpy()[counts.argmax(axis=1)]
+    return np.where(counts.max(axis=1) > 0, best, 'неизвестно').tolist()
+
+# Агрегаты по городам из totals: средние числовых колонок, моды, первые значения.
+# Строки отсортированы по city_name, как после groupby
+def city_aggregates(state):
+    cities = state['totals']
+    names = sorted(cities)
+    df = pd.DataFrame({'city_name': pd.Series(names, dtype=object)})
+    for column in mean_columns:
+        counts = np.array([cities[city]['counts'][column] for city in names], dtype=np.int64)
+        sums = np.array([math.fsum(cities[city]['sums'][column]) for city in names], dtype=np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            df[column] = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+    for column in mode_columns:
+        df[column] = pd.Series(_modes([cities[city]['frequencies'][column] for city in names]), dtype=object)
+    for column in first_columns:
+        df[column] = pd.Series([(cities[city]['first'][column] or [None, None])[1] for city in names], dtype=object)
+    return df[state_columns]
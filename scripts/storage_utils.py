@@ -0,0 +1,59 @@
+import os
+import json
+import hashlib
+import tempfile
+
+# Общие функции для безопасной записи служебных файлов (индексы, манифесты, состояния).
+# Запись идёт во временный файл в той же папке и затем атомарно заменяет целевой через os.replace,
+# поэтому упавший посреди записи запуск никогда не оставляет обрезанный файл.
+
+def atomic_write_bytes(path, data):
+    dir_path = os.path.dirname(os.path.abspath(path))
+    os.makedirs(dir_path, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=dir_path)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def atomic_write_text(path, text, encoding='utf-8'):
+    atomic_write_bytes(path, text.encode(encoding))
+
+def atomic_write_json(path, obj):
+    atomic_write_text(path, json.dumps(obj, ensure_ascii=False, indent=2, default=str))
+
+# Чтение JSON-файла с дефолтом, если файла нет или он повреждён
+def read_json(path, default=None):
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"WARNING: Не удалось прочитать {path}: {e}")
+        return default
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Не изменился ли файл по сравнению с сохранённым отпечатком entry: сначала по имени, размеру и mtime,
+# при другом mtime (например, после git checkout) - по sha256. Возвращает (не изменился, новый отпечаток)
+def check_fingerprint(entry, path):
+    stat = os.stat(path)
+    fingerprint = {'file': os.path.basename(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if not entry or entry.get('file') != fingerprint['file'] or entry.get('size') != stat.st_size:
+        return False, dict(fingerprint, sha256=file_sha256(path))
+    if entry.get('mtime_ns') == stat.st_mtime_ns:
+        return True, dict(fingerprint, sha256=entry.get('sha256'))
+    sha256 = file_sha256(path)
+    return entry.get('sha256') == sha256, dict(fingerprint, sha256=sha256)
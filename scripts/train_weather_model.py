@@ -1,16 +1,22 @@
 import pandas as pd
 import os
 from datetime import datetime
-from sklearn.linear_model import LinearRegression
-from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error
 import matplotlib.pyplot as plt
 from matplotlib.dates import DateFormatter
-import pickle
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import subprocess  # Добавлено для выполнения git команд
 
+import columnar_storage
+import batch_trainer
+import model_registry
+import feature_store
+import forecasting
+import mart_writer
+import chart_renderer
+import chart_data
+
 # Папки (без изменений)
 data_dir = os.path.join(os.path.dirname(__file__), '..', 'data')
 enriched_dir = os.path.join(data_dir, 'enriched')
@@ -20,21 +26,26 @@ visualizations_dir = os.path.join(data_dir, 'visualizations')
 os.makedirs(forecasts_dir, exist_ok=True)
 os.makedirs(visualizations_dir, exist_ok=True)
 
-# Функция для загрузки данных (без изменений)
-def load_data_from_directory(directory):
+# Функция для загрузки данных. Читаются только нужные колонки enriched файлов (CSV или parquet);
+# cities и since - необязательные фильтры по городам и времени сбора (для parquet проверяются до чтения строк)
+def load_data_from_directory(directory, cities=None, since=None):
+    filters = []
+    if cities is not None:
+        filters.append(('city_name', 'in', list(cities)))
+    if since is not None:
+        filters.append(('collection_time', '>=', pd.Timestamp(since)))
     all_data = []
-    for file in os.listdir(directory):
-        if file.startswith('weather_enriched_') and file.endswith('.csv'):
-            file_path = os.path.join(directory, file)
-            df = pd.read_csv(file_path)
-            if 'city_name' in df.columns:
-                df['city'] = df['city_name']
-            else:
-                print(f"Предупреждение: В файле {file} нет колонки 'city_name'. Пропускаем файл.")
-                continue
-            df.rename(columns={'collection_time': 'date'}, inplace=True)
-            df['date'] = pd.to_datetime(df['date'], format='%d.%m.%Y %H:%M:%S', errors='coerce')
-            all_data.append(df)
+    for file_path in columnar_storage.find_layer_files(directory, columnar_storage.enriched_prefix).values():
+        file = os.path.basename(file_path)
+        df = columnar_storage.read_layer_file(file_path, columns=['city_name', 'collection_time', 'temperature'], filters=filters)
+        if 'city_name' in df.columns:
+            df['city'] = df['city_name']
+        else:
+            print(f"Предупреждение: В файле {file} нет колонки 'city_name'. Пропускаем файл.")
+            continue
+        df.rename(columns={'collection_time': 'date'}, inplace=True)
+        df['date'] = columnar_storage.parse_collection_time(df['date'])
+        all_data.append(df)
     if all_data:
         combined_df = pd.concat(all_data, ignore_index=True)
         combined_df['hour'] = combined_df['date'].dt.hour
@@ -50,65 +61,6 @@ def load_data_from_directory(directory):
         return combined_df
     return pd.DataFrame()
 
-# Функция для обучения модели и прогноза (без изменений)
-def train_and_forecast(df, city, tomorrow_date):
-    if df.empty:
-        print(f"Нет данных для города {city}")
-        return pd.DataFrame()
-    
-    df_city = df[df['city'] == city]
-    if df_city.empty:
-        print(f"Нет данных для города {city}")
-        return pd.DataFrame()
-    
-    if 'date' not in df_city.columns or 'temp_day' not in df_city.columns or 'temp_night' not in df_city.columns:
-        print(f"Необходимые колонки отсутствуют в данных для города {city}")
-        return pd.DataFrame()
-    
-    df_city = df_city.copy()
-    df_city['date'] = pd.to_datetime(df_city['date'])
-    df_city = df_city.sort_values('date')
-    df_city['day_of_year'] = df_city['date'].dt.dayofyear
-    X = df_city[['day_of_year']]
-    
-    if len(df_city) < 2:
-        print(f"Недостаточно данных для модели в городе {city}")
-        return pd.DataFrame()
-    
-    y_day = df_city['temp_day']
-    X_train_day, X_test_day, y_train_day, y_test_day = train_test_split(X, y_day, test_size=0.2, random_state=42)
-    model_day = LinearRegression()
-    model_day.fit(X_train_day, y_train_day)
-    
-    y_night = df_city['temp_night']
-    X_train_night, X_test_night, y_train_night, y_test_night = train_test_split(X, y_night, test_size=0.2, random_state=42)
-    model_night = LinearRegression()
-    model_night.fit(X_train_night, y_train_night)
-    
-    tomorrow_day = pd.to_datetime(tomorrow_date).dayofyear
-    predicted_day = model_day.predict(pd.DataFrame([[tomorrow_day]], columns=['day_of_year']))[0]
-    predicted_night = model_night.predict(pd.DataFrame([[tomorrow_day]], columns=['day_of_year']))[0]
-    
-    try:
-        model_path_day = os.path.join(models_dir, f'{city}_model_day.pkl')
-        model_path_night = os.path.join(models_dir, f'{city}_model_night.pkl')
-        with open(model_path_day, 'wb') as f:
-            pickle.dump(model_day, f)
-        with open(model_path_night, 'wb') as f:
-            pickle.dump(model_night, f)
-        print(f"Модели для {city} сохранены в {models_dir}")
-    except Exception as e:
-        print(f"Ошибка сохранения моделей для {city}: {e}")
-    
-    forecast_df = pd.DataFrame({
-        'city': [city],
-        'forecast_date': [tomorrow_date],
-        'predicted_temp_day': [round(predicted_day)],
-        'predicted_temp_night': [round(predicted_night)],
-        'model_type': ['LinearRegression']
-    })
-    return forecast_df
-
 # Функция для создания динамических визуализаций (изменено: формат дат DD.MM.YY на оси X для всех графиков)
 def create_dynamic_visualizations(df, forecast_df):
     if df.empty:
@@ -139,65 +91,69 @@ def create_dynamic_visualizations(df, forecast_df):
     
     df_combined = df_combined.sort_values('date')
     
-    # Явное преобразование дат в строки с форматом '%d.%m.%y' для точного отображения
-    df_combined['date_str'] = df_combined['date'].dt.strftime('%d.%m.%y')
+    # Ряды городов делятся на историю и прогноз один раз; каждый ряд прореживается до CHART_POINT_BUDGET точек (LTTB),
+    # подписи дат в формате '%d.%m.%y' считаются только для оставшихся точек (см. chart_data.py)
+    series = chart_data.city_series(df_combined, pd.to_datetime(datetime.now().date()))
     
     # Список цветов для консистентности (Plotly qualitative palette)
     import plotly.colors
     colors = plotly.colors.qualitative.Plotly  # ['#636EFA', '#EF553B', '#00CC96', '#AB63FA', '#FFA15A', '#19D3F3', '#FF6692', '#B6E880', '#FF97FF', '#FECB52']
     
+    charts = {}
     fig1 = go.Figure()
-    for i, city in enumerate(df_combined['city'].unique()):
+    for i, (city, historical, forecast) in enumerate(series):
         color = colors[i % len(colors)]
-        city_data = df_combined[(df_combined['city'] == city) & (df_combined['date'] < pd.to_datetime(datetime.now().date()))]
-        fig1.add_trace(go.Scatter(x=city_data['date_str'], y=city_data['temp_day'], mode='lines+markers', name=f"{city} - Historical Day", line=dict(color=color)))
+        x, y = chart_data.series_points(historical, 'temp_day')
+        fig1.add_trace(go.Scatter(x=x, y=y, mode='lines+markers', name=f"{city} - Historical Day", line=dict(color=color)))
     fig1.update_layout(
         title="Historical Day Temperature Over Time by City",
         xaxis_title="Date",
         yaxis_title="Day Temperature (°C)"
     )
-    fig1.write_image(os.path.join(visualizations_dir, 'historical_day_temperature.png'))
+    charts['historical_day_temperature.png'] = fig1
     
     fig2 = go.Figure()
-    for i, city in enumerate(df_combined['city'].unique()):
+    for i, (city, historical, forecast) in enumerate(series):
         color = colors[i % len(colors)]
-        city_data = df_combined[(df_combined['city'] == city) & (df_combined['date'] < pd.to_datetime(datetime.now().date()))]
-        fig2.add_trace(go.Scatter(x=city_data['date_str'], y=city_data['temp_night'], mode='lines+markers', name=f"{city} - Historical Night", line=dict(color=color)))
+        x, y = chart_data.series_points(historical, 'temp_night')
+        fig2.add_trace(go.Scatter(x=x, y=y, mode='lines+markers', name=f"{city} - Historical Night", line=dict(color=color)))
     fig2.update_layout(
         title="Historical Night Temperature Over Time by City",
         xaxis_title="Date",
         yaxis_title="Night Temperature (°C)"
     )
-    fig2.write_image(os.path.join(visualizations_dir, 'historical_night_temperature.png'))
+    charts['historical_night_temperature.png'] = fig2
     
     fig3 = go.Figure()
-    for i, city in enumerate(df_combined['city'].unique()):
+    for i, (city, historical, forecast) in enumerate(series):
         color = colors[i % len(colors)]
-        historical = df_combined[(df_combined['city'] == city) & (df_combined['date'] < pd.to_datetime(datetime.now().date()))]
-        forecast = df_combined[(df_combined['city'] == city) & (df_combined['date'] >= pd.to_datetime(datetime.now().date()))]
-        fig3.add_trace(go.Scatter(x=historical['date_str'], y=historical['temp_day'], mode='lines+markers', name=f"{city} - Historical Day", line=dict(color=color)))
-        fig3.add_trace(go.Scatter(x=forecast['date_str'], y=forecast['temp_day'], mode='markers', marker=dict(color=color, size=10), name=f"{city} - Forecast Day"))
+        x, y = chart_data.series_points(historical, 'temp_day')
+        fig3.add_trace(go.Scatter(x=x, y=y, mode='lines+markers', name=f"{city} - Historical Day", line=dict(color=color)))
+        x, y = chart_data.series_points(forecast, 'temp_day')
+        fig3.add_trace(go.Scatter(x=x, y=y, mode='markers', marker=dict(color=color, size=10), name=f"{city} - Forecast Day"))
     fig3.update_layout(
         title="Forecasted Day Temperature Over Time by City (with as_of_date)",
         xaxis_title="Date",
         yaxis_title="Day Temperature (°C)"
     )
-    fig3.write_image(os.path.join(visualizations_dir, 'forecasted_day_temperature.png'))
+    charts['forecasted_day_temperature.png'] = fig3
     
     fig4 = go.Figure()
-    for i, city in enumerate(df_combined['city'].unique()):
+    for i, (city, historical, forecast) in enumerate(series):
         color = colors[i % len(colors)]
-        historical = df_combined[(df_combined['city'] == city) & (df_combined['date'] < pd.to_datetime(datetime.now().date()))]
-        forecast = df_combined[(df_combined['city'] == city) & (df_combined['date'] >= pd.to_datetime(datetime.now().date()))]
-        fig4.add_trace(go.Scatter(x=historical['date_str'], y=historical['temp_night'], mode='lines+markers', name=f"{city} - Historical Night", line=dict(color=color)))
-        fig4.add_trace(go.Scatter(x=forecast['date_str'], y=forecast['temp_night'], mode='markers', marker=dict(color=color, size=10), name=f"{city} - Forecast Night"))
+        x, y = chart_data.series_points(historical, 'temp_night')
+        fig4.add_trace(go.Scatter(x=x, y=y, mode='lines+markers', name=f"{city} - Historical Night", line=dict(color=color)))
+        x, y = chart_data.series_points(forecast, 'temp_night')
+        fig4.add_trace(go.Scatter(x=x, y=y, mode='markers', marker=dict(color=color, size=10), name=f"{city} - Forecast Night"))
     fig4.update_layout(
         title="Forecasted Night Temperature Over Time by City (with as_of_date)",
         xaxis_title="Date",
         yaxis_title="Night Temperature (°C)"
     )
-    fig4.write_image(os.path.join(visualizations_dir, 'forecasted_night_temperature.png'))
+    charts['forecasted_night_temperature.png'] = fig4
     
+    # PNG перерисовываются только для графиков с изменившимися данными, все - одной сессией kaleido
+    chart_renderer.render_charts(charts, visualizations_dir)
     print("Динамические визуализации сохранены в data/visualizations/ как PNG-файлы (статические изображения)")
 
 # Новая функция для коммита и пуша изменений с исправлениями
@@ -238,7 +194,10 @@ def main():
     print(f"Enriched dir: {enriched_dir}")
     print(f"Files in enriched dir: {os.listdir(enriched_dir) if os.path.exists(enriched_dir) else 'Enriched dir not found'}")
     
-    df = load_data_from_directory(enriched_dir)
+    # Дневные признаки берутся из хранилища признаков, которое дочитывает только новые enriched партиции
+    refreshed = feature_store.update_feature_store(enriched_dir)
+    print(f"Хранилище признаков обновлено, заново прочитано файлов: {len(refreshed)}")
+    df = feature_store.load_features()
     if df.empty:
         print("Нет данных для обработки.")
         return
@@ -248,28 +207,35 @@ def main():
     tomorrow = (datetime.now() + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
     as_of_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     
-    all_forecasts = []
     cities = df['city'].unique()
     print(f"Cities to process: {cities}")
-    for city in cities:
-        forecast_df = train_and_forecast(df, city, tomorrow)
-        if not forecast_df.empty:
-            forecast_df['as_of_date'] = as_of_date
-            all_forecasts.append(forecast_df)
+    # Модели обучаются одним векторным проходом (те же коэффициенты, что у прежних LinearRegression по городам,
+    # см. benchmark_training.py), причём только для городов, у которых изменились входные данные;
+    # версии моделей хранит реестр (см. model_registry.py)
+    models, retrained = model_registry.train_models(df)
+    for city in sorted(set(cities) - set(models['cities'])):
+        print(f"Недостаточно данных для модели в городе {city}")
     
     combined_forecast = pd.DataFrame()
-    if all_forecasts:
-        combined_forecast = pd.concat(all_forecasts, ignore_index=True)
+    if len(models['cities']):
+        combined_forecast = batch_trainer.forecast_frame(models, tomorrow)
+        combined_forecast['as_of_date'] = as_of_date
         forecast_file = os.path.join(forecasts_dir, 'Forecast.csv')
         try:
-            file_exists = os.path.exists(forecast_file)
-            combined_forecast.to_csv(forecast_file, mode='w', header=True, index=False)
+            # Файл заменяется атомарно вместе с индексом снимков (читатели берут последний снимок по индексу)
+            mart_writer.write_snapshot(forecast_file, combined_forecast)
             print(f"Прогнозы сохранены в {forecast_file} с as_of_date {as_of_date}")
         except Exception as e:
             print(f"Ошибка сохранения прогнозов: {e}")
     else:
         print("Нет прогнозов для сохранения.")
     
+    # Прогнозы на несколько дней всеми моделями движка (FORECAST_MODELS, FORECAST_HORIZON) - в историю прогнозов
+    try:
+        forecasting.append_forecast_history(forecasting.run_forecasts(df), as_of_date)
+    except Exception as e:
+        print(f"Ошибка построения прогнозов на несколько дней: {e}")
+    
     create_dynamic_visualizations(df, combined_forecast)
     
     # Коммит и пуш изменений
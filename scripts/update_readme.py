@@ -5,12 +5,15 @@ import glob  # Добавлено для динамического сканир
 from datetime import datetime
 import subprocess  # Добавлено для git операций
 
+import mart_index
+
 # Папки (добавил проверки существования папок)
 aggregated_dir = os.path.join(os.path.dirname(__file__), '..', 'data', 'aggregated')
 forecasts_dir = os.path.join(os.path.dirname(__file__), '..', 'data', 'models', 'forecast')
 visualizations_dir = os.path.join(os.path.dirname(__file__), '..', 'data', 'visualizations')
 readme_path = os.path.join(os.path.dirname(__file__), '..', 'README.md')
 
+# Загрузка последних снимков витрин. Снимок читается по индексу (mart_index.py) - без разбора всей истории
 def load_aggregated_data():
     data = {}
     if not os.path.exists(aggregated_dir):
@@ -20,11 +23,9 @@ def load_aggregated_data():
         file_path = os.path.join(aggregated_dir, file)
         try:
             if os.path.exists(file_path):
-                df = pd.read_csv(file_path)
+                df = mart_index.read_snapshot(file_path)
                 if 'as_of_date' in df.columns:
                     df['as_of_date'] = pd.to_datetime(df['as_of_date'], errors='coerce')
-                    max_date = df['as_of_date'].max()
-                    df = df[df['as_of_date'] == max_date]
                 data[file.split('.')[0]] = df
             else:
                 print(f"Файл {file} не найден.")
@@ -39,11 +40,9 @@ def load_forecast_data():
     forecast_file = os.path.join(forecasts_dir, 'Forecast.csv')
     try:
         if os.path.exists(forecast_file):
-            df = pd.read_csv(forecast_file)
+            df = mart_index.read_snapshot(forecast_file)
             if 'as_of_date' in df.columns:
                 df['as_of_date'] = pd.to_datetime(df['as_of_date'], errors='coerce')
-                max_date = df['as_of_date'].max()
-                df = df[df['as_of_date'] == max_date]
             return df
     except Exception as e:
         print(f"Ошибка загрузки Forecast.csv: {e}")